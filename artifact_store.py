@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+内容寻址的诊断产物存储
+截图和报告按 SHA-256 只保存一份，每次运行写一份清单，按时间或总大小淘汰旧运行
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_STORE_DIR = '.diagnostic_artifacts'
+
+# 诊断运行后自动执行的淘汰策略
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_SIZE_MB = 500
+
+# 对象回收的宽限期：并发运行刚写入（或刚复用）的对象在清单写出前还不被引用，期内不回收
+GC_GRACE_SECONDS = 3600
+
+def object_path(store_dir, digest, extension):
+    """objects/<前两位>/<摘要><扩展名>"""
+    return os.path.join(store_dir, 'objects', digest[:2], digest + extension)
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def store_file(path, store_dir=DEFAULT_STORE_DIR, move=False):
+    """把文件存入内容地址，已存在相同内容时不再写入；返回清单条目"""
+
+    digest = file_digest(path)
+    extension = os.path.splitext(path)[1].lower()
+    target = object_path(store_dir, digest, extension)
+    size = os.path.getsize(path)
+
+    stored = True
+    if os.path.exists(target):
+        try:
+            # 复用已有对象时刷新修改时间，使它在本次清单写出前处于回收宽限期内
+            os.utime(target)
+            stored = False
+        except FileNotFoundError:
+            pass
+    if stored:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 先写临时文件再改名，中断时不会留下不完整的对象；临时文件名带进程号，并发写入同一对象互不干扰
+        temp = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(path, temp)
+        os.replace(temp, target)
+
+    if move:
+        os.remove(path)
+
+    return {
+        'name': os.path.basename(path),
+        'sha256': digest,
+        'object': os.path.relpath(target, store_dir),
+        'size': size,
+        'deduplicated': not stored
+    }
+
+def archive_run(paths, label, store_dir=DEFAULT_STORE_DIR, move=False):
+    """存入一次运行的全部产物并写出运行清单，返回清单"""
+
+    runs_dir = os.path.join(store_dir, 'runs')
+    os.makedirs(runs_dir, exist_ok=True)
+
+    base_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{label}"
+    run_id = base_id
+    suffix = 1
+    while os.path.exists(os.path.join(runs_dir, run_id + '.json')):
+        suffix += 1
+        run_id = f"{base_id}-{suffix}"
+
+    artifacts = [store_file(path, store_dir, move) for path in paths if os.path.isfile(path)]
+
+    manifest = {
+        'run_id': run_id,
+        'label': label,
+        'timestamp': datetime.now().isoformat(),
+        'created': time.time(),
+        'artifacts': artifacts
+    }
+
+    # 清单同样先写临时文件再改名，并发的 load_manifests 不会读到写了一半的清单
+    manifest_path = os.path.join(runs_dir, run_id + '.json')
+    temp = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp, manifest_path)
+
+    return manifest
+
+def load_manifests(store_dir=DEFAULT_STORE_DIR):
+    """按创建时间从旧到新返回全部运行清单"""
+
+    runs_dir = os.path.join(store_dir, 'runs')
+    if not os.path.isdir(runs_dir):
+        return []
+
+    manifests = []
+    for name in os.listdir(runs_dir):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(runs_dir, name), encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+            except FileNotFoundError:
+                # 已被并发的淘汰删除
+                continue
+    return sorted(manifests, key=lambda m: m['created'])
+
+def referenced_size(manifests):
+    """清单引用的对象总大小（每个对象只计一次）"""
+
+    objects = {}
+    for manifest in manifests:
+        for artifact in manifest['artifacts']:
+            objects[artifact['object']] = artifact['size']
+    return sum(objects.values())
+
+def evict(store_dir=DEFAULT_STORE_DIR, max_age_days=None, max_size_mb=None, keep_runs=1,
+          grace_seconds=GC_GRACE_SECONDS):
+    """先删除超龄的运行，再从最旧的开始删除直到总大小达标（至少保留最近 keep_runs 次），
+    最后回收不再被任何清单引用、且修改时间早于 grace_seconds 的对象（临时文件不回收）"""
+
+    manifests = load_manifests(store_dir)
+    removed_runs = []
+
+    def drop(manifest):
+        try:
+            os.remove(os.path.join(store_dir, 'runs', manifest['run_id'] + '.json'))
+        except FileNotFoundError:
+            pass
+        removed_runs.append(manifest['run_id'])
+
+    if max_age_days is not None:
+        cutoff = time.time() - max_age_days * 86400
+        while len(manifests) > keep_runs and manifests[0]['created'] < cutoff:
+            drop(manifests.pop(0))
+
+    if max_size_mb is not None:
+        limit = max_size_mb * 1024 * 1024
+        while len(manifests) > keep_runs and referenced_size(manifests) > limit:
+            drop(manifests.pop(0))
+
+    live = {artifact['object'] for manifest in manifests for artifact in manifest['artifacts']}
+    freed = 0
+    cutoff = time.time() - grace_seconds
+    objects_dir = os.path.join(store_dir, 'objects')
+    for root, _, files in os.walk(objects_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith('.tmp') or os.path.relpath(path, store_dir) in live:
+                continue
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                # 并发的另一次回收已经删除
+                continue
+            freed += stat.st_size
+
+    return {
+        'removed_runs': removed_runs,
+        'remaining_runs': len(manifests),
+        'freed_bytes': freed,
+        'stored_bytes': referenced_size(manifests)
+    }
+
+def restore_run(run_id, destination, store_dir=DEFAULT_STORE_DIR):
+    """按清单把某次运行的产物以原文件名复制到 destination"""
+
+    with open(os.path.join(store_dir, 'runs', run_id + '.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    os.makedirs(destination, exist_ok=True)
+    for artifact in manifest['artifacts']:
+        shutil.copyfile(os.path.join(store_dir, artifact['object']), os.path.join(destination, artifact['name']))
+    return manifest
+
+def print_manifest_summary(manifest):
+    """打印一次运行的存储摘要"""
+
+    new_bytes = sum(a['size'] for a in manifest['artifacts'] if not a['deduplicated'])
+    duplicate_bytes = sum(a['size'] for a in manifest['artifacts'] if a['deduplicated'])
+    print(f"🗄️ 运行 {manifest['run_id']}: {len(manifest['artifacts'])} 个产物，"
+          f"新写入 {new_bytes} 字节，复用 {duplicate_bytes} 字节")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='内容寻址的诊断产物存储')
+    parser.add_argument('--store', default=DEFAULT_STORE_DIR, help='存储目录')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help='把文件存入存储并记为一次运行')
+    ingest.add_argument('files', nargs='+')
+    ingest.add_argument('--label', default='manual', help='运行标签')
+    ingest.add_argument('--move', action='store_true', help='存入后删除工作区中的原文件')
+
+    gc = subparsers.add_parser('gc', help='按时间或总大小淘汰旧运行并回收对象')
+    gc.add_argument('--max-age-days', type=float)
+    gc.add_argument('--max-size-mb', type=float)
+    gc.add_argument('--keep-runs', type=int, default=1)
+
+    subparsers.add_parser('list', help='列出全部运行')
+
+    restore = subparsers.add_parser('restore', help='取回某次运行的产物')
+    restore.add_argument('run_id')
+    restore.add_argument('destination')
+
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        print_manifest_summary(archive_run(args.files, args.label, args.store, args.move))
+    elif args.command == 'gc':
+        result = evict(args.store, args.max_age_days, args.max_size_mb, args.keep_runs)
+        print(f"🧹 删除 {len(result['removed_runs'])} 次运行，回收 {result['freed_bytes']} 字节，"
+              f"剩余 {result['remaining_runs']} 次运行共 {result['stored_bytes']} 字节")
+    elif args.command == 'list':
+        for manifest in load_manifests(args.store):
+            size = sum(a['size'] for a in manifest['artifacts'])
+            print(f"  {manifest['run_id']}: {len(manifest['artifacts'])} 个产物, {size} 字节")
+    elif args.command == 'restore':
+        manifest = restore_run(args.run_id, args.destination, args.store)
+        print(f"📦 已恢复 {len(manifest['artifacts'])} 个产物到 {args.destination}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
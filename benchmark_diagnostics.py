@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+诊断阶段基准测试
+在本地静态页面（simple_test.html 和生成的 10 / 100 / 1k / 10k 张卡片页面）上逐阶段计时，
+记录墙钟时间、页面往返次数和内存峰值，并保存结果以便前后对比
+"""
+
+import argparse
+import asyncio
+from playwright.async_api import async_playwright
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import quote
+from diagnosis_common import js_call, launch_options
+from layout_scan import scan_page_clipping
+from stage_trace import instrument_page, start_trace, stop_trace, trace_counters
+from voicepanel_diagnosis import BATCH_PROBE_JS, CARD_SELECTORS, analyze_all_cards_batch, generate_comprehensive_report
+from voicecard_avatar_diagnosis import analyze_single_avatar
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+RESULTS_DIR = 'benchmark_results'
+
+# 本地头像：SVG 自带固有尺寸，不依赖网络
+AVATAR_SVG = ('<svg xmlns="http://www.w3.org/2000/svg" width="96" height="96">'
+              '<circle cx="48" cy="48" r="48" fill="#FFC700"/></svg>')
+AVATAR_URI = 'data:image/svg+xml,' + quote(AVATAR_SVG)
+
+def generate_fixture_html(card_count):
+    """生成含 card_count 张 VoiceCard 结构卡片的页面，每 7 张有一张头像溢出、每 11 张有一张文字溢出"""
+
+    cards = []
+    for i in range(card_count):
+        avatar_size = 56 if i % 7 == 0 else 48
+        name = f"Voice {i} " + ("with a very long display name that overflows" if i % 11 == 0 else "")
+        cards.append(
+            f'<div class="voice-card" data-testid="voice-card">'
+            f'<div class="avatar-wrap"><img alt="avatar Marcus {i}" src="{AVATAR_URI}" '
+            f'style="width:{avatar_size}px;height:{avatar_size}px"></div>'
+            f'<div class="voice-info"><div class="voice-name">{name}</div>'
+            f'<div class="voice-desc">Warm narrator voice</div></div></div>'
+        )
+
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="UTF-8"><title>VoiceCard fixture {card_count}</title>
+<style>
+body {{ margin: 0; font-family: sans-serif; }}
+.voice-panel {{ display: grid; grid-template-columns: repeat(4, 280px); gap: 12px; padding: 16px; }}
+.voice-card {{ display: flex; gap: 12px; padding: 12px; height: 72px; border-radius: 12px; background: #fff; overflow: hidden; }}
+.avatar-wrap {{ width: 48px; height: 48px; border-radius: 50%; overflow: hidden; flex-shrink: 0; }}
+.voice-info {{ width: 180px; overflow: hidden; }}
+.voice-name {{ white-space: nowrap; font-weight: 600; }}
+</style></head>
+<body><div class="voice-panel" data-testid="voice-panel">{''.join(cards)}</div></body></html>
+"""
+
+def write_fixtures(sizes, directory):
+    """写出生成的页面，返回 (名称, 文件路径) 列表；simple_test.html 放在最前"""
+
+    fixtures = []
+    if os.path.exists('simple_test.html'):
+        fixtures.append(('simple_test', os.path.abspath('simple_test.html')))
+
+    for size in sizes:
+        path = os.path.join(directory, f'cards_{size}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(generate_fixture_html(size))
+        fixtures.append((f'cards_{size}', path))
+
+    return fixtures
+
+def round_trips():
+    """Page 与 ElementHandle / JSHandle 上经过桥接的调用总数，由 stage_trace 的埋点计数"""
+
+    counters = trace_counters()
+    return counters['evaluate_calls'] + counters['handle_calls']
+
+async def js_heap_bytes(page, original_evaluate):
+    """Chromium 的 performance.memory，不计入往返次数"""
+    return await original_evaluate('() => performance.memory ? performance.memory.usedJSHeapSize : null')
+
+async def run_stage(page, original_evaluate, name, stage):
+    """执行一个阶段并记录墙钟时间、往返次数、Python 内存峰值和页面 JS 堆大小"""
+
+    before = round_trips()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+
+    result = await stage()
+
+    wall_ms = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+
+    return result, {
+        'stage': name,
+        'wall_ms': wall_ms,
+        'round_trips': round_trips() - before,
+        'python_peak_bytes': peak,
+        'js_heap_bytes': await js_heap_bytes(page, original_evaluate)
+    }
+
+async def benchmark_fixture(browser, name, path, avatar_limit):
+    """在一个本地页面上依次运行各阶段"""
+
+    page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+    # 基准测试完全离线：阻止外部请求（如 simple_test.html 的 Google Fonts）
+    await page.route('http*://**', lambda route: route.abort())
+
+    try:
+        load_started = time.perf_counter()
+        await page.goto('file://' + path, wait_until='load')
+        load_ms = (time.perf_counter() - load_started) * 1000
+
+        # 复用 stage_trace 的埋点：页面方法和之后返回的每个句柄上的调用都会计数
+        original_evaluate = page.evaluate
+        start_trace()
+        instrument_page(page)
+        stages = []
+        state = {}
+
+        async def discovery():
+            return await page.evaluate(js_call(BATCH_PROBE_JS, 'collectBatchCards(arg).cards.length'), CARD_SELECTORS)
+
+        async def card_analysis():
+            state['cards'] = (await analyze_all_cards_batch(page, CARD_SELECTORS))['cards']
+            return len(state['cards'])
+
+        async def avatar_analysis():
+            avatars = (await page.query_selector_all('img'))[:avatar_limit]
+            results = [await analyze_single_avatar(page, avatar, i) for i, avatar in enumerate(avatars)]
+            return len([r for r in results if r])
+
+        async def clipping_detection():
+            return (await scan_page_clipping(page))['clipped_count']
+
+        async def report_generation():
+            state['report'] = generate_comprehensive_report(state['cards'])
+            return state['report']['status']
+
+        async def json_output():
+            with tempfile.TemporaryFile('w', encoding='utf-8') as f:
+                json.dump(state['report'], f, indent=2, ensure_ascii=False)
+                return f.tell()
+
+        for stage_name, stage in [
+            ('discovery', discovery),
+            ('card_analysis', card_analysis),
+            ('avatar_analysis', avatar_analysis),
+            ('clipping_detection', clipping_detection),
+            ('report_generation', report_generation),
+            ('json_output', json_output)
+        ]:
+            result, metrics = await run_stage(page, original_evaluate, stage_name, stage)
+            metrics['result'] = result
+            stages.append(metrics)
+
+        return {'fixture': name, 'load_ms': load_ms, 'stages': stages}
+
+    finally:
+        stop_trace()
+        await page.close()
+
+async def run_benchmarks(sizes=None, avatar_limit=100):
+    """生成页面并逐个运行基准测试"""
+
+    sizes = sizes or DEFAULT_SIZES
+    tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = write_fixtures(sizes, directory)
+
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(**launch_options(True, slow_mo=0))
+            try:
+                results = []
+                for name, path in fixtures:
+                    print(f"⏱️ {name} ...")
+                    results.append(await benchmark_fixture(browser, name, path, avatar_limit))
+            finally:
+                await browser.close()
+
+    tracemalloc.stop()
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'avatar_limit': avatar_limit,
+        'results': results
+    }
+
+def latest_previous_result(results_dir):
+    paths = sorted(glob.glob(os.path.join(results_dir, 'benchmark_*.json')))
+    if not paths:
+        return None
+    with open(paths[-1], encoding='utf-8') as f:
+        return json.load(f)
+
+def print_benchmark_table(run, previous=None):
+    """打印各页面各阶段的耗时，有上一次结果时附带变化比例"""
+
+    previous_times = {}
+    if previous:
+        for fixture in previous['results']:
+            for stage in fixture['stages']:
+                previous_times[(fixture['fixture'], stage['stage'])] = stage['wall_ms']
+
+    print("\n" + "="*80)
+    print("📋 诊断阶段基准测试")
+    print("="*80)
+    print(f"{'页面':<14} {'阶段':<20} {'耗时(ms)':>10} {'往返':>6} {'Py峰值(KB)':>11} {'JS堆(MB)':>9} {'对比':>8}")
+
+    for fixture in run['results']:
+        for stage in fixture['stages']:
+            before = previous_times.get((fixture['fixture'], stage['stage']))
+            change = f"{(stage['wall_ms'] - before) / before:+.0%}" if before else ''
+            heap = f"{stage['js_heap_bytes'] / 1048576:.1f}" if stage['js_heap_bytes'] else '-'
+            print(f"{fixture['fixture']:<14} {stage['stage']:<20} {stage['wall_ms']:>10.1f} {stage['round_trips']:>6} "
+                  f"{stage['python_peak_bytes'] / 1024:>11.0f} {heap:>9} {change:>8}")
+
+    print("="*80)
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='在本地页面上对各诊断阶段做基准测试（无头运行）')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='生成页面的卡片数量，例如 10,100,1000,10000')
+    parser.add_argument('--avatar-limit', type=int, default=100, help='逐个分析的头像数量上限')
+    parser.add_argument('--output-dir', default=RESULTS_DIR, help='结果保存目录')
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        previous = latest_previous_result(args.output_dir)
+        run = await run_benchmarks(sizes, args.avatar_limit)
+        print_benchmark_table(run, previous)
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        output = os.path.join(args.output_dir, f"benchmark_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2, ensure_ascii=False)
+        print(f"💾 基准结果已保存到: {output}")
+
+    except KeyboardInterrupt:
+        print("\n⚠️ 基准测试被用户中断")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
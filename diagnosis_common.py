@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+诊断脚本共用的页面内工具
+供 voicepanel_diagnosis、voicecard_avatar_diagnosis 和 marcus_avatar_specific_analysis 使用
+"""
+
+import argparse
+import json
+from datetime import datetime
+from fixture_server import route_fixture
+from stage_trace import instrument_page, trace_step
+
+# 元素身份去重：按节点身份判断是否重复，domPathKey 生成跨调用稳定的 DOM 路径键
+DEDUPE_JS = """
+function domPathKey(el) {
+    const parts = [];
+    let current = el;
+    while (current && current.nodeType === Node.ELEMENT_NODE) {
+        let index = 1;
+        let sibling = current.previousElementSibling;
+        while (sibling) {
+            index++;
+            sibling = sibling.previousElementSibling;
+        }
+        parts.unshift(current.tagName.toLowerCase() + ':nth-child(' + index + ')');
+        current = current.parentElement;
+    }
+    return parts.join('>');
+}
+
+function dedupeIndices(elements) {
+    const seen = new Set();
+    const keep = [];
+    elements.forEach((el, index) => {
+        if (el && !seen.has(el)) {
+            seen.add(el);
+            keep.push(index);
+        }
+    });
+    return keep;
+}
+
+function uniqueNodes(elements) {
+    return dedupeIndices(elements).map(index => elements[index]);
+}
+"""
+
+
+def js_call(function_source, call):
+    """把具名 JS 函数包装成 page.evaluate 表达式，参数在表达式中名为 arg"""
+    return '(arg) => {\n' + function_source + '\nreturn ' + call + ';\n}'
+
+
+# 选择器回退链在页面内一次解析：逐个选择器计数、记录首个命中的选择器，并按节点身份合并去重。
+# 除标准 CSS 外支持 Playwright 的 :has-text("文本")（不区分大小写的包含匹配），其后可接后代选择器
+SELECTOR_JS = """
+function sortInDocumentOrder(elements) {
+    return elements.sort((a, b) => a === b ? 0 : (a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1));
+}
+
+function queryExtended(root, selector) {
+    const match = selector.match(/^(.*?):has-text\\("([^"]*)"\\)(.*)$/);
+    if (!match) return Array.from(root.querySelectorAll(selector));
+
+    const base = match[1] || '*';
+    const needle = match[2].toLowerCase();
+    const rest = match[3];
+    const hosts = Array.from(root.querySelectorAll(base)).filter(el =>
+        (el.textContent || '').replace(/\\s+/g, ' ').toLowerCase().includes(needle));
+    if (!rest.trim()) return hosts;
+
+    // 后代组合符下，被外层宿主包含的宿主不会带来新的匹配，只查询最外层的宿主
+    const descendantOnly = /^\\s+[^\\s>+~]/.test(rest);
+    const found = new Set();
+    let outer = null;
+    for (const host of hosts) {
+        if (descendantOnly && outer && outer.contains(host)) continue;
+        outer = host;
+        for (const el of host.querySelectorAll(':scope' + rest)) found.add(el);
+    }
+    return sortInDocumentOrder(Array.from(found));
+}
+
+function resolveSelectorChain(root, selectors, mode) {
+    const counts = {};
+    const errors = {};
+    const seen = new Set();
+    const matches = [];
+    let winner = null;
+
+    for (const selector of selectors) {
+        let found;
+        try {
+            found = queryExtended(root, selector);
+        } catch (e) {
+            counts[selector] = null;
+            errors[selector] = String(e.message || e);
+            continue;
+        }
+        counts[selector] = found.length;
+        if (!found.length) continue;
+
+        if (winner === null) winner = selector;
+        for (const el of found) {
+            if (!seen.has(el)) {
+                seen.add(el);
+                matches.push(el);
+            }
+        }
+        // first 模式与逐个尝试、命中即停的写法一致，之后的选择器不再查询
+        if (mode === 'first') break;
+    }
+
+    return { counts: counts, errors: errors, winner: winner, matches: matches };
+}
+
+function packResolution(resolution, limit) {
+    // 第 0 项是可序列化的摘要，其后是匹配元素，Python 侧一次 get_properties 取回全部句柄
+    const kept = limit === null ? resolution.matches : resolution.matches.slice(0, limit);
+    return [{
+        counts: resolution.counts,
+        errors: resolution.errors,
+        winner: resolution.winner,
+        total: resolution.matches.length,
+        returned: kept.length
+    }, ...kept];
+}
+"""
+
+
+async def resolve_selectors(page, selectors, mode='all', root=None, limit=None):
+    """在一次页面调用中解析整条选择器回退链；mode='all' 合并全部选择器的匹配，mode='first' 只取首个命中的选择器。
+    返回各选择器的匹配数（无效选择器为 None）、命中的选择器和去重后的 ElementHandle（最多 limit 个）"""
+
+    packed = await page.evaluate_handle(
+        js_call(SELECTOR_JS, 'packResolution(resolveSelectorChain(arg[0] || document, arg[1], arg[2]), arg[3])'),
+        [root, selectors, mode, limit]
+    )
+    properties = await packed.get_properties()
+    summary = await properties['0'].json_value()
+
+    return {
+        'counts': summary['counts'],
+        'errors': summary['errors'],
+        'winner': summary['winner'],
+        'total': summary['total'],
+        'matches': [properties[str(i + 1)].as_element() for i in range(summary['returned'])]
+    }
+
+
+def print_selector_counts(resolution, noun):
+    """打印每个命中的选择器及其匹配数，以及无效的选择器"""
+
+    for selector, count in resolution['counts'].items():
+        if count:
+            print(f"📊 选择器 '{selector}' 找到 {count} 个{noun}")
+    for selector, error in resolution['errors'].items():
+        print(f"  ⚠️ 选择器无效 '{selector}': {error}")
+
+
+# 页面就绪检测：字体就绪、图片加载并解码、布局连续若干帧保持不变
+READINESS_JS = """
+async function waitForReady(stableFrames, timeoutMs) {
+    const start = performance.now();
+    const deadline = start + timeoutMs;
+    const untilDeadline = promise => Promise.race([
+        promise,
+        new Promise(resolve => setTimeout(resolve, Math.max(0, deadline - performance.now())))
+    ]);
+    const nextFrame = () => new Promise(resolve => requestAnimationFrame(() => resolve()));
+
+    await untilDeadline(document.fonts.ready);
+
+    // 视口外的懒加载图片不会主动加载，不等待它们
+    const images = Array.from(document.images).filter(img => {
+        if (img.complete || img.loading !== 'lazy') return true;
+        const rect = img.getBoundingClientRect();
+        return rect.bottom >= 0 && rect.top <= window.innerHeight;
+    });
+
+    await untilDeadline(Promise.all(images.map(img => {
+        const loaded = img.complete ? Promise.resolve() : new Promise(resolve => {
+            img.addEventListener('load', resolve, { once: true });
+            img.addEventListener('error', resolve, { once: true });
+        });
+        return loaded.then(() => img.naturalWidth > 0 ? img.decode().catch(() => {}) : null);
+    })));
+
+    const layoutSignature = () => {
+        const root = document.documentElement;
+        const parts = [root.scrollWidth, root.scrollHeight, document.images.length];
+        for (const img of document.images) {
+            const rect = img.getBoundingClientRect();
+            parts.push(rect.x, rect.y, rect.width, rect.height);
+        }
+        return parts.join(',');
+    };
+
+    let last = layoutSignature();
+    let stable = 0;
+    while (stable < stableFrames && performance.now() < deadline) {
+        await nextFrame();
+        const current = layoutSignature();
+        if (current === last) {
+            stable++;
+        } else {
+            stable = 0;
+            last = current;
+        }
+    }
+
+    return {
+        images: images.length,
+        incomplete_images: images.filter(img => !img.complete).length,
+        layout_stable: stable >= stableFrames,
+        elapsed_ms: performance.now() - start
+    };
+}
+"""
+
+
+# Chromium 的 Resource Timing 缓冲区默认只有 250 条，导航前调大，缓冲区仍满时留下标记供审计提示
+RESOURCE_TIMING_BUFFER = 10000
+RESOURCE_TIMING_JS = """
+performance.setResourceTimingBufferSize(%d);
+window.__resourceTimingBufferSize = %d;
+performance.addEventListener('resourcetimingbufferfull', () => { window.__resourceTimingBufferFull = true; });
+""" % (RESOURCE_TIMING_BUFFER, RESOURCE_TIMING_BUFFER)
+
+
+def launch_options(fast, slow_mo):
+    """浏览器启动参数：fast 模式无头运行且不放慢操作，否则显示浏览器以便观察"""
+
+    if fast:
+        return {'headless': True}
+    return {'headless': False, 'slow_mo': slow_mo}
+
+
+async def wait_for_page_ready(page, stable_frames=2, timeout_ms=10000):
+    """等待真实的就绪信号而不是固定时长"""
+
+    return await page.evaluate(
+        js_call(READINESS_JS, 'waitForReady(arg[0], arg[1])'),
+        [stable_frames, timeout_ms]
+    )
+
+
+async def open_page(page, url, fast, settle_ms, fixture=None):
+    """导航到页面：fast 模式基于就绪信号，否则沿用 networkidle 加固定等待；
+    指定 fixture 时改为打开本地快照，外部资源由快照的资源缓存应答"""
+
+    trace_step('navigation')
+    instrument_page(page)
+
+    if not getattr(page, '_resource_timing_buffered', False):
+        await page.add_init_script(RESOURCE_TIMING_JS)
+        page._resource_timing_buffered = True
+
+    if fixture:
+        url = await route_fixture(page, fixture)
+
+    if fast:
+        await page.goto(url, wait_until="load")
+        readiness = await wait_for_page_ready(page)
+        print(f"⚡ 页面就绪: {readiness['images']} 个图片, 布局{'稳定' if readiness['layout_stable'] else '未稳定'}, 用时 {readiness['elapsed_ms']:.0f}ms")
+        return readiness
+
+    await page.goto(url, wait_until="networkidle")
+    await page.wait_for_timeout(settle_ms)
+    return None
+
+
+def build_arg_parser(description, report_options=False):
+    """诊断脚本共用的命令行参数；report_options 为 True 时加入 --ndjson / --compact / --cache，
+    只有真正支持流式记录、紧凑报告和结果缓存的脚本才开启"""
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--fast', action='store_true',
+                        help='无头模式运行，用就绪信号代替 slow_mo 和固定等待')
+    if report_options:
+        parser.add_argument('--ndjson', metavar='PATH',
+                            help='边分析边把每张卡片 / 每个头像写成一行 NDJSON 记录')
+        parser.add_argument('--compact', action='store_true',
+                            help='报告使用共享样式表的紧凑格式（report_codec.load_report 可读回原结构）')
+        parser.add_argument('--cache', action='store_true',
+                            help='按 DOM 指纹复用未变化元素的分析结果（缓存在 .diagnostic_cache）')
+    parser.add_argument('--fixture', metavar='PATH',
+                        help='离线运行：从本地服务器打开保存的页面快照（见 fixture_server.py record）')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='记录各阶段耗时和桥接调用，导出 Chrome trace JSON（可在 Perfetto 中打开）')
+    return parser
+
+
+def open_record_stream(path):
+    """打开 NDJSON 记录流，未指定路径时返回 None"""
+    return open(path, 'w', encoding='utf-8') if path else None
+
+
+def write_record(stream, record_type, data):
+    """写入一条 NDJSON 记录并立即刷新，中途失败时已写出的记录仍然完整，下游可以实时 tail"""
+
+    if stream is None:
+        return
+    line = json.dumps({'type': record_type, 'timestamp': datetime.now().isoformat(), 'data': data},
+                      ensure_ascii=False)
+    stream.write(line + '\n')
+    stream.flush()
+
+
+async def run_or_defer(step, deferred=None):
+    """执行会改动页面的步骤（截图会滚动、重排页面）；传入 deferred 列表时只登记，由调用方稍后串行执行"""
+
+    if deferred is None:
+        await step()
+    else:
+        deferred.append(step)
+
+# 单次分析过程内共享的计算样式与几何缓存：祖先链遍历时每个元素只读取一次，
+# DOM 变化、窗口尺寸变化或滚动时整体失效
+STYLE_CACHE_JS = """
+function diagStyleCache() {
+    let cache = window.__diagStyleCache;
+    if (!cache) {
+        cache = { styles: new WeakMap(), rects: new WeakMap(), hits: 0, misses: 0 };
+        cache.clear = () => {
+            cache.styles = new WeakMap();
+            cache.rects = new WeakMap();
+        };
+        new MutationObserver(() => cache.clear()).observe(document.documentElement, {
+            subtree: true, childList: true, attributes: true, characterData: true
+        });
+        window.addEventListener('resize', () => cache.clear());
+        window.addEventListener('scroll', () => cache.clear(), { capture: true, passive: true });
+        window.__diagStyleCache = cache;
+    }
+    return cache;
+}
+
+// 祖先链遍历用到的全部样式属性，缓存时一次性读取
+diagStyleCache.props = [
+    'width', 'height', 'maxWidth', 'maxHeight', 'minWidth', 'minHeight',
+    'display', 'position', 'overflow', 'overflowX', 'overflowY',
+    'flexDirection', 'alignItems', 'justifyContent', 'padding', 'margin',
+    'borderRadius', 'boxShadow', 'backgroundColor', 'zIndex'
+];
+
+function cachedStyle(el) {
+    const cache = diagStyleCache();
+    let snapshot = cache.styles.get(el);
+    if (snapshot) {
+        cache.hits++;
+        return snapshot;
+    }
+    cache.misses++;
+    const style = getComputedStyle(el);
+    snapshot = {};
+    for (const prop of diagStyleCache.props) {
+        snapshot[prop] = style[prop];
+    }
+    cache.styles.set(el, snapshot);
+    return snapshot;
+}
+
+function cachedRect(el) {
+    const cache = diagStyleCache();
+    let rect = cache.rects.get(el);
+    if (rect) {
+        cache.hits++;
+        return rect;
+    }
+    cache.misses++;
+    const r = el.getBoundingClientRect();
+    rect = { x: r.x, y: r.y, width: r.width, height: r.height, top: r.top, right: r.right, bottom: r.bottom, left: r.left };
+    cache.rects.set(el, rect);
+    return rect;
+}
+
+function resetStyleCache() {
+    const cache = diagStyleCache();
+    const stats = { hits: cache.hits, misses: cache.misses };
+    cache.clear();
+    cache.hits = 0;
+    cache.misses = 0;
+    return stats;
+}
+"""
+
+
+def with_style_cache(arrow_source):
+    """让 page.evaluate 的箭头函数可以使用 cachedStyle / cachedRect"""
+    return js_call(STYLE_CACHE_JS, '(' + arrow_source.strip() + ')(arg)')
+
+
+async def reset_style_cache(page):
+    """开始新一轮分析前清空样式缓存，返回上一轮的命中统计"""
+
+    return await page.evaluate(js_call(STYLE_CACHE_JS, 'resetStyleCache()'))
@@ -0,0 +1,739 @@
+#!/usr/bin/env python3
+"""
+CDP DOMSnapshot 批量采集后端
+一次 DOMSnapshot.captureSnapshot 获取全部节点的布局和计算样式，卡片与头像分析在 Python 中完成
+"""
+
+import asyncio
+from playwright.async_api import async_playwright
+import json
+import re
+from datetime import datetime
+import sys
+from diagnosis_common import DEDUPE_JS, build_arg_parser, js_call, launch_options, open_page
+from stage_trace import start_trace, trace_step, write_trace
+from voicepanel_diagnosis import AVATAR_SELECTORS as CARD_AVATAR_SELECTORS, CARD_SELECTORS, card_info_from_record, generate_comprehensive_report
+from voicecard_avatar_diagnosis import AVATAR_SELECTORS, generate_avatar_analysis_report
+from marcus_avatar_specific_analysis import MARCUS_SELECTORS
+
+try:
+    import layout_geometry
+except ImportError:
+    # 未安装 numpy 时跳过全页向量化几何评分
+    layout_geometry = None
+
+# 各脚本用到的计算样式（与 getComputedStyle 读取的属性一致）
+CARD_STYLE_KEYS = [
+    'width', 'height', 'maxWidth', 'maxHeight', 'minWidth', 'minHeight',
+    'display', 'position', 'overflow', 'overflowX', 'overflowY', 'textOverflow',
+    'whiteSpace', 'flexDirection', 'justifyContent', 'alignItems', 'padding',
+    'margin', 'border', 'borderRadius', 'backgroundColor', 'zIndex'
+]
+
+CARD_AVATAR_STYLE_KEYS = [
+    'width', 'height', 'maxWidth', 'maxHeight', 'minWidth', 'minHeight',
+    'objectFit', 'borderRadius', 'display', 'position', 'float',
+    'verticalAlign', 'transform', 'opacity', 'visibility'
+]
+
+AVATAR_STYLE_KEYS = [
+    'width', 'height', 'maxWidth', 'maxHeight', 'minWidth', 'minHeight',
+    'objectFit', 'objectPosition', 'display', 'position', 'overflow',
+    'visibility', 'opacity', 'transform', 'borderRadius', 'boxShadow',
+    'backgroundColor', 'zIndex'
+]
+
+BASIC_AVATAR_STYLE_KEYS = AVATAR_STYLE_KEYS[:15]
+
+PARENT_STYLE_KEYS = [
+    'width', 'height', 'maxWidth', 'maxHeight', 'minWidth', 'minHeight',
+    'display', 'position', 'overflow', 'overflowX', 'overflowY',
+    'flexDirection', 'alignItems', 'justifyContent', 'padding', 'margin',
+    'borderRadius'
+]
+
+CLIPPED_CHILD_STYLE_KEYS = ['position', 'display', 'overflow', 'zIndex', 'transform']
+
+CLIPPING_PARENT_STYLE_KEYS = ['overflow', 'overflowX', 'overflowY', 'position', 'display']
+
+SIZE_PROPS = ['width', 'height', 'maxWidth', 'maxHeight', 'minWidth', 'minHeight']
+
+OVERFLOW_PROPS = ['overflow', 'overflowX', 'overflowY']
+
+# 快照请求的计算样式白名单（上面所有列表的并集）
+SNAPSHOT_STYLE_KEYS = list(dict.fromkeys(
+    CARD_STYLE_KEYS + CARD_AVATAR_STYLE_KEYS + AVATAR_STYLE_KEYS + PARENT_STYLE_KEYS
+))
+
+# 快照不含图片的原始尺寸和加载状态，用一次调用按 DOM 路径键补齐
+IMAGE_INFO_JS = DEDUPE_JS + """
+function readImageInfo() {
+    const info = {};
+    for (const img of document.images) {
+        info[domPathKey(img)] = {
+            src: img.src,
+            currentSrc: img.currentSrc,
+            alt: img.alt,
+            title: img.title,
+            naturalWidth: img.naturalWidth,
+            naturalHeight: img.naturalHeight,
+            width: img.width,
+            height: img.height,
+            complete: img.complete,
+            loading: img.loading,
+            decoding: img.decoding
+        };
+    }
+    return info;
+}
+"""
+
+ELEMENT_NODE = 1
+TEXT_NODE = 3
+
+def css_property_name(key):
+    """camelCase 样式名转换为 CSS 属性名"""
+    return re.sub(r'[A-Z]', lambda m: '-' + m.group(0).lower(), key)
+
+async def capture_dom_snapshot(page):
+    """一次 CDP 调用采集全部节点的布局和样式，再用一次调用补齐图片信息"""
+
+    cdp = await page.context.new_cdp_session(page)
+    try:
+        raw = await cdp.send('DOMSnapshot.captureSnapshot', {
+            'computedStyles': [css_property_name(key) for key in SNAPSHOT_STYLE_KEYS]
+        })
+    finally:
+        await cdp.detach()
+
+    image_info = await page.evaluate(js_call(IMAGE_INFO_JS, 'readImageInfo()'))
+    return build_snapshot_index(raw, image_info)
+
+def build_snapshot_index(raw, image_info):
+    """把快照的列式数据整理为按节点索引的结构"""
+
+    strings = raw['strings']
+    document = raw['documents'][0]
+    nodes = document['nodes']
+    layout = document['layout']
+
+    def string_at(index):
+        return strings[index] if index >= 0 else ''
+
+    count = len(nodes['parentIndex'])
+    parents = nodes['parentIndex']
+    node_types = nodes['nodeType']
+    names = [string_at(i) for i in nodes['nodeName']]
+    values = [string_at(i) for i in nodes['nodeValue']]
+
+    attributes = []
+    for flat in nodes.get('attributes', [[] for _ in range(count)]):
+        attributes.append({string_at(flat[i]).lower(): string_at(flat[i + 1]) for i in range(0, len(flat), 2)})
+
+    # 伪元素也以子节点形式出现在快照中，不属于 el.children
+    pseudo = set(nodes.get('pseudoType', {}).get('index', []))
+
+    children = [[] for _ in range(count)]
+    element_positions = [1] * count
+    element_counts = [0] * count
+    for index, parent in enumerate(parents):
+        if parent >= 0 and index not in pseudo and node_types[index] in (ELEMENT_NODE, TEXT_NODE):
+            children[parent].append(index)
+            if node_types[index] == ELEMENT_NODE:
+                element_counts[parent] += 1
+                element_positions[index] = element_counts[parent]
+
+    # 快照边界是文档坐标，减去滚动偏移得到与 getBoundingClientRect 一致的视口坐标
+    scroll_x = document.get('scrollOffsetX', 0)
+    scroll_y = document.get('scrollOffsetY', 0)
+
+    bounds = [None] * count
+    styles = [None] * count
+    for layout_index, node_index in enumerate(layout['nodeIndex']):
+        if bounds[node_index] is not None:
+            continue
+        x, y, width, height = layout['bounds'][layout_index]
+        bounds[node_index] = {'x': x - scroll_x, 'y': y - scroll_y, 'width': width, 'height': height}
+        styles[node_index] = {
+            key: string_at(value)
+            for key, value in zip(SNAPSHOT_STYLE_KEYS, layout['styles'][layout_index])
+        }
+
+    return {
+        'count': count,
+        'parents': parents,
+        'node_types': node_types,
+        'names': names,
+        'values': values,
+        'attributes': attributes,
+        'children': children,
+        'element_positions': element_positions,
+        'bounds': bounds,
+        'styles': styles,
+        'image_info': image_info,
+        'raw': raw
+    }
+
+def element_children(index, node):
+    """与 el.children 一致的元素子节点"""
+    return [child for child in index['children'][node] if index['node_types'][child] == ELEMENT_NODE]
+
+def parent_element(index, node):
+    """与 el.parentElement 一致的父元素"""
+    parent = index['parents'][node]
+    if parent >= 0 and index['node_types'][parent] == ELEMENT_NODE:
+        return parent
+    return None
+
+def dom_path_key(index, node):
+    """与页面内 domPathKey 相同的 DOM 路径键"""
+
+    parts = []
+    current = node
+    while current is not None:
+        parts.append(f"{index['names'][current].lower()}:nth-child({index['element_positions'][current]})")
+        current = parent_element(index, current)
+    return '>'.join(reversed(parts))
+
+def descendants(index, node):
+    """按文档顺序遍历元素后代（不含自身）"""
+
+    stack = list(reversed(element_children(index, node)))
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(element_children(index, current)))
+
+def text_content(index, node):
+    """与 el.textContent 一致的文本内容"""
+
+    parts = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if index['node_types'][current] == TEXT_NODE:
+            parts.append(index['values'][current])
+        else:
+            stack.extend(reversed(index['children'][current]))
+    return ''.join(parts)
+
+def class_name(index, node):
+    return index['attributes'][node].get('class', '')
+
+def rect_of(index, node):
+    """与 getBoundingClientRect 一致的矩形（含四边），无布局时返回零矩形"""
+
+    box = index['bounds'][node] or {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+    return {
+        **box,
+        'left': box['x'],
+        'top': box['y'],
+        'right': box['x'] + box['width'],
+        'bottom': box['y'] + box['height']
+    }
+
+def style_subset(index, node, keys):
+    styles = index['styles'][node] or {}
+    return {key: styles.get(key, '') for key in keys}
+
+# ---- 简单 CSS 选择器匹配：支持标签、.class、[attr]、[attr=v]、[attr*=v]、[attr^=v]、[attr$=v] 和后代组合 ----
+
+COMPOUND_RE = re.compile(r'^(?P<tag>\*|[a-zA-Z][\w-]*)?(?P<rest>(?:\.[\w-]+|\[[^\]]+\])*)$')
+PART_RE = re.compile(r'\.([\w-]+)|\[\s*([\w-]+)\s*(?:([*^$]?=)\s*"([^"]*)"\s*)?\]')
+
+def parse_selector(selector):
+    """解析为复合选择器列表，不支持的选择器返回 None"""
+
+    compounds = []
+    for token in selector.split():
+        match = COMPOUND_RE.match(token)
+        if not match:
+            return None
+        rest = match.group('rest')
+        found = list(PART_RE.finditer(rest))
+        # [a~="x"]、[a|="x"]、未加引号的 [alt=foo] 等能通过 COMPOUND_RE，但 PART_RE 会跳过它们；
+        # 解析出的部分拼起来不等于原串时说明有不支持的写法，回退而不是放宽匹配
+        if ''.join(part.group(0) for part in found) != rest:
+            return None
+        parts = []
+        for part in found:
+            if part.group(1):
+                parts.append(('class', part.group(1), None))
+            else:
+                parts.append((part.group(3) or 'has', part.group(2).lower(), part.group(4)))
+        compounds.append((match.group('tag'), parts))
+    return compounds or None
+
+def matches_compound(index, node, compound):
+    tag, parts = compound
+    if tag and tag != '*' and index['names'][node].lower() != tag.lower():
+        return False
+
+    attributes = index['attributes'][node]
+    for kind, name, value in parts:
+        if kind == 'class':
+            if name not in attributes.get('class', '').split():
+                return False
+            continue
+        if name not in attributes:
+            return False
+        actual = attributes[name]
+        if kind == '=' and actual != value:
+            return False
+        if kind == '*=' and value not in actual:
+            return False
+        if kind == '^=' and not actual.startswith(value):
+            return False
+        if kind == '$=' and not actual.endswith(value):
+            return False
+    return True
+
+def matches_selector(index, node, compounds, scope=None):
+    """从右向左匹配后代组合，祖先查找不越过 scope"""
+
+    if not matches_compound(index, node, compounds[-1]):
+        return False
+
+    current = node
+    for compound in reversed(compounds[:-1]):
+        current = parent_element(index, current)
+        while current is not None and current != scope and not matches_compound(index, current, compound):
+            current = parent_element(index, current)
+        if current is None or current == scope:
+            return False
+    return True
+
+def query_all(index, selector, root=None):
+    """在快照上执行 querySelectorAll，root 为 None 时查询整个文档"""
+
+    compounds = parse_selector(selector)
+    if compounds is None:
+        return None
+
+    if root is None:
+        candidates = [i for i in range(index['count']) if index['node_types'][i] == ELEMENT_NODE]
+    else:
+        candidates = descendants(index, root)
+    return [node for node in candidates if matches_selector(index, node, compounds)]
+
+# ---- 基于快照的分析，返回与页面内探针相同结构的数据 ----
+
+def box_of(index, node):
+    """与 ElementHandle.bounding_box() 一致：没有布局时返回 None"""
+    return index['bounds'][node]
+
+def image_attributes(index, node, keys):
+    info = index['image_info'].get(dom_path_key(index, node), {})
+    return {key: info.get(key) for key in keys}
+
+def snapshot_clipping(index, node):
+    """与 analyzeClipping 相同的直接子元素裁剪检查"""
+
+    parent_rect = rect_of(index, node)
+    clipped_elements = []
+    children = element_children(index, node)
+
+    for position, child in enumerate(children):
+        child_rect = rect_of(index, child)
+        overlaps = {
+            'right': max(0, child_rect['right'] - parent_rect['right'] - 1),
+            'left': max(0, parent_rect['left'] - child_rect['left'] - 1),
+            'bottom': max(0, child_rect['bottom'] - parent_rect['bottom'] - 1),
+            'top': max(0, parent_rect['top'] - child_rect['top'] - 1)
+        }
+        total_overlap = sum(overlaps.values())
+        if total_overlap > 0:
+            clipped_elements.append({
+                'index': position,
+                'tag_name': index['names'][child],
+                'class_name': class_name(index, child),
+                'id': index['attributes'][child].get('id', ''),
+                'text_content': text_content(index, child)[:50],
+                'rect': {
+                    'x': child_rect['x'] - parent_rect['x'],
+                    'y': child_rect['y'] - parent_rect['y'],
+                    'width': child_rect['width'],
+                    'height': child_rect['height']
+                },
+                'style': style_subset(index, child, CLIPPED_CHILD_STYLE_KEYS),
+                'overlap': overlaps,
+                'total_overlap': total_overlap
+            })
+
+    return {
+        'parent_rect': parent_rect,
+        'parent_style': style_subset(index, node, CLIPPING_PARENT_STYLE_KEYS),
+        'total_children': len(children),
+        'clipped_children': len(clipped_elements),
+        'clipped_elements': clipped_elements
+    }
+
+def snapshot_card_record(index, node):
+    """与 probeCard 相同结构的卡片原始记录"""
+
+    bbox = box_of(index, node)
+    if not bbox:
+        return None
+
+    avatar = None
+    for selector in CARD_AVATAR_SELECTORS:
+        matches = query_all(index, selector, root=node)
+        if not matches:
+            continue
+        avatar_box = box_of(index, matches[0])
+        if avatar_box:
+            attrs = image_attributes(index, matches[0], [
+                'src', 'currentSrc', 'alt', 'title', 'naturalWidth', 'naturalHeight',
+                'width', 'height', 'loading', 'decoding', 'complete'
+            ])
+            attrs['naturalWidth'] = attrs['naturalWidth'] or 0
+            attrs['naturalHeight'] = attrs['naturalHeight'] or 0
+            attrs['loadingState'] = 'loaded' if attrs['complete'] else 'loading'
+            avatar = {
+                'bounding_box': avatar_box,
+                'computed_styles': style_subset(index, matches[0], CARD_AVATAR_STYLE_KEYS),
+                'attributes': attrs
+            }
+        break
+
+    return {
+        'bounding_box': bbox,
+        'computed_styles': style_subset(index, node, CARD_STYLE_KEYS),
+        'text_content': text_content(index, node),
+        'avatar': avatar,
+        'clipping_analysis': snapshot_clipping(index, node),
+        'children_info': [
+            {
+                'index': position,
+                'tag_name': index['names'][child],
+                'class_name': class_name(index, child),
+                'id': index['attributes'][child].get('id', ''),
+                'is_image': index['names'][child] == 'IMG',
+                'has_text': len(text_content(index, child).strip()) > 0
+            }
+            for position, child in enumerate(element_children(index, node))
+        ]
+    }
+
+def collect_unique(index, selectors):
+    """按选择器顺序合并匹配结果并按节点去重，返回节点列表和各选择器命中数"""
+
+    selector_counts = {}
+    seen = set()
+    unique = []
+    for selector in selectors:
+        matches = query_all(index, selector)
+        if matches is None:
+            continue
+        selector_counts[selector] = len(matches)
+        for node in matches:
+            if node not in seen:
+                seen.add(node)
+                unique.append(node)
+    return unique, selector_counts
+
+def snapshot_analyze_cards(index, card_selectors=CARD_SELECTORS):
+    """与 analyze_all_cards_batch 结构相同的全部卡片分析"""
+
+    cards, selector_counts = collect_unique(index, card_selectors)
+    results = []
+    for position, node in enumerate(cards):
+        record = snapshot_card_record(index, node)
+        if record:
+            results.append(card_info_from_record(position, record))
+
+    return {
+        'selector_counts': selector_counts,
+        'total_matched': len(cards),
+        'cards': results
+    }
+
+def snapshot_avatar_clipping(index, node):
+    """与 checkAvatarClipping 相同的祖先链裁剪检查"""
+
+    img_rect = rect_of(index, node)
+    max_clipping = {'right': 0, 'left': 0, 'bottom': 0, 'top': 0}
+    is_clipped = False
+
+    current = parent_element(index, node)
+    while current is not None and index['names'][current] != 'BODY':
+        styles = index['styles'][current] or {}
+        if styles.get('overflow', 'visible') != 'visible':
+            rect = rect_of(index, current)
+            clipping = {
+                'right': max(0, img_rect['right'] - rect['right']),
+                'left': max(0, rect['left'] - img_rect['left']),
+                'bottom': max(0, img_rect['bottom'] - rect['bottom']),
+                'top': max(0, rect['top'] - img_rect['top'])
+            }
+            if sum(clipping.values()) > 0:
+                is_clipped = True
+                for direction in max_clipping:
+                    max_clipping[direction] = max(max_clipping[direction], clipping[direction])
+        current = parent_element(index, current)
+
+    return {
+        'is_clipped': is_clipped,
+        'details': max_clipping,
+        'total_clipping': sum(max_clipping.values())
+    }
+
+def snapshot_container_constraints(index, node):
+    """与 get_all_container_constraints 相同的容器约束"""
+
+    constraints = []
+    current = parent_element(index, node)
+    while current is not None and index['names'][current] != 'BODY':
+        styles = index['styles'][current] or {}
+        size_constraints = {
+            prop: styles[prop] for prop in SIZE_PROPS
+            if styles.get(prop) and styles[prop] not in ('auto', 'none')
+        }
+        overflow_constraints = {
+            prop: styles[prop] for prop in OVERFLOW_PROPS
+            if styles.get(prop) and styles[prop] != 'visible'
+        }
+        if size_constraints or overflow_constraints:
+            constraints.append({
+                'tagName': index['names'][current],
+                'className': class_name(index, current),
+                'hasSizeConstraints': bool(size_constraints),
+                'hasOverflowConstraints': bool(overflow_constraints),
+                'sizeConstraints': size_constraints,
+                'overflowConstraints': overflow_constraints
+            })
+        current = parent_element(index, current)
+    return constraints
+
+AVATAR_ATTRIBUTE_KEYS = [
+    'src', 'currentSrc', 'alt', 'naturalWidth', 'naturalHeight',
+    'width', 'height', 'complete', 'loading', 'decoding'
+]
+
+def snapshot_avatar_attributes(index, node):
+    attrs = image_attributes(index, node, AVATAR_ATTRIBUTE_KEYS)
+    attrs['alt'] = attrs['alt'] or ''
+    attrs['naturalWidth'] = attrs['naturalWidth'] or 0
+    attrs['naturalHeight'] = attrs['naturalHeight'] or 0
+    return attrs
+
+def snapshot_single_avatar(index, node, position):
+    """与 analyze_single_avatar 结构相同的头像分析"""
+
+    bbox = box_of(index, node)
+    if not bbox:
+        return None
+
+    img_attrs = snapshot_avatar_attributes(index, node)
+
+    parent_info = None
+    is_clipped = False
+    clipping_info = {}
+
+    parent = parent_element(index, node)
+    if parent is not None:
+        parent_rect = rect_of(index, parent)
+        img_rect = rect_of(index, node)
+        parent_info = {
+            'tagName': index['names'][parent],
+            'className': class_name(index, parent),
+            'rect': {key: parent_rect[key] for key in ('x', 'y', 'width', 'height')},
+            'styles': style_subset(index, parent, PARENT_STYLE_KEYS),
+            'imagePosition': {
+                'x': img_rect['x'] - parent_rect['x'],
+                'y': img_rect['y'] - parent_rect['y'],
+                'width': img_rect['width'],
+                'height': img_rect['height']
+            }
+        }
+
+        img_pos = parent_info['imagePosition']
+        clipping_info = {
+            'right': max(0, img_pos['x'] + img_pos['width'] - parent_rect['width'] - 1),
+            'left': max(0, -img_pos['x'] - 1),
+            'bottom': max(0, img_pos['y'] + img_pos['height'] - parent_rect['height'] - 1),
+            'top': max(0, -img_pos['y'] - 1)
+        }
+        is_clipped = sum(clipping_info.values()) > 0
+
+    scale_x = bbox['width'] / img_attrs['naturalWidth'] if img_attrs['naturalWidth'] > 0 else 1
+    scale_y = bbox['height'] / img_attrs['naturalHeight'] if img_attrs['naturalHeight'] > 0 else 1
+    container_constraints = snapshot_container_constraints(index, node)
+
+    return {
+        'index': position,
+        'bounding_box': bbox,
+        'image_attributes': img_attrs,
+        'computed_styles': style_subset(index, node, AVATAR_STYLE_KEYS),
+        'parent_info': parent_info,
+        'is_clipped': is_clipped,
+        'clipping_info': clipping_info,
+        'scale_x': scale_x,
+        'scale_y': scale_y,
+        'aspect_ratio_preserved': abs(scale_x - scale_y) < 0.1,
+        'container_constraints': container_constraints,
+        'has_constraints': len(container_constraints) > 0,
+        'image_loaded': img_attrs['complete'],
+        'has_natural_dimensions': img_attrs['naturalWidth'] > 0 and img_attrs['naturalHeight'] > 0
+    }
+
+def snapshot_basic_avatar_info(index, node):
+    """与 get_basic_avatar_info 结构相同的头像基础信息"""
+
+    bbox = box_of(index, node)
+    if not bbox:
+        return None
+
+    img_attrs = snapshot_avatar_attributes(index, node)
+    scale_x = bbox['width'] / img_attrs['naturalWidth'] if img_attrs['naturalWidth'] > 0 else 1
+    scale_y = bbox['height'] / img_attrs['naturalHeight'] if img_attrs['naturalHeight'] > 0 else 1
+    clipping = snapshot_avatar_clipping(index, node)
+
+    return {
+        'bounding_box': bbox,
+        'display_width': bbox['width'],
+        'display_height': bbox['height'],
+        'image_attributes': img_attrs,
+        'computed_styles': style_subset(index, node, BASIC_AVATAR_STYLE_KEYS),
+        'scale_x': scale_x,
+        'scale_y': scale_y,
+        'aspect_ratio_preserved': abs(scale_x - scale_y) < 0.1,
+        'is_clipped': clipping['is_clipped'],
+        'clipping_details': clipping['details'],
+        'image_loaded': img_attrs['complete']
+    }
+
+def snapshot_marcus_avatar(index):
+    """与 run_marcus_analysis 相同的 Marcus 头像查找（快照不支持 :has-text，这类选择器被跳过），
+    找不到时退回第一个 https 头像；返回 (基础信息或 None, 各选择器命中数)"""
+
+    avatars, selector_counts = collect_unique(index, MARCUS_SELECTORS)
+    if not avatars:
+        avatars = query_all(index, 'img[src*="https"]')
+    if not avatars:
+        return None, selector_counts
+    return snapshot_basic_avatar_info(index, avatars[0]), selector_counts
+
+def snapshot_analyze_avatars(index, avatar_selectors=AVATAR_SELECTORS):
+    """对全部头像执行与 analyze_single_avatar 相同的分析"""
+
+    avatars, selector_counts = collect_unique(index, avatar_selectors)
+    results = []
+    for position, node in enumerate(avatars):
+        analysis = snapshot_single_avatar(index, node, position)
+        if analysis:
+            results.append(analysis)
+    return results, selector_counts
+
+def snapshot_page_geometry(index, tolerance=1):
+    """用 NumPy 对快照中全部节点做向量化的裁剪、越界和图片缩放评分"""
+
+    arrays = layout_geometry.layout_arrays(index['raw'], SNAPSHOT_STYLE_KEYS)
+    scores = layout_geometry.score_layout(arrays, tolerance)
+
+    def describe_node(node):
+        return {
+            'path': dom_path_key(index, node),
+            'tag_name': index['names'][node],
+            'class_name': class_name(index, node)
+        }
+
+    summary = layout_geometry.summarize_scores(scores, describe_node)
+
+    images = [node for node in range(index['count']) if index['names'][node] == 'IMG' and arrays['reportable'][node]]
+    info = [index['image_info'].get(dom_path_key(index, node), {}) for node in images]
+    scales = layout_geometry.image_scales(
+        arrays['right'][images] - arrays['left'][images],
+        arrays['bottom'][images] - arrays['top'][images],
+        [item.get('naturalWidth', 0) for item in info],
+        [item.get('naturalHeight', 0) for item in info]
+    )
+
+    return {
+        'nodes_scored': int(arrays['reportable'].sum()),
+        **summary,
+        'images': {
+            'total': len(images),
+            'scaled': int(scales['is_scaled'].sum()),
+            'aspect_ratio_issues': int((~scales['aspect_ratio_preserved']).sum()),
+            'max_scale': float(max(scales['scale_x'].max(), scales['scale_y'].max())) if images else 0
+        }
+    }
+
+async def run_snapshot_analysis(page):
+    """采集一次快照并在 Python 中完成卡片和头像分析"""
+
+    print("📸 采集 DOMSnapshot...")
+    index = await capture_dom_snapshot(page)
+    print(f"📊 快照节点: {index['count']} 个")
+
+    cards = snapshot_analyze_cards(index)
+    print(f"📊 卡片: {cards['total_matched']} 个匹配，{len(cards['cards'])} 个可分析")
+
+    avatars, avatar_selector_counts = snapshot_analyze_avatars(index)
+    print(f"📊 头像: {len(avatars)} 个")
+
+    marcus_avatar, marcus_selector_counts = snapshot_marcus_avatar(index)
+    if marcus_avatar:
+        print(f"🎯 Marcus 头像: {marcus_avatar['display_width']:.1f} x {marcus_avatar['display_height']:.1f}"
+              f"{'，被裁剪' if marcus_avatar['is_clipped'] else ''}")
+    else:
+        print("❌ 快照中未找到 Marcus 头像")
+
+    page_geometry = None
+    if layout_geometry:
+        page_geometry = snapshot_page_geometry(index)
+        print(f"🧮 全页几何评分: {page_geometry['nodes_scored']} 个节点，{page_geometry['clipped_nodes']} 个被裁剪")
+    else:
+        print("⚠️ 未安装 numpy，跳过全页几何评分")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'page_info': {
+            'title': await page.title(),
+            'url': page.url
+        },
+        'snapshot_nodes': index['count'],
+        'card_selector_counts': cards['selector_counts'],
+        'avatar_selector_counts': avatar_selector_counts,
+        'card_summary': generate_comprehensive_report(cards['cards']),
+        'avatar_report': generate_avatar_analysis_report(avatars),
+        'marcus_selector_counts': marcus_selector_counts,
+        'marcus_avatar': marcus_avatar,
+        'page_geometry': page_geometry
+    }
+
+async def main():
+    """主函数"""
+    args = build_arg_parser('基于 DOMSnapshot 的卡片与头像分析').parse_args()
+    if args.trace:
+        start_trace()
+    try:
+        trace_step('launch')
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(**launch_options(args.fast, slow_mo=500))
+            try:
+                page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+                await open_page(page, "http://localhost:3000", args.fast, settle_ms=3000, fixture=args.fixture)
+                trace_step('snapshot_analysis')
+                report = await run_snapshot_analysis(page)
+            finally:
+                await browser.close()
+
+        trace_step('serialization')
+        with open('dom_snapshot_report.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print("💾 分析结果已保存到: dom_snapshot_report.json")
+
+    except KeyboardInterrupt:
+        print("\n⚠️ 分析被用户中断")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+    finally:
+        if args.trace:
+            write_trace(args.trace)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+离线夹具模式
+用进程内 HTTP 服务器提供保存的页面快照，外部头像等资源通过 page.route 由本地缓存应答，
+诊断不再依赖 localhost:3000 和网络
+
+录制快照（需要能访问真实页面）:
+    python fixture_server.py record --url http://localhost:3000 --output fixtures/voicepanel
+之后诊断脚本加 --fixture fixtures/voicepanel 即可离线运行
+"""
+
+import argparse
+import asyncio
+from playwright.async_api import async_playwright
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# 快照目录中保存资源缓存的子目录
+RESOURCE_DIR = 'resources'
+
+# 录制时缓存的资源类型；脚本不录制，快照保持为渲染后的静态 DOM
+CACHED_RESOURCE_TYPES = {'image', 'stylesheet', 'font'}
+
+# 缓存中没有的外部图片用固定尺寸的占位图应答，保证布局稳定
+PLACEHOLDER_SVG = ('<svg xmlns="http://www.w3.org/2000/svg" width="96" height="96">'
+                   '<rect width="96" height="96" fill="#d0d0d0"/></svg>')
+
+# 每个快照路径在进程内只启动一个服务器
+_servers = {}
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """静态文件服务，不把每个请求打印到 stderr"""
+
+    def log_message(self, format, *args):
+        pass
+
+def fixture_root(path):
+    """快照可以是单个 HTML 文件，也可以是含 index.html 的目录；返回 (服务根目录, 页面文件名)"""
+
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        return path, 'index.html'
+    return os.path.dirname(path), os.path.basename(path)
+
+def serve_fixture(path):
+    """在后台线程中启动静态服务器（随机端口），返回快照页面地址"""
+
+    root, page_name = fixture_root(path)
+    if root not in _servers:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _servers[root] = server
+
+    host, port = _servers[root].server_address[:2]
+    return f"http://{host}:{port}/{page_name}"
+
+def stop_fixture_servers():
+    for server in _servers.values():
+        server.shutdown()
+        server.server_close()
+    _servers.clear()
+
+def resource_key(url, origin):
+    """同源资源按路径 + 查询串记录（换了服务器地址仍能命中），外部资源按完整地址记录"""
+
+    if url.startswith(origin + '/'):
+        return url[len(origin):]
+    return url
+
+def url_origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def load_resource_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'index.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_resource_index(cache_dir, index):
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False, sort_keys=True)
+
+def store_resource(cache_dir, index, key, body, content_type, status):
+    name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, name), 'wb') as f:
+        f.write(body)
+    index[key] = {'file': name, 'content_type': content_type, 'status': status}
+
+async def route_offline(page, origin, cache_dir):
+    """拦截全部请求：命中缓存直接应答，其余同源请求交给本地服务器，
+    外部图片用占位图，其他外部请求（字体、统计脚本等）直接中止"""
+
+    index = load_resource_index(cache_dir)
+    stats = {'cached': 0, 'placeholder': 0, 'blocked': 0}
+
+    async def handle(route):
+        request = route.request
+        entry = index.get(resource_key(request.url, origin))
+
+        if entry:
+            stats['cached'] += 1
+            await route.fulfill(path=os.path.join(cache_dir, entry['file']),
+                                content_type=entry['content_type'], status=entry['status'])
+        elif request.url.startswith(origin + '/'):
+            await route.continue_()
+        elif request.resource_type == 'image':
+            stats['placeholder'] += 1
+            print(f"  ⚠️ 缓存中没有该图片，使用占位图: {request.url}")
+            await route.fulfill(body=PLACEHOLDER_SVG, content_type='image/svg+xml')
+        else:
+            stats['blocked'] += 1
+            await route.abort()
+
+    await page.route('**/*', handle)
+    return stats
+
+async def route_fixture(page, path):
+    """启动快照服务器并安装离线路由，返回应导航到的地址"""
+
+    url = serve_fixture(path)
+    root, _ = fixture_root(path)
+    await route_offline(page, url_origin(url), os.path.join(root, RESOURCE_DIR))
+    print(f"📦 离线夹具: {url}")
+    return url
+
+async def record_fixture(url, output_dir):
+    """打开真实页面，把渲染后的 DOM（去掉脚本）保存为 index.html，图片、样式和字体写入资源缓存"""
+
+    cache_dir = os.path.join(output_dir, RESOURCE_DIR)
+    origin = url_origin(url)
+    index = {}
+
+    async def handle(route):
+        request = route.request
+        if request.resource_type not in CACHED_RESOURCE_TYPES:
+            await route.continue_()
+            return
+
+        response = await route.fetch()
+        body = await response.body()
+        store_resource(cache_dir, index, resource_key(request.url, origin), body,
+                       response.headers.get('content-type', 'application/octet-stream'), response.status)
+        await route.fulfill(response=response, body=body)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+            await page.route('**/*', handle)
+            await page.goto(url, wait_until='networkidle')
+            await page.wait_for_timeout(1000)
+            html = await page.content()
+        finally:
+            await browser.close()
+
+    # 脚本不随快照保存，否则离线加载时会重新水合或发起接口请求
+    html = re.sub(r'<script\b[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+    save_resource_index(cache_dir, index)
+
+    return {'snapshot': os.path.join(output_dir, 'index.html'), 'resources': len(index)}
+
+async def serve_forever(path):
+    url = serve_fixture(path)
+    print(f"📦 快照已在 {url} 提供，按 Ctrl+C 停止")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        stop_fixture_servers()
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='离线夹具：录制页面快照或在本地提供快照')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help='录制页面快照和资源缓存')
+    record.add_argument('--url', default='http://localhost:3000', help='待录制页面地址')
+    record.add_argument('--output', default='fixtures/voicepanel', help='快照输出目录')
+
+    serve = subparsers.add_parser('serve', help='在本地提供快照（不含资源路由，便于手动查看）')
+    serve.add_argument('fixture', help='快照目录或 HTML 文件')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'record':
+            result = await record_fixture(args.url, args.output)
+            print(f"💾 快照已保存到: {result['snapshot']}，缓存资源 {result['resources']} 个")
+        else:
+            await serve_forever(args.fixture)
+
+    except KeyboardInterrupt:
+        print("\n⚠️ 已停止")
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+图片体积审计
+把每张图片的原图尺寸、显示尺寸与 Resource Timing（传输大小、解码后大小、耗时）和解码耗时关联起来，
+估算当前 DPR 下过大图片浪费的字节，找出首屏以下仍然立即加载的图片，并按卡片汇总
+"""
+
+import math
+from diagnosis_common import SELECTOR_JS, js_call
+
+# 一次采集全部图片、所属卡片、资源计时，并对每个地址测一次解码耗时
+IMAGE_AUDIT_JS = SELECTOR_JS + """
+async function measureDecode(src) {
+    // 新建 Image 从内存缓存取同一地址再解码一次；结果包含少量取缓存的开销
+    const probe = new Image();
+    probe.src = src;
+    const start = performance.now();
+    try {
+        await probe.decode();
+    } catch (e) {
+        return null;
+    }
+    return performance.now() - start;
+}
+
+async function auditImages(cardSelectors, decodeLimit) {
+    const cards = resolveSelectorChain(document, cardSelectors, 'all').matches;
+    const cardOf = new Map();
+    // 匹配结果按文档顺序排列，后出现的内层卡片覆盖外层卡片
+    cards.forEach((card, index) => {
+        for (const img of card.querySelectorAll('img')) cardOf.set(img, index);
+    });
+
+    const images = Array.from(document.images).map((img, index) => {
+        const rect = img.getBoundingClientRect();
+        const style = getComputedStyle(img);
+        return {
+            index: index,
+            card: cardOf.has(img) ? cardOf.get(img) : null,
+            src: img.currentSrc || img.src,
+            alt: img.alt || '',
+            natural_width: img.naturalWidth,
+            natural_height: img.naturalHeight,
+            display_width: rect.width,
+            display_height: rect.height,
+            page_top: rect.top + window.scrollY,
+            rendered: img.getClientRects().length > 0 && style.visibility !== 'hidden',
+            object_fit: style.objectFit,
+            loading: img.loading,
+            decoding: img.decoding,
+            fetch_priority: img.fetchPriority || 'auto',
+            complete: img.complete
+        };
+    });
+
+    const resources = {};
+    const entries = performance.getEntriesByType('resource');
+    // 未经 open_page 调大缓冲区时按 Chromium 默认的 250 条判断是否截断
+    const bufferSize = window.__resourceTimingBufferSize || 250;
+    for (const entry of entries) {
+        resources[entry.name] = {
+            initiator_type: entry.initiatorType,
+            transfer_size: entry.transferSize,
+            encoded_body_size: entry.encodedBodySize,
+            decoded_body_size: entry.decodedBodySize,
+            duration: entry.duration,
+            // 跨域资源没有 Timing-Allow-Origin 时大小字段全部为 0
+            restricted: entry.encodedBodySize === 0 && entry.decodedBodySize === 0
+        };
+    }
+
+    const decodeMs = {};
+    const sources = [...new Set(images.filter(img => img.src && img.complete && img.natural_width > 0).map(img => img.src))];
+    for (const src of sources.slice(0, decodeLimit)) {
+        decodeMs[src] = await measureDecode(src);
+    }
+
+    return {
+        dpr: window.devicePixelRatio,
+        viewport_height: window.innerHeight,
+        card_count: cards.length,
+        images: images,
+        resources: resources,
+        resource_timing_truncated: Boolean(window.__resourceTimingBufferFull) || entries.length >= bufferSize,
+        decode_ms: decodeMs
+    };
+}
+"""
+
+def needed_pixels(image, dpr):
+    """在当前 DPR 下清晰显示所需的原图像素数（不超过原图本身）"""
+
+    natural_width, natural_height = image['natural_width'], image['natural_height']
+    natural = natural_width * natural_height
+    if not natural or not image['rendered'] or image['display_width'] <= 0 or image['display_height'] <= 0:
+        return 0
+
+    scale_x = image['display_width'] * dpr / natural_width
+    scale_y = image['display_height'] * dpr / natural_height
+    if image['object_fit'] == 'cover':
+        # 原图等比放大到铺满盒子，超出部分被裁掉但仍需要解码
+        scale = max(scale_x, scale_y)
+        return min(natural, math.ceil(natural_width * scale) * math.ceil(natural_height * scale))
+    if image['object_fit'] in ('contain', 'scale-down'):
+        scale = min(scale_x, scale_y)
+        return min(natural, math.ceil(natural_width * scale) * math.ceil(natural_height * scale))
+    return min(natural, math.ceil(image['display_width'] * dpr) * math.ceil(image['display_height'] * dpr))
+
+def summarize_sources(images, resources, decode_ms, dpr):
+    """按图片地址汇总：同一地址只下载和解码一次，所需像素取各处显示中最大的一处"""
+
+    sources = {}
+    for image in images:
+        if not image['src']:
+            continue
+        source = sources.setdefault(image['src'], {
+            'src': image['src'],
+            'natural_pixels': image['natural_width'] * image['natural_height'],
+            'needed_pixels': 0,
+            'uses': 0,
+            'cards': set()
+        })
+        source['needed_pixels'] = max(source['needed_pixels'], needed_pixels(image, dpr))
+        source['uses'] += 1
+        if image['card'] is not None:
+            source['cards'].add(image['card'])
+
+    for source in sources.values():
+        resource = resources.get(source['src'])
+        natural = source['natural_pixels']
+        excess_ratio = 1 - source['needed_pixels'] / natural if natural else 0
+
+        source['cards'] = sorted(source['cards'])
+        source['excess_ratio'] = excess_ratio
+        source['resource'] = resource
+        source['transfer_bytes'] = resource['transfer_size'] if resource else 0
+        source['decoded_body_bytes'] = resource['decoded_body_size'] if resource else 0
+        source['network_ms'] = resource['duration'] if resource else 0
+        source['decode_ms'] = decode_ms.get(source['src'])
+        # 传输浪费按多出的像素比例折算（与 Lighthouse 的 properly-sized images 估算方式相同）；
+        # 解码后的位图每像素 4 字节
+        source['wasted_transfer_bytes'] = round(source['transfer_bytes'] * excess_ratio)
+        source['wasted_bitmap_bytes'] = (natural - source['needed_pixels']) * 4 if natural else 0
+
+    return sources
+
+def summarize_cards(images, sources, card_count):
+    """逐卡片汇总其中的图片；多张卡片共用同一地址时各自计入"""
+
+    cards = [{'card': index, 'images': 0, 'transfer_bytes': 0, 'wasted_transfer_bytes': 0,
+              'wasted_bitmap_bytes': 0, 'network_ms': 0.0, 'decode_ms': 0.0} for index in range(card_count)]
+
+    for image in images:
+        if image['card'] is None or image['src'] not in sources:
+            continue
+        source = sources[image['src']]
+        card = cards[image['card']]
+        card['images'] += 1
+        card['transfer_bytes'] += source['transfer_bytes']
+        card['wasted_transfer_bytes'] += source['wasted_transfer_bytes']
+        card['wasted_bitmap_bytes'] += source['wasted_bitmap_bytes']
+        card['network_ms'] += source['network_ms']
+        card['decode_ms'] += source['decode_ms'] or 0
+
+    return [card for card in cards if card['images']]
+
+def totals_for(sources):
+    return {
+        'sources': len(sources),
+        'transfer_bytes': sum(s['transfer_bytes'] for s in sources),
+        'decoded_body_bytes': sum(s['decoded_body_bytes'] for s in sources),
+        'wasted_transfer_bytes': sum(s['wasted_transfer_bytes'] for s in sources),
+        'wasted_bitmap_bytes': sum(s['wasted_bitmap_bytes'] for s in sources),
+        'network_ms': sum(s['network_ms'] for s in sources),
+        'decode_ms': sum(s['decode_ms'] or 0 for s in sources),
+        'timing_restricted': sum(1 for s in sources if s['resource'] and s['resource']['restricted']),
+        'without_timing': sum(1 for s in sources if not s['resource'])
+    }
+
+async def audit_image_weight(page, card_selectors, decode_limit=100):
+    """一次页面调用采集图片与资源计时，在 Python 中计算浪费字节和卡片汇总"""
+
+    raw = await page.evaluate(
+        js_call(IMAGE_AUDIT_JS, 'auditImages(arg[0], arg[1])'),
+        [card_selectors, decode_limit]
+    )
+    dpr = raw['dpr']
+    images = raw['images']
+    sources = summarize_sources(images, raw['resources'], raw['decode_ms'], dpr)
+
+    # 首屏以下却没有 loading="lazy" 的图片会和首屏内容争抢带宽
+    eager_below_fold = [
+        image for image in images
+        if image['rendered'] and image['loading'] != 'lazy' and image['page_top'] >= raw['viewport_height']
+    ]
+    eager_sources = {image['src'] for image in eager_below_fold if image['src'] in sources}
+
+    card_sources = [source for source in sources.values() if source['cards']]
+
+    return {
+        'dpr': dpr,
+        'viewport_height': raw['viewport_height'],
+        'image_count': len(images),
+        'resource_timing_truncated': raw['resource_timing_truncated'],
+        'totals': totals_for(list(sources.values())),
+        'card_totals': {**totals_for(card_sources), 'cards': raw['card_count']},
+        'cards': summarize_cards(images, sources, raw['card_count']),
+        'eager_below_fold': {
+            'count': len(eager_below_fold),
+            'transfer_bytes': sum(sources[src]['transfer_bytes'] for src in eager_sources),
+            'images': [{'index': image['index'], 'card': image['card'], 'src': image['src'],
+                        'page_top': image['page_top']} for image in eager_below_fold]
+        },
+        'oversized': sorted(
+            [source for source in sources.values() if source['excess_ratio'] > 0],
+            key=lambda source: (-source['wasted_transfer_bytes'], -source['wasted_bitmap_bytes'])
+        ),
+        'decode_measured': len(raw['decode_ms']),
+        'images': images
+    }
+
+def print_image_audit_summary(audit):
+    """打印图片体积审计摘要"""
+
+    totals = audit['totals']
+    card_totals = audit['card_totals']
+    print(f"🖼️ 图片: {audit['image_count']} 张，{totals['sources']} 个地址 (DPR {audit['dpr']})")
+    print(f"  📦 传输 {totals['transfer_bytes'] / 1024:.1f}KB，解码后 {totals['decoded_body_bytes'] / 1024:.1f}KB，"
+          f"网络 {totals['network_ms']:.0f}ms，解码 {totals['decode_ms']:.0f}ms ({audit['decode_measured']} 个地址)")
+    print(f"  🗑️ 尺寸过大浪费: 传输约 {totals['wasted_transfer_bytes'] / 1024:.1f}KB，"
+          f"位图内存 {totals['wasted_bitmap_bytes'] / 1048576:.1f}MB")
+    print(f"  🃏 {card_totals['cards']} 张卡片内的图片: 传输 {card_totals['transfer_bytes'] / 1024:.1f}KB，"
+          f"浪费约 {card_totals['wasted_transfer_bytes'] / 1024:.1f}KB，"
+          f"网络 {card_totals['network_ms']:.0f}ms，解码 {card_totals['decode_ms']:.0f}ms")
+
+    if audit['resource_timing_truncated']:
+        print("  ⚠️ Resource Timing 缓冲区已满，之后加载的图片没有计时，传输字节和总计偏低")
+    if totals['timing_restricted'] or totals['without_timing']:
+        print(f"  ℹ️ {totals['timing_restricted']} 个地址缺少 Timing-Allow-Origin，"
+              f"{totals['without_timing']} 个地址没有资源计时（如 data: 图片），其传输大小按 0 计")
+
+    eager = audit['eager_below_fold']
+    if eager['count']:
+        print(f"  ⚠️ 首屏以下立即加载的图片: {eager['count']} 张，传输 {eager['transfer_bytes'] / 1024:.1f}KB（建议 loading=\"lazy\"）")
+
+    for source in audit['oversized'][:5]:
+        print(f"  ⚠️ {source['src'][:80]}: 多出 {source['excess_ratio']:.0%} 像素，"
+              f"浪费约 {source['wasted_transfer_bytes'] / 1024:.1f}KB 传输 / {source['wasted_bitmap_bytes'] / 1024:.0f}KB 位图")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+向量化几何分析
+基于 DOMSnapshot 的列式布局数组，用 NumPy 一次计算全部节点的溢出、裁剪和缩放
+"""
+
+try:
+    import numpy as np
+except ImportError as e:
+    # 调用方（如 dom_snapshot）捕获 ImportError 后跳过向量化评分
+    raise ImportError("layout_geometry 需要 numpy：pip install numpy（或 pip install -r requirements.txt）") from e
+
+# 定位方式编码
+POSITION_STATIC = 0
+POSITION_RELATIVE = 1
+POSITION_ABSOLUTE = 2
+POSITION_FIXED = 3
+
+ELEMENT_NODE = 1
+
+def layout_arrays(raw, style_keys):
+    """把快照原始数据转换为以节点为下标的列式数组（style_keys 为请求快照时的样式顺序）"""
+
+    strings = raw['strings']
+    document = raw['documents'][0]
+    nodes = document['nodes']
+    layout = document['layout']
+    count = len(nodes['parentIndex'])
+
+    parent = np.asarray(nodes['parentIndex'], dtype=np.int64)
+    node_type = np.asarray(nodes['nodeType'], dtype=np.int64)
+
+    # 每个节点只取第一条布局记录
+    layout_nodes = np.asarray(layout['nodeIndex'], dtype=np.int64)
+    layout_nodes, first = np.unique(layout_nodes, return_index=True)
+    bounds = np.asarray(layout['bounds'], dtype=np.float64).reshape(-1, 4)[first]
+    styles = np.asarray(layout['styles'], dtype=np.int64).reshape(len(layout['nodeIndex']), -1)[first]
+
+    string_ids = {value: i for i, value in enumerate(strings)}
+
+    def style_is(key, value):
+        return styles[:, style_keys.index(key)] == string_ids.get(value, -2)
+
+    has_box = np.zeros(count, dtype=bool)
+    has_box[layout_nodes] = (bounds[:, 2] > 0) | (bounds[:, 3] > 0)
+
+    # 与 getBoundingClientRect 一致的视口坐标
+    left = np.zeros(count)
+    top = np.zeros(count)
+    left[layout_nodes] = bounds[:, 0] - document.get('scrollOffsetX', 0)
+    top[layout_nodes] = bounds[:, 1] - document.get('scrollOffsetY', 0)
+    right = left.copy()
+    bottom = top.copy()
+    right[layout_nodes] += bounds[:, 2]
+    bottom[layout_nodes] += bounds[:, 3]
+
+    clips_x = np.zeros(count, dtype=bool)
+    clips_y = np.zeros(count, dtype=bool)
+    clips_x[layout_nodes] = ~style_is('overflowX', 'visible')
+    clips_y[layout_nodes] = ~style_is('overflowY', 'visible')
+
+    position = np.zeros(count, dtype=np.int8)
+    position[layout_nodes] = np.select(
+        [style_is('position', 'absolute'), style_is('position', 'fixed'), style_is('position', 'static')],
+        [POSITION_ABSOLUTE, POSITION_FIXED, POSITION_STATIC],
+        default=POSITION_RELATIVE
+    )
+
+    # 伪元素和非元素节点不参与报告
+    reportable = (node_type == ELEMENT_NODE) & has_box
+    pseudo = nodes.get('pseudoType', {}).get('index', [])
+    if len(pseudo):
+        reportable[np.asarray(pseudo, dtype=np.int64)] = False
+
+    return {
+        'count': count,
+        'parent': parent,
+        'left': left,
+        'top': top,
+        'right': right,
+        'bottom': bottom,
+        'has_box': has_box,
+        'clips_x': clips_x,
+        'clips_y': clips_y,
+        'position': position,
+        'reportable': reportable
+    }
+
+def node_depths(parent):
+    """指针倍增计算每个节点的深度，迭代次数为 O(log depth)"""
+
+    depth = (parent >= 0).astype(np.int64)
+    ancestor = parent.copy()
+    while True:
+        active = ancestor >= 0
+        if not active.any():
+            return depth
+        target = ancestor[active]
+        depth_next = depth.copy()
+        depth_next[active] += depth[target]
+        ancestor_next = ancestor.copy()
+        ancestor_next[active] = ancestor[target]
+        depth, ancestor = depth_next, ancestor_next
+
+def edge_overlaps(left, top, right, bottom, clip_left, clip_top, clip_right, clip_bottom, tolerance):
+    """矩形超出裁剪矩形各边的距离（向量化）"""
+
+    return {
+        'right': np.maximum(0, right - clip_right - tolerance),
+        'left': np.maximum(0, clip_left - left - tolerance),
+        'bottom': np.maximum(0, bottom - clip_bottom - tolerance),
+        'top': np.maximum(0, clip_top - top - tolerance)
+    }
+
+def propagate_clip_rects(arrays):
+    """逐层向下传播有效裁剪矩形：每层一次向量运算，总计 O(depth) 次"""
+
+    count = arrays['count']
+    parent = arrays['parent']
+    has_box = arrays['has_box']
+    position = arrays['position']
+
+    # 每个节点自身受到的裁剪，以及传给普通子元素和绝对定位后代的裁剪
+    inherited = np.tile([-np.inf, -np.inf, np.inf, np.inf], (count, 1))
+    inherited_owner = np.full(count, -1, dtype=np.int64)
+    child_clip = inherited.copy()
+    child_owner = inherited_owner.copy()
+    abs_clip = inherited.copy()
+    abs_owner = inherited_owner.copy()
+
+    box = np.stack([arrays['left'], arrays['top'], arrays['right'], arrays['bottom']], axis=1)
+    clip_axes = np.stack([arrays['clips_x'], arrays['clips_y'], arrays['clips_x'], arrays['clips_y']], axis=1)
+
+    depth = node_depths(parent)
+    order = np.argsort(depth, kind='stable')
+    boundaries = np.searchsorted(depth[order], np.arange(1, depth.max() + 2))
+
+    for level in range(len(boundaries) - 1):
+        nodes = order[boundaries[level]:boundaries[level + 1]]
+        parents = parent[nodes]
+
+        is_fixed = position[nodes] == POSITION_FIXED
+        is_absolute = position[nodes] == POSITION_ABSOLUTE
+
+        clip = np.where(is_absolute[:, None], abs_clip[parents], child_clip[parents])
+        owner = np.where(is_absolute, abs_owner[parents], child_owner[parents])
+        clip[is_fixed] = [-np.inf, -np.inf, np.inf, np.inf]
+        owner[is_fixed] = -1
+        inherited[nodes] = clip
+        inherited_owner[nodes] = owner
+
+        # 有盒子且 overflow 非 visible 的节点在对应轴上收紧裁剪矩形
+        own_box = box[nodes]
+        axes = clip_axes[nodes] & has_box[nodes][:, None]
+        tightened = np.where(
+            axes,
+            np.concatenate([np.maximum(clip[:, :2], own_box[:, :2]), np.minimum(clip[:, 2:], own_box[:, 2:])], axis=1),
+            clip
+        )
+        child_clip[nodes] = tightened
+        child_owner[nodes] = np.where(axes.any(axis=1), nodes, owner)
+
+        positioned = (position[nodes] != POSITION_STATIC) & has_box[nodes]
+        abs_clip[nodes] = np.where(positioned[:, None], tightened, abs_clip[parents])
+        abs_owner[nodes] = np.where(positioned, child_owner[nodes], abs_owner[parents])
+
+    return inherited, inherited_owner
+
+def score_layout(arrays, tolerance=1):
+    """计算全部节点相对有效裁剪矩形和父元素盒子的溢出量"""
+
+    left, top, right, bottom = arrays['left'], arrays['top'], arrays['right'], arrays['bottom']
+    reportable = arrays['reportable']
+
+    clip, clip_owner = propagate_clip_rects(arrays)
+    clip_overlap = edge_overlaps(left, top, right, bottom,
+                                 clip[:, 0], clip[:, 1], clip[:, 2], clip[:, 3], tolerance)
+    for side in clip_overlap:
+        clip_overlap[side] = np.where(reportable, clip_overlap[side], 0)
+
+    # 与 analyze_element_clipping 相同的直接父元素越界检查
+    parent = arrays['parent']
+    has_parent = (parent >= 0) & reportable
+    safe_parent = np.where(parent >= 0, parent, 0)
+    has_parent &= arrays['has_box'][safe_parent]
+    parent_overlap = edge_overlaps(left, top, right, bottom,
+                                   left[safe_parent], top[safe_parent], right[safe_parent], bottom[safe_parent],
+                                   tolerance)
+    for side in parent_overlap:
+        parent_overlap[side] = np.where(has_parent, parent_overlap[side], 0)
+
+    return {
+        'clip_overlap': clip_overlap,
+        'clip_owner': clip_owner,
+        'parent_overlap': parent_overlap
+    }
+
+def clipping_types(overlap):
+    """按方向统计裁剪类型，与 generate_comprehensive_report 的分类一致"""
+
+    horizontal = (overlap['left'] > 0) | (overlap['right'] > 0)
+    vertical = (overlap['top'] > 0) | (overlap['bottom'] > 0)
+    return {
+        'horizontal': int(np.count_nonzero(horizontal & ~vertical)),
+        'vertical': int(np.count_nonzero(vertical & ~horizontal)),
+        'both': int(np.count_nonzero(horizontal & vertical))
+    }
+
+def total_overlap(overlap):
+    return overlap['right'] + overlap['left'] + overlap['bottom'] + overlap['top']
+
+def image_scales(display_width, display_height, natural_width, natural_height):
+    """批量计算缩放比例和宽高比检查，与 build_avatar_info 的规则一致"""
+
+    display_width = np.asarray(display_width, dtype=np.float64)
+    display_height = np.asarray(display_height, dtype=np.float64)
+    natural_width = np.asarray(natural_width, dtype=np.float64)
+    natural_height = np.asarray(natural_height, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale_x = np.where(natural_width > 0, display_width / natural_width, 1.0)
+        scale_y = np.where(natural_height > 0, display_height / natural_height, 1.0)
+
+    return {
+        'scale_x': scale_x,
+        'scale_y': scale_y,
+        'aspect_ratio_preserved': np.abs(scale_x - scale_y) < 0.1,
+        'is_scaled': (scale_x != 1) | (scale_y != 1)
+    }
+
+def summarize_scores(scores, describe_node, limit=50):
+    """汇总向量化结果，只对溢出最严重的 limit 个节点调用 describe_node 生成描述"""
+
+    clip_total = total_overlap(scores['clip_overlap'])
+    parent_total = total_overlap(scores['parent_overlap'])
+    clipped = np.flatnonzero(clip_total > 0)
+    worst = clipped[np.argsort(-clip_total[clipped], kind='stable')[:limit]]
+
+    return {
+        'clipped_nodes': int(len(clipped)),
+        'clipping_types': clipping_types(scores['clip_overlap']),
+        'nodes_outside_parent': int(np.count_nonzero(parent_total > 0)),
+        'parent_overflow_types': clipping_types(scores['parent_overlap']),
+        'worst_clipped': [
+            {
+                **describe_node(int(node)),
+                'clipped_by': describe_node(int(scores['clip_owner'][node])) if scores['clip_owner'][node] >= 0 else None,
+                'overlap': {side: float(values[node]) for side, values in scores['clip_overlap'].items()},
+                'total_overlap': float(clip_total[node])
+            }
+            for node in worst
+        ]
+    }
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+元素重叠检测
+采集卡片、头像和文本块的盒子，用均匀网格空间索引找出互相重叠的元素对
+"""
+
+import math
+from diagnosis_common import DEDUPE_JS, SELECTOR_JS, js_call
+
+# 采集参与重叠检测的盒子：卡片本身、卡片内的图片和直接包含文本的元素
+OVERLAP_BOXES_JS = DEDUPE_JS + SELECTOR_JS + """
+function collectOverlapBoxes(cardSelectors) {
+    const hasOwnText = el => Array.from(el.childNodes).some(
+        node => node.nodeType === Node.TEXT_NODE && node.textContent.trim()
+    );
+
+    const boxes = [];
+    const seen = new Set();
+    const add = (el, kind, card) => {
+        if (seen.has(el)) return;
+        seen.add(el);
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) return;
+        boxes.push({
+            path: domPathKey(el),
+            kind: kind,
+            card: card,
+            tag_name: el.tagName,
+            class_name: el.getAttribute('class') || '',
+            text: kind === 'text' ? el.textContent.trim().substring(0, 50) : '',
+            rect: { x: rect.x, y: rect.y, width: rect.width, height: rect.height }
+        });
+    };
+
+    const cards = resolveSelectorChain(document, cardSelectors, 'all').matches;
+    // 嵌套匹配时只保留最外层卡片：沿祖先链查集合，O(n·深度) 而不是两两比较
+    const cardSet = new Set(cards);
+    const outerCards = cards.filter(card => {
+        for (let parent = card.parentElement; parent; parent = parent.parentElement) {
+            if (cardSet.has(parent)) return false;
+        }
+        return true;
+    });
+
+    outerCards.forEach((card, cardIndex) => {
+        add(card, 'card', cardIndex);
+        for (const img of card.querySelectorAll('img')) {
+            add(img, 'avatar', cardIndex);
+        }
+        for (const el of card.querySelectorAll('*')) {
+            if (el.tagName !== 'IMG' && hasOwnText(el)) {
+                add(el, 'text', cardIndex);
+            }
+        }
+    });
+
+    return boxes;
+}
+"""
+
+def grid_cell_size(boxes):
+    """取盒子较长边的中位数作为网格边长，使大多数盒子只落入少数几个格子"""
+
+    sides = sorted(max(box['rect']['width'], box['rect']['height']) for box in boxes)
+    return max(sides[len(sides) // 2], 1) if sides else 1
+
+def find_overlapping_pairs(boxes, cell_size=None, min_area=1):
+    """用均匀网格找出所有相交面积不小于 min_area 的盒子对，返回 (i, j, 相交矩形)"""
+
+    cell_size = cell_size or grid_cell_size(boxes)
+
+    def cell_range(low, high):
+        return range(math.floor(low / cell_size), math.floor(high / cell_size) + 1)
+
+    grid = {}
+    for i, box in enumerate(boxes):
+        rect = box['rect']
+        for cx in cell_range(rect['x'], rect['x'] + rect['width']):
+            for cy in cell_range(rect['y'], rect['y'] + rect['height']):
+                grid.setdefault((cx, cy), []).append(i)
+
+    pairs = []
+    for (cx, cy), members in grid.items():
+        for a in range(len(members)):
+            first = boxes[members[a]]['rect']
+            for b in range(a + 1, len(members)):
+                second = boxes[members[b]]['rect']
+
+                left = max(first['x'], second['x'])
+                top = max(first['y'], second['y'])
+                right = min(first['x'] + first['width'], second['x'] + second['width'])
+                bottom = min(first['y'] + first['height'], second['y'] + second['height'])
+                if right <= left or bottom <= top:
+                    continue
+
+                # 同一对盒子可能共享多个格子，只在相交区域左上角所在的格子里报告一次
+                if (math.floor(left / cell_size), math.floor(top / cell_size)) != (cx, cy):
+                    continue
+
+                area = (right - left) * (bottom - top)
+                if area >= min_area:
+                    pairs.append((members[a], members[b], {
+                        'x': left, 'y': top, 'width': right - left, 'height': bottom - top, 'area': area
+                    }))
+
+    return sorted(pairs, key=lambda pair: (pair[0], pair[1]))
+
+def is_ancestor_path(ancestor, path):
+    return path.startswith(ancestor + '>')
+
+def parent_path(path):
+    return path.rsplit('>', 1)[0]
+
+def classify_overlaps(boxes, pairs):
+    """去掉祖先/后代之间必然的包含关系，并把重叠分为兄弟、同卡片和跨卡片三类"""
+
+    overlaps = []
+    for i, j, intersection in pairs:
+        first, second = boxes[i], boxes[j]
+        if is_ancestor_path(first['path'], second['path']) or is_ancestor_path(second['path'], first['path']):
+            continue
+
+        if parent_path(first['path']) == parent_path(second['path']):
+            relation = 'sibling'
+        elif first['card'] == second['card']:
+            relation = 'same_card'
+        else:
+            relation = 'cross_card'
+
+        smaller = min(first['rect']['width'] * first['rect']['height'], second['rect']['width'] * second['rect']['height'])
+        overlaps.append({
+            'relation': relation,
+            'kinds': f"{first['kind']}/{second['kind']}",
+            'first': first,
+            'second': second,
+            'intersection': intersection,
+            'overlap_ratio': intersection['area'] / smaller if smaller > 0 else 0
+        })
+
+    return overlaps
+
+async def detect_layout_overlaps(page, card_selectors, min_area=1):
+    """采集一次盒子并在 Python 中用空间索引检测重叠"""
+
+    boxes = await page.evaluate(js_call(OVERLAP_BOXES_JS, 'collectOverlapBoxes(arg)'), card_selectors)
+    overlaps = classify_overlaps(boxes, find_overlapping_pairs(boxes, min_area=min_area))
+
+    by_relation = {}
+    for overlap in overlaps:
+        by_relation[overlap['relation']] = by_relation.get(overlap['relation'], 0) + 1
+
+    return {
+        'boxes_checked': len(boxes),
+        'overlap_count': len(overlaps),
+        'by_relation': by_relation,
+        'overlaps': overlaps
+    }
+
+def print_overlap_summary(result):
+    """打印重叠检测摘要"""
+
+    print(f"🧱 检查盒子: {result['boxes_checked']} 个，重叠: {result['overlap_count']} 对")
+
+    relation_names = {'sibling': '兄弟元素', 'same_card': '同卡片', 'cross_card': '跨卡片'}
+    for relation, count in result['by_relation'].items():
+        print(f"  • {relation_names.get(relation, relation)}: {count} 对")
+
+    for overlap in sorted(result['overlaps'], key=lambda o: -o['intersection']['area'])[:10]:
+        first, second = overlap['first'], overlap['second']
+        print(f"  ⚠️ {first['kind']} {first['tag_name']} ↔ {second['kind']} {second['tag_name']} "
+              f"({relation_names.get(overlap['relation'], overlap['relation'])}): "
+              f"{overlap['intersection']['area']:.0f}px² ({overlap['overlap_ratio']:.0%})")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+全页布局扫描
+自顶向下遍历一次 DOM，传播祖先的裁剪矩形，找出任意深度被裁剪的元素
+"""
+
+import asyncio
+from playwright.async_api import async_playwright
+import json
+from datetime import datetime
+import sys
+from diagnosis_common import DEDUPE_JS, build_arg_parser, js_call, launch_options, open_page
+from stage_trace import start_trace, trace_step, write_trace
+
+# 单次遍历的裁剪传播：每个节点携带祖先 overflow 非 visible 容器的裁剪矩形交集，
+# 绝对定位元素沿用最近定位祖先处的裁剪，固定定位元素不受祖先裁剪（忽略 transform 形成的包含块）
+CLIP_SCAN_JS = DEDUPE_JS + """
+function scanClipping(root, tolerance, maxResults) {
+    const noClip = { left: -Infinity, top: -Infinity, right: Infinity, bottom: Infinity, owner: null };
+    const finite = value => Number.isFinite(value) ? value : null;
+
+    const results = [];
+    let scanned = 0;
+    let clippedCount = 0;
+
+    const stack = [{ el: root, clip: noClip, absClip: noClip }];
+    while (stack.length) {
+        const { el, clip, absClip } = stack.pop();
+        const style = getComputedStyle(el);
+        if (style.display === 'none') continue;
+        scanned++;
+
+        const position = style.position;
+        const inherited = position === 'fixed' ? noClip : (position === 'absolute' ? absClip : clip);
+        let childClip = inherited;
+        let childAbsClip = absClip;
+
+        // display: contents 没有自己的盒子，子元素直接继承当前裁剪
+        if (style.display !== 'contents') {
+            const rect = el.getBoundingClientRect();
+
+            if (inherited.owner && (rect.width > 0 || rect.height > 0)) {
+                const overlap = {
+                    right: Math.max(0, rect.right - inherited.right - tolerance),
+                    left: Math.max(0, inherited.left - rect.left - tolerance),
+                    bottom: Math.max(0, rect.bottom - inherited.bottom - tolerance),
+                    top: Math.max(0, inherited.top - rect.top - tolerance)
+                };
+                const totalOverlap = overlap.right + overlap.left + overlap.bottom + overlap.top;
+
+                if (totalOverlap > 0) {
+                    clippedCount++;
+                    if (results.length < maxResults) {
+                        results.push({
+                            path: domPathKey(el),
+                            tag_name: el.tagName,
+                            class_name: el.getAttribute('class') || '',
+                            rect: { x: rect.x, y: rect.y, width: rect.width, height: rect.height },
+                            clip_rect: {
+                                left: finite(inherited.left),
+                                top: finite(inherited.top),
+                                right: finite(inherited.right),
+                                bottom: finite(inherited.bottom)
+                            },
+                            clipped_by: domPathKey(inherited.owner),
+                            overlap: overlap,
+                            total_overlap: totalOverlap
+                        });
+                    }
+                }
+            }
+
+            const clipX = style.overflowX !== 'visible';
+            const clipY = style.overflowY !== 'visible';
+            if (clipX || clipY) {
+                childClip = {
+                    left: clipX ? Math.max(inherited.left, rect.left) : inherited.left,
+                    right: clipX ? Math.min(inherited.right, rect.right) : inherited.right,
+                    top: clipY ? Math.max(inherited.top, rect.top) : inherited.top,
+                    bottom: clipY ? Math.min(inherited.bottom, rect.bottom) : inherited.bottom,
+                    owner: el
+                };
+            }
+
+            // 定位元素是其绝对定位后代的包含块
+            if (position !== 'static') {
+                childAbsClip = childClip;
+            }
+        }
+
+        for (let i = el.children.length - 1; i >= 0; i--) {
+            stack.push({ el: el.children[i], clip: childClip, absClip: childAbsClip });
+        }
+    }
+
+    return {
+        nodes_scanned: scanned,
+        clipped_count: clippedCount,
+        truncated: clippedCount > results.length,
+        clipped_elements: results
+    };
+}
+"""
+
+async def scan_page_clipping(page, tolerance=1, max_results=500):
+    """一次遍历整个文档，返回所有超出有效裁剪矩形的元素"""
+
+    return await page.evaluate(
+        js_call(CLIP_SCAN_JS, 'scanClipping(document.documentElement, arg[0], arg[1])'),
+        [tolerance, max_results]
+    )
+
+def print_scan_summary(scan):
+    """打印全页裁剪扫描摘要"""
+
+    print(f"🧭 扫描节点: {scan['nodes_scanned']} 个，被裁剪: {scan['clipped_count']} 个")
+    if scan['truncated']:
+        print(f"  ⚠️ 仅列出前 {len(scan['clipped_elements'])} 个")
+
+    for clipped in scan['clipped_elements'][:20]:
+        overlaps = clipped['overlap']
+        overlap_desc = [f"{direction} {amount:.1f}px" for direction, amount in overlaps.items() if amount > 0]
+        print(f"  ⚠️ {clipped['tag_name']} ({clipped['class_name'][:40]}) 被裁剪: {', '.join(overlap_desc)}")
+        print(f"     裁剪容器: {clipped['clipped_by']}")
+
+async def run_layout_scan(fast=False, url="http://localhost:3000", fixture=None):
+    """打开页面并执行全页裁剪扫描"""
+
+    trace_step('launch')
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=500))
+        page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+
+        try:
+            print("🚀 开始全页裁剪扫描...")
+            await open_page(page, url, fast, settle_ms=3000, fixture=fixture)
+
+            trace_step('clip_scan')
+            scan = await scan_page_clipping(page)
+            print_scan_summary(scan)
+
+            report = {
+                'timestamp': datetime.now().isoformat(),
+                'url': page.url,
+                'viewport': page.viewport_size,
+                'clip_scan': scan
+            }
+
+            with open('layout_scan_report.json', 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print("💾 扫描结果已保存到: layout_scan_report.json")
+
+            return report
+
+        finally:
+            await browser.close()
+
+async def main():
+    """主函数"""
+    args = build_arg_parser('全页裁剪扫描').parse_args()
+    if args.trace:
+        start_trace()
+    try:
+        await run_layout_scan(fast=args.fast, fixture=args.fixture)
+    except KeyboardInterrupt:
+        print("\n⚠️ 扫描被用户中断")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+    finally:
+        if args.trace:
+            write_trace(args.trace)
+
+if __name__ == "__main__":
+    asyncio.run(main())
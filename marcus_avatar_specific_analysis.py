@@ -5,16 +5,31 @@
 
 import asyncio
 from playwright.async_api import async_playwright
-import json
 from datetime import datetime
-
-async def analyze_marcus_avatar():
-    """专门分析 Marcus 头像的显示问题"""
-
+from diagnosis_common import STYLE_CACHE_JS, build_arg_parser, js_call, launch_options, open_page, open_record_stream, print_selector_counts, reset_style_cache, resolve_selectors, with_style_cache, write_record
+from report_codec import write_report
+from result_cache import cached_analysis, evict_cache
+from screenshot_crops import capture_regions
+from stage_trace import start_trace, trace_step, write_trace
+
+# Marcus 头像选择器（dom_snapshot 的快照后端也使用）
+MARCUS_SELECTORS = [
+    'img[alt*="Marcus"]',
+    'img[alt*="marcus"]',
+    '*:has-text("Marcus") img',
+    '[data-testid*="marcus"] img',
+    '[data-testid*="Marcus"] img'
+]
+
+async def analyze_marcus_avatar(fast=False, ndjson_path=None, compact=False, cache=False, fixture=None):
+    """专门分析 Marcus 头像的显示问题（ndjson_path 指定时分析完成即写出记录）"""
+
+    trace_step('launch')
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=1000)
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=1000))
         context = await browser.new_context(viewport={'width': 1920, 'height': 1080})
         page = await context.new_page()
+        stream = open_record_stream(ndjson_path)
 
         try:
             print("🎯 开始 Marcus 头像专项分析...")
@@ -22,121 +37,9 @@ async def analyze_marcus_avatar():
 
             # 导航到页面
             print("\n📍 步骤1: 导航到页面")
-            await page.goto("http://localhost:3000", wait_until="networkidle")
-            await page.wait_for_timeout(5000)  # 等待页面完全加载
-
-            # 查找 Marcus 相关的头像
-            print("\n🔍 步骤2: 查找 Marcus 头像")
-
-            marcus_selectors = [
-                'img[alt*="Marcus"]',
-                'img[alt*="marcus"]',
-                '*:has-text("Marcus") img',
-                '[data-testid*="marcus"] img',
-                '[data-testid*="Marcus"] img'
-            ]
-
-            marcus_avatars = []
-            for selector in marcus_selectors:
-                try:
-                    avatars = await page.query_selector_all(selector)
-                    if avatars:
-                        marcus_avatars.extend(avatars)
-                        print(f"📊 选择器 '{selector}' 找到 {len(avatars)} 个 Marcus 头像")
-                except:
-                    continue
-
-            if not marcus_avatars:
-                print("❌ 未找到 Marcus 头像，尝试查找 VoiceCard 中的头像...")
-
-                # 查找第一个 VoiceCard 中的头像（假设 Marcus 是第一个）
-                voice_cards = await page.query_selector_all('[class*="MuiBox-root"]:has(img)')
-                for card in voice_cards:
-                    # 检查卡片是否包含 Marcus 文本
-                    card_text = await card.text_content()
-                    if card_text and 'marcus' in card_text.lower():
-                        avatar = await card.query_selector('img')
-                        if avatar:
-                            marcus_avatars.append(avatar)
-                            print(f"📊 在包含 Marcus 的卡片中找到头像")
-                            break
-
-            if not marcus_avatars:
-                print("❌ 仍然未找到 Marcus 头像，分析所有头像中的第一个...")
-                all_avatars = await page.query_selector_all('img[src*="https"]')
-                if all_avatars:
-                    marcus_avatars = [all_avatars[0]]  # 使用第一个头像作为 Marcus
-                    print(f"📊 使用第一个头像作为 Marcus 的代表")
-
-            if not marcus_avatars:
-                print("❌ 完全未找到头像，退出分析")
-                return None
-
-            # 分析 Marcus 头像
-            print(f"\n🔬 步骤3: 深度分析 Marcus 头像")
-
-            marcus_avatar = marcus_avatars[0]  # 使用第一个找到的头像
-            detailed_analysis = await perform_comprehensive_avatar_analysis(page, marcus_avatar)
-
-            if detailed_analysis:
-                # 截图分析
-                print("\n📸 步骤4: 截图分析")
-
-                # 获取头像的边界框
-                bbox = detailed_analysis['basic_info']['bounding_box']
-
-                # 截取头像区域
-                await page.screenshot(
-                    path='marcus_avatar_closeup.png',
-                    clip={
-                        'x': bbox['x'] - 10,
-                        'y': bbox['y'] - 10,
-                        'width': bbox['width'] + 20,
-                        'height': bbox['height'] + 20
-                    }
-                )
-                print("📸 已保存 Marcus 头像特写: marcus_avatar_closeup.png")
-
-                # 截取整个 VoiceCard
-                if detailed_analysis.get('layout_analysis') and detailed_analysis['layout_analysis'].get('found'):
-                    card_bbox = detailed_analysis['layout_analysis']['bounding_box']
-                    await page.screenshot(
-                        path='marcus_voice_card.png',
-                        clip={
-                            'x': card_bbox['x'],
-                            'y': card_bbox['y'],
-                            'width': card_bbox['width'],
-                            'height': card_bbox['height']
-                        }
-                    )
-                    print("📸 已保存 Marcus VoiceCard: marcus_voice_card.png")
-
-                # 生成综合报告
-                print(f"\n📋 步骤5: 生成 Marcus 头像分析报告")
-
-                report = generate_marcus_specific_report(detailed_analysis)
-
-                # 保存详细分析结果
-                diagnostic_data = {
-                    'timestamp': datetime.now().isoformat(),
-                    'marcus_avatar_analysis': detailed_analysis,
-                    'report': report,
-                    'analysis_context': {
-                        'page_url': page.url,
-                        'page_title': await page.title(),
-                        'viewport': {'width': 1920, 'height': 1080}
-                    }
-                }
-
-                with open('marcus_avatar_detailed_analysis.json', 'w', encoding='utf-8') as f:
-                    json.dump(diagnostic_data, f, indent=2, ensure_ascii=False)
+            await open_page(page, "http://localhost:3000", fast, settle_ms=5000, fixture=fixture)
 
-                print("💾 详细分析已保存到: marcus_avatar_detailed_analysis.json")
-
-                # 打印综合报告
-                print_marcus_analysis_report(report)
-
-                return diagnostic_data
+            return await run_marcus_analysis(page, stream=stream, compact=compact, cache=cache)
 
         except Exception as e:
             print(f"❌ Marcus 头像分析失败: {str(e)}")
@@ -145,10 +48,124 @@ async def analyze_marcus_avatar():
             return None
 
         finally:
-            print("\n🏁 分析完成，将在3秒后关闭浏览器...")
-            await page.wait_for_timeout(3000)
+            if not fast:
+                print("\n🏁 分析完成，将在3秒后关闭浏览器...")
+                await page.wait_for_timeout(3000)
+            if stream:
+                stream.close()
+            if cache:
+                evict_cache()
             await browser.close()
 
+async def run_marcus_analysis(page, stream=None, compact=False, cache=False):
+    """在已加载的页面上执行 Marcus 头像分析（步骤2-5），供单独运行和统一运行器共用"""
+
+    # 新一轮分析，祖先链遍历共用的样式缓存从空开始
+    await reset_style_cache(page)
+
+    # 查找 Marcus 相关的头像
+    print("\n🔍 步骤2: 查找 Marcus 头像")
+    trace_step('avatar_discovery')
+
+    # 多个选择器可能命中同一头像，解析时在页面内按节点身份去重
+    resolution = await resolve_selectors(page, MARCUS_SELECTORS)
+    print_selector_counts(resolution, ' Marcus 头像')
+    marcus_avatars = resolution['matches']
+
+    if not marcus_avatars:
+        print("❌ 未找到 Marcus 头像，尝试查找 VoiceCard 中的头像...")
+
+        # 第一个包含 Marcus 文本的卡片中的第一张图片，文本匹配在页面内完成，不再逐个读取卡片文本
+        card_resolution = await resolve_selectors(page, ['[class*="MuiBox-root"]:has(img):has-text("marcus") img'], limit=1)
+        if card_resolution['matches']:
+            marcus_avatars = card_resolution['matches']
+            print(f"📊 在包含 Marcus 的卡片中找到头像")
+
+    if not marcus_avatars:
+        print("❌ 仍然未找到 Marcus 头像，分析所有头像中的第一个...")
+        all_avatars = await page.query_selector_all('img[src*="https"]')
+        if all_avatars:
+            marcus_avatars = [all_avatars[0]]  # 使用第一个头像作为 Marcus
+            print(f"📊 使用第一个头像作为 Marcus 的代表")
+
+    if not marcus_avatars:
+        print("❌ 完全未找到头像，退出分析")
+        return None
+
+    # 分析 Marcus 头像
+    print(f"\n🔬 步骤3: 深度分析 Marcus 头像")
+    trace_step('deep_analysis')
+
+    marcus_avatar = marcus_avatars[0]  # 使用第一个找到的头像
+    if cache:
+        detailed_analysis = await cached_marcus_analysis(page, marcus_avatar)
+    else:
+        detailed_analysis = await perform_comprehensive_avatar_analysis(page, marcus_avatar)
+
+    if detailed_analysis:
+        write_record(stream, 'marcus_avatar', detailed_analysis)
+
+        # 截图分析
+        print("\n📸 步骤4: 截图分析")
+        trace_step('screenshots')
+
+        # 获取头像的边界框
+        bbox = detailed_analysis['basic_info']['bounding_box']
+
+        # 头像区域
+        regions = [('marcus_avatar_closeup.png', {
+            'x': bbox['x'] - 10,
+            'y': bbox['y'] - 10,
+            'width': bbox['width'] + 20,
+            'height': bbox['height'] + 20
+        })]
+
+        # 整个 VoiceCard
+        if detailed_analysis.get('layout_analysis') and detailed_analysis['layout_analysis'].get('found'):
+            card_bbox = detailed_analysis['layout_analysis']['bounding_box']
+            regions.append(('marcus_voice_card.png', {
+                'x': card_bbox['x'],
+                'y': card_bbox['y'],
+                'width': card_bbox['width'],
+                'height': card_bbox['height']
+            }))
+
+        # 一次截图，两个区域在进程内裁剪
+        saved = await capture_regions(page, regions)
+        if 'marcus_avatar_closeup.png' in saved:
+            print("📸 已保存 Marcus 头像特写: marcus_avatar_closeup.png")
+        if 'marcus_voice_card.png' in saved:
+            print("📸 已保存 Marcus VoiceCard: marcus_voice_card.png")
+
+        # 生成综合报告
+        print(f"\n📋 步骤5: 生成 Marcus 头像分析报告")
+        trace_step('report')
+
+        report = generate_marcus_specific_report(detailed_analysis)
+        write_record(stream, 'marcus_summary', {key: value for key, value in report.items() if key != 'technical_details'})
+
+        # 保存详细分析结果
+        diagnostic_data = {
+            'timestamp': datetime.now().isoformat(),
+            'marcus_avatar_analysis': detailed_analysis,
+            'report': report,
+            'analysis_context': {
+                'page_url': page.url,
+                'page_title': await page.title(),
+                'viewport': page.viewport_size
+            }
+        }
+
+        trace_step('serialization')
+        write_report('marcus_avatar_detailed_analysis.json', diagnostic_data, compact)
+
+        print("💾 详细分析已保存到: marcus_avatar_detailed_analysis.json")
+
+        # 打印综合报告
+        print_marcus_analysis_report(report)
+
+        return diagnostic_data
+
 async def perform_comprehensive_avatar_analysis(page, avatar):
     """对头像进行全面的综合分析"""
 
@@ -277,16 +294,16 @@ async def get_basic_avatar_info(page, avatar):
 async def analyze_parent_containers(page, avatar):
     """分析所有父容器"""
 
-    containers_info = await page.evaluate('''
+    containers_info = await page.evaluate(with_style_cache('''
         img => {
             const containers = [];
             let current = img.parentElement;
             let level = 0;
 
             while (current && current !== document.body && level < 10) {
-                const rect = current.getBoundingClientRect();
-                const imgRect = img.getBoundingClientRect();
-                const style = getComputedStyle(current);
+                const rect = cachedRect(current);
+                const imgRect = cachedRect(img);
+                const style = cachedStyle(current);
 
                 const container = {
                     level: level,
@@ -359,7 +376,7 @@ async def analyze_parent_containers(page, avatar):
                 clipping_containers: containers.filter(c => c.clipsImage)
             };
         }
-    ''', avatar)
+    '''), avatar)
 
     return containers_info
 
@@ -425,6 +442,34 @@ async def analyze_layout_context(page, avatar):
 
     return layout_info
 
+# 每次运行都应重新测量的字段：渲染性能探针的计时和分析时间戳，不写入结果缓存
+VOLATILE_FIELDS = ('render_analysis', 'analysis_timestamp')
+
+async def cached_marcus_analysis(page, avatar):
+    """带结果缓存的综合分析：缓存只保存与 DOM 指纹对应的结构性结果，
+    计时和时间戳在命中时重新测量，未命中时沿用本次分析的值"""
+
+    fresh = {}
+
+    async def compute():
+        analysis = await perform_comprehensive_avatar_analysis(page, avatar)
+        if analysis is None:
+            return None
+        for field in VOLATILE_FIELDS:
+            fresh[field] = analysis.pop(field)
+        return analysis
+
+    analysis = await cached_analysis(page, avatar, 'marcus_avatar', None, compute)
+    if analysis is None:
+        return None
+
+    if not fresh:
+        fresh = {
+            'render_analysis': await analyze_render_performance(page, avatar),
+            'analysis_timestamp': datetime.now().isoformat()
+        }
+    return {**analysis, **fresh}
+
 async def analyze_render_performance(page, avatar):
     """分析渲染性能"""
 
@@ -433,10 +478,12 @@ async def analyze_render_performance(page, avatar):
             const start = performance.now();
 
             // 强制重绘
+            // 会改动页面，run_all_diagnostics 在只读诊断结束后才运行本项；恢复原有的内联 display
             const rect = img.getBoundingClientRect();
+            const previousDisplay = img.style.display;
             img.style.display = 'none';
             img.offsetHeight; // 强制重排
-            img.style.display = '';
+            img.style.display = previousDisplay;
 
             const end = performance.now();
 
@@ -456,13 +503,13 @@ async def analyze_render_performance(page, avatar):
 async def analyze_detailed_constraints(page, avatar):
     """分析详细的约束条件"""
 
-    constraints_info = await page.evaluate('''
+    constraints_info = await page.evaluate(with_style_cache('''
         img => {
             const constraints = [];
             let current = img.parentElement;
 
             while (current && current !== document.body) {
-                const style = getComputedStyle(current);
+                const style = cachedStyle(current);
                 const constraint = {
                     tagName: current.tagName,
                     className: current.className,
@@ -529,7 +576,7 @@ async def analyze_detailed_constraints(page, avatar):
                 )
             };
         }
-    ''', avatar)
+    '''), avatar)
 
     return constraints_info
 
@@ -565,49 +612,52 @@ async def analyze_visual_properties(page, avatar):
 
     return visual_info
 
-async def check_avatar_clipping(page, avatar):
-    """检查头像是否被裁剪"""
-
-    clipping_info = await page.evaluate('''
-        img => {
-            const imgRect = img.getBoundingClientRect();
-            let current = img.parentElement;
-            let maxClipping = { right: 0, left: 0, bottom: 0, top: 0 };
-            let isClipped = false;
+# 沿祖先链检查头像是否被 overflow 非 visible 的容器裁剪，也供断点查找等模块复用（依赖 STYLE_CACHE_JS）
+AVATAR_CLIPPING_JS = """
+function checkAvatarClipping(img) {
+    const imgRect = cachedRect(img);
+    let current = img.parentElement;
+    let maxClipping = { right: 0, left: 0, bottom: 0, top: 0 };
+    let isClipped = false;
+
+    while (current && current !== document.body) {
+        const currentRect = cachedRect(current);
+        const style = cachedStyle(current);
+
+        if (style.overflow !== 'visible') {
+            const clipping = {
+                right: Math.max(0, imgRect.right - currentRect.right),
+                left: Math.max(0, currentRect.left - imgRect.left),
+                bottom: Math.max(0, imgRect.bottom - currentRect.bottom),
+                top: Math.max(0, currentRect.top - imgRect.top)
+            };
 
-            while (current && current !== document.body) {
-                const currentRect = current.getBoundingClientRect();
-                const style = getComputedStyle(current);
+            const totalClipping = clipping.right + clipping.left + clipping.bottom + clipping.top;
+            if (totalClipping > 0) {
+                isClipped = true;
+                // 保留最大裁剪量
+                maxClipping.right = Math.max(maxClipping.right, clipping.right);
+                maxClipping.left = Math.max(maxClipping.left, clipping.left);
+                maxClipping.bottom = Math.max(maxClipping.bottom, clipping.bottom);
+                maxClipping.top = Math.max(maxClipping.top, clipping.top);
+            }
+        }
 
-                if (style.overflow !== 'visible') {
-                    const clipping = {
-                        right: Math.max(0, imgRect.right - currentRect.right),
-                        left: Math.max(0, currentRect.left - imgRect.left),
-                        bottom: Math.max(0, imgRect.bottom - currentRect.bottom),
-                        top: Math.max(0, currentRect.top - imgRect.top)
-                    };
+        current = current.parentElement;
+    }
 
-                    const totalClipping = clipping.right + clipping.left + clipping.bottom + clipping.top;
-                    if (totalClipping > 0) {
-                        isClipped = true;
-                        // 保留最大裁剪量
-                        maxClipping.right = Math.max(maxClipping.right, clipping.right);
-                        maxClipping.left = Math.max(maxClipping.left, clipping.left);
-                        maxClipping.bottom = Math.max(maxClipping.bottom, clipping.bottom);
-                        maxClipping.top = Math.max(maxClipping.top, clipping.top);
-                    }
-                }
+    return {
+        is_clipped: isClipped,
+        details: maxClipping,
+        total_clipping: maxClipping.right + maxClipping.left + maxClipping.bottom + maxClipping.top
+    };
+}
+"""
 
-                current = current.parentElement;
-            }
+async def check_avatar_clipping(page, avatar):
+    """检查头像是否被裁剪"""
 
-            return {
-                is_clipped: isClipped,
-                details: maxClipping,
-                total_clipping: maxClipping.right + maxClipping.left + maxClipping.bottom + maxClipping.top
-            };
-        }
-    ''', avatar)
+    clipping_info = await page.evaluate(js_call(STYLE_CACHE_JS + AVATAR_CLIPPING_JS, 'checkAvatarClipping(arg)'), avatar)
 
     return clipping_info
 
@@ -763,8 +813,12 @@ def print_marcus_analysis_report(report):
 
 async def main():
     """主函数"""
+    args = build_arg_parser('Marcus 头像专项分析', report_options=True).parse_args()
+    if args.trace:
+        start_trace()
     try:
-        result = await analyze_marcus_avatar()
+        result = await analyze_marcus_avatar(fast=args.fast, ndjson_path=args.ndjson, compact=args.compact, cache=args.cache,
+                                             fixture=args.fixture)
         if result:
             print("\n✅ Marcus 头像分析成功完成!")
             print("📁 生成的文件:")
@@ -777,6 +831,9 @@ async def main():
         print("\n⚠️ 分析被用户中断")
     except Exception as e:
         print(f"\n❌ 发生未预期的错误: {e}")
+    finally:
+        if args.trace:
+            write_trace(args.trace)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+紧凑报告编码
+把报告中重复出现的计算样式字典放入共享样式表，记录只保存表引用和与基准不同的值；
+完全相同的大段子树（如 detailed_analysis 与 analysis_results）只保存一次；
+load_report 读取时展开回原有结构
+"""
+
+import json
+import sys
+from collections import Counter
+
+COMPACT_FORMAT = 'compact-style-table'
+COMPACT_VERSION = 2
+
+# 存放计算样式（或同类扁平样式字典）的字段名
+STYLE_FIELDS = {
+    'computed_styles',
+    'styles',
+    'parent_style',
+    'sizeConstraints',
+    'size_constraints',
+    'layout_constraints',
+    'visual_constraints',
+    'computedBodyStyles',
+    'computedHtmlStyles'
+}
+
+STYLE_REF = '$style'
+STYLE_DIFF = '$diff'
+SHARED_REF = '$ref'
+
+# 原报告中以 $ 开头的字段名编码时再加一个 $，展开时去掉，避免被误认为 $ref / $style / $diff（版本 2 起）
+ESCAPE_PREFIX = '$'
+
+def escape_key(key):
+    return ESCAPE_PREFIX + key if isinstance(key, str) and key.startswith(ESCAPE_PREFIX) else key
+
+def unescape_key(key):
+    return key[1:] if isinstance(key, str) and key.startswith(ESCAPE_PREFIX * 2) else key
+
+# 序列化后不短于该长度且出现多次的子树放入共享表
+MIN_SHARED_SIZE = 256
+
+def is_style_dict(key, value):
+    """只对字段名在 STYLE_FIELDS 中、值全为标量的字典做驻留"""
+    return (key in STYLE_FIELDS and isinstance(value, dict) and value and
+            all(v is None or isinstance(v, (str, int, float, bool)) for v in value.values()))
+
+def collect_style_dicts(node, found, key=None):
+    """按键集合分组收集报告中的全部样式字典"""
+
+    if isinstance(node, dict):
+        if is_style_dict(key, node):
+            found.setdefault(tuple(node), []).append(node)
+            return
+        for child_key, child in node.items():
+            collect_style_dicts(child, found, child_key)
+    elif isinstance(node, list):
+        for child in node:
+            collect_style_dicts(child, found, key)
+
+def build_style_table(report):
+    """每组键集合取各属性出现最多的值作为基准样式"""
+
+    groups = {}
+    collect_style_dicts(report, groups)
+
+    table = []
+    table_index = {}
+    for keys, dicts in groups.items():
+        base = {}
+        for key in keys:
+            values = Counter(json.dumps(d[key]) for d in dicts)
+            base[key] = json.loads(values.most_common(1)[0][0])
+        table_index[keys] = len(table)
+        table.append(base)
+
+    return table, table_index
+
+def encode_node(node, table, table_index, key=None):
+    if isinstance(node, dict):
+        if is_style_dict(key, node):
+            ref = table_index[tuple(node)]
+            base = table[ref]
+            encoded = {STYLE_REF: ref}
+            diff = {k: v for k, v in node.items() if v != base[k]}
+            if diff:
+                encoded[STYLE_DIFF] = diff
+            return encoded
+        return {escape_key(k): encode_node(v, table, table_index, k) for k, v in node.items()}
+    if isinstance(node, list):
+        return [encode_node(item, table, table_index, key) for item in node]
+    return node
+
+def subtree_key(node):
+    """可共享的子树（字典、列表、长字符串）返回其序列化结果，否则返回 None"""
+
+    if isinstance(node, (dict, list, str)):
+        key = json.dumps(node, ensure_ascii=False)
+        if len(key) >= MIN_SHARED_SIZE:
+            return key
+    return None
+
+def count_subtrees(node, counts):
+    key = subtree_key(node)
+    if key is not None:
+        counts[key] += 1
+        # 重复出现的子树，其内部在首次出现时已经计数
+        if counts[key] > 1:
+            return
+    children = node.values() if isinstance(node, dict) else node if isinstance(node, list) else ()
+    for child in children:
+        count_subtrees(child, counts)
+
+def share_node(node, counts, shared, shared_index):
+    key = subtree_key(node)
+    if key is not None and counts[key] > 1:
+        if key not in shared_index:
+            shared_index[key] = len(shared)
+            shared.append(None)
+            shared[shared_index[key]] = share_children(node, counts, shared, shared_index)
+        return {SHARED_REF: shared_index[key]}
+    return share_children(node, counts, shared, shared_index)
+
+def share_children(node, counts, shared, shared_index):
+    if isinstance(node, dict):
+        return {k: share_node(v, counts, shared, shared_index) for k, v in node.items()}
+    if isinstance(node, list):
+        return [share_node(item, counts, shared, shared_index) for item in node]
+    return node
+
+def compact_report(report):
+    """把报告编码为带共享样式表和共享子树表的紧凑格式；expand_report 可无损还原，
+    包括恰好以 $ref / $style / $diff 为字段名的字典：
+
+    >>> report = {'$ref': 0, 'item': {'$style': 'x', '$$diff': [1]}, 'styles': {'$diff': 'a', 'color': 'red'}}
+    >>> expand_report(compact_report(report)) == report
+    True
+    """
+
+    table, table_index = build_style_table(report)
+    encoded = encode_node(report, table, table_index)
+
+    counts = Counter()
+    count_subtrees(encoded, counts)
+    shared = []
+    encoded = share_node(encoded, counts, shared, {})
+
+    return {
+        'format': COMPACT_FORMAT,
+        'version': COMPACT_VERSION,
+        'style_table': table,
+        'shared': shared,
+        'report': encoded
+    }
+
+def expand_node(node, data, expanded):
+    if isinstance(node, dict):
+        if SHARED_REF in node:
+            ref = node[SHARED_REF]
+            if ref not in expanded:
+                expanded[ref] = expand_node(data['shared'][ref], data, expanded)
+            return expanded[ref]
+        if STYLE_REF in node:
+            return {**data['style_table'][node[STYLE_REF]], **node.get(STYLE_DIFF, {})}
+        unescape = unescape_key if data.get('version', 1) >= 2 else (lambda k: k)
+        return {unescape(k): expand_node(v, data, expanded) for k, v in node.items()}
+    if isinstance(node, list):
+        return [expand_node(item, data, expanded) for item in node]
+    return node
+
+def expand_report(data):
+    """把紧凑格式展开回原有结构；不是紧凑格式时原样返回"""
+
+    if not isinstance(data, dict) or data.get('format') != COMPACT_FORMAT:
+        return data
+    return expand_node(data['report'], data, {})
+
+def write_report(path, report, compact=False):
+    """写出报告：compact=True 时写紧凑格式（不缩进），否则保持原有的缩进 JSON"""
+
+    with open(path, 'w', encoding='utf-8') as f:
+        if compact:
+            json.dump(compact_report(report), f, ensure_ascii=False, separators=(',', ':'))
+        else:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+def load_report(path):
+    """读取报告，两种格式都返回原有结构"""
+
+    with open(path, encoding='utf-8') as f:
+        return expand_report(json.load(f))
+
+def main():
+    """把已有报告转换为紧凑格式：python report_codec.py 输入.json 输出.json"""
+
+    if len(sys.argv) != 3:
+        print("用法: python report_codec.py <输入报告.json> <输出报告.json>")
+        sys.exit(1)
+
+    source, target = sys.argv[1], sys.argv[2]
+    report = load_report(source)
+    write_report(target, report, compact=True)
+
+    original_size = len(json.dumps(report, indent=2, ensure_ascii=False).encode('utf-8'))
+    with open(target, 'rb') as f:
+        compact_size = len(f.read())
+    print(f"📦 {source}: {original_size} → {compact_size} 字节 ({compact_size / original_size:.1%})")
+
+if __name__ == "__main__":
+    main()
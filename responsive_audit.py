@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+VoiceCard 响应式审计
+在视口 × 设备像素比矩阵上并发运行卡片裁剪和头像缩放分析，或二分查找裁剪断点
+"""
+
+import argparse
+import asyncio
+from playwright.async_api import async_playwright
+import json
+import os
+from datetime import datetime
+import sys
+from diagnosis_common import DEDUPE_JS, SELECTOR_JS, STYLE_CACHE_JS, js_call, launch_options, open_page, wait_for_page_ready
+from voicepanel_diagnosis import CARD_SELECTORS, CLIPPING_JS, analyze_all_cards_batch
+from marcus_avatar_specific_analysis import AVATAR_CLIPPING_JS
+
+# 默认视口（桌面、笔记本、平板横竖屏、手机）和设备像素比
+DEFAULT_VIEWPORTS = [
+    {'width': 1920, 'height': 1080},
+    {'width': 1440, 'height': 900},
+    {'width': 1024, 'height': 768},
+    {'width': 768, 'height': 1024},
+    {'width': 390, 'height': 844}
+]
+
+DEFAULT_SCALE_FACTORS = [1, 2, 3]
+
+async def run_matrix_audit(viewports=None, scale_factors=None, concurrency=4,
+                           url="http://localhost:3000", fast=True, screenshot_dir=None):
+    """在每个视口 × DPR 单元上并发执行卡片与头像分析，返回每个单元的结果；
+    指定 screenshot_dir 时每个单元额外保存整页截图和同名的区域报告，供 visual_diff 目录模式对比"""
+
+    viewports = viewports or DEFAULT_VIEWPORTS
+    scale_factors = scale_factors or DEFAULT_SCALE_FACTORS
+    cells = [(viewport, dpr) for viewport in viewports for dpr in scale_factors]
+    if screenshot_dir:
+        os.makedirs(screenshot_dir, exist_ok=True)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=500))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        try:
+            print(f"🧮 审计 {len(cells)} 个单元 (并发 {concurrency})")
+            results = await asyncio.gather(
+                *(audit_cell(browser, semaphore, url, viewport, dpr, fast, screenshot_dir) for viewport, dpr in cells)
+            )
+        finally:
+            await browser.close()
+
+    return results
+
+def cell_name(viewport, dpr):
+    return f"{viewport['width']}x{viewport['height']}@{dpr}x"
+
+def save_cell_report(screenshot_dir, viewport, dpr, cards):
+    """写出与截图同名的区域报告：结构与 voicepanel 诊断报告的 analysis_results 一致，并记录 DPR"""
+
+    path = os.path.join(screenshot_dir, cell_name(viewport, dpr) + '.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'viewport': viewport, 'device_scale_factor': dpr, 'analysis_results': cards},
+                  f, indent=2, ensure_ascii=False)
+    return path
+
+async def audit_cell(browser, semaphore, url, viewport, dpr, fast, screenshot_dir=None):
+    """在独立的浏览器上下文中审计单个视口 × DPR 单元"""
+
+    async with semaphore:
+        context = await browser.new_context(viewport=viewport, device_scale_factor=dpr)
+        try:
+            page = await context.new_page()
+            await open_page(page, url, fast, settle_ms=3000)
+            batch_result = await analyze_all_cards_batch(page, CARD_SELECTORS)
+            cell = summarize_cell(viewport, dpr, batch_result['cards'])
+            if screenshot_dir:
+                # 页面停在顶部，卡片框的视口坐标即整页坐标，整页截图覆盖视口外的卡片
+                cell['screenshot'] = os.path.join(screenshot_dir, cell_name(viewport, dpr) + '.png')
+                await page.screenshot(path=cell['screenshot'], full_page=True)
+                cell['region_report'] = save_cell_report(screenshot_dir, viewport, dpr, batch_result['cards'])
+            print(f"  ✅ {viewport['width']}x{viewport['height']} @{dpr}x: {cell['cards_with_clipping']}/{cell['total_cards']} 张卡片有裁剪")
+            return cell
+
+        except Exception as e:
+            print(f"  ❌ {viewport['width']}x{viewport['height']} @{dpr}x 审计失败: {e}")
+            return {
+                'viewport': viewport,
+                'device_scale_factor': dpr,
+                'status': 'error',
+                'error': str(e)
+            }
+
+        finally:
+            await context.close()
+
+def summarize_cell(viewport, dpr, cards):
+    """统计单元内的裁剪和头像缩放情况"""
+
+    avatars = [card['avatar_info'] for card in cards if card['avatar_info']]
+
+    # 头像原图像素不足以覆盖 显示尺寸 × DPR 时，在该屏幕上会发虚
+    upscaled_avatars = sum(
+        1 for avatar in avatars
+        if avatar['scale_x'] * dpr > 1 or avatar['scale_y'] * dpr > 1
+    )
+
+    clipped_avatars = sum(
+        1 for card in cards
+        if any(clipped['tag_name'] == 'IMG' for clipped in card['clipping_analysis']['clipped_elements'])
+    )
+
+    return {
+        'viewport': viewport,
+        'device_scale_factor': dpr,
+        'status': 'completed',
+        'total_cards': len(cards),
+        'cards_with_clipping': sum(1 for card in cards if card['has_clipping']),
+        'total_clipped_elements': sum(len(card['clipping_analysis']['clipped_elements']) for card in cards),
+        'total_avatars': len(avatars),
+        'clipped_avatars': clipped_avatars,
+        'aspect_ratio_issues': sum(1 for avatar in avatars if not avatar['aspect_ratio_preserved']),
+        'upscaled_avatars': upscaled_avatars,
+        'max_avatar_scale': max((max(a['scale_x'], a['scale_y']) for a in avatars), default=0)
+    }
+
+def print_matrix_table(results):
+    """以表格形式打印每个单元的结果"""
+
+    print("\n" + "="*80)
+    print("📋 响应式审计矩阵")
+    print("="*80)
+    print(f"{'视口':>12} {'DPR':>4} {'卡片':>6} {'裁剪卡片':>8} {'裁剪元素':>8} {'头像':>6} {'头像裁剪':>8} {'比例异常':>8} {'发虚':>6}")
+
+    for cell in results:
+        viewport = f"{cell['viewport']['width']}x{cell['viewport']['height']}"
+        if cell['status'] != 'completed':
+            print(f"{viewport:>12} {cell['device_scale_factor']:>4} ❌ {cell['error']}")
+            continue
+        print(f"{viewport:>12} {cell['device_scale_factor']:>4} {cell['total_cards']:>6} "
+              f"{cell['cards_with_clipping']:>8} {cell['total_clipped_elements']:>8} "
+              f"{cell['total_avatars']:>6} {cell['clipped_avatars']:>8} "
+              f"{cell['aspect_ratio_issues']:>8} {cell['upscaled_avatars']:>6}")
+
+    print("="*80)
+
+# 断点查找的判定函数：对全部卡片运行 analyzeClipping、对卡片内头像运行 checkAvatarClipping，
+# 返回当前宽度下被裁剪元素的稳定键列表
+CLIPPING_STATE_JS = DEDUPE_JS + SELECTOR_JS + STYLE_CACHE_JS + CLIPPING_JS + AVATAR_CLIPPING_JS + """
+function clippingState(cardSelectors) {
+    // 每个宽度是一轮独立的分析
+    resetStyleCache();
+
+    const cards = resolveSelectorChain(document, cardSelectors, 'all').matches;
+
+    const clipped = [];
+    const images = [];
+    for (const card of cards) {
+        const cardKey = domPathKey(card);
+        for (const child of analyzeClipping(card).clipped_elements) {
+            clipped.push('child ' + cardKey + ' > ' + child.tag_name + '[' + child.index + ']');
+        }
+        images.push(...card.querySelectorAll('img'));
+    }
+
+    for (const img of uniqueNodes(images)) {
+        if (checkAvatarClipping(img).is_clipped) {
+            clipped.push('avatar ' + domPathKey(img));
+        }
+    }
+
+    return clipped;
+}
+"""
+
+async def find_clipping_breakpoints(page, min_width=320, max_width=1920, step=64, height=1080):
+    """在同一页面上调整宽度并二分查找每个元素开始或停止被裁剪的精确宽度"""
+
+    states = {}
+
+    async def state_at(width):
+        if width not in states:
+            await page.set_viewport_size({'width': width, 'height': height})
+            await wait_for_page_ready(page, timeout_ms=2000)
+            keys = await page.evaluate(js_call(CLIPPING_STATE_JS, 'clippingState(arg)'), CARD_SELECTORS)
+            states[width] = frozenset(keys)
+        return states[width]
+
+    transitions = []
+
+    async def bisect(low, high):
+        # 不变式：low 与 high 两个宽度下的裁剪集合不同
+        if high - low == 1:
+            for key in sorted(states[high] - states[low]):
+                transitions.append({'width': high, 'element': key, 'change': 'starts'})
+            for key in sorted(states[low] - states[high]):
+                transitions.append({'width': high, 'element': key, 'change': 'stops'})
+            return
+
+        middle = (low + high) // 2
+        middle_state = await state_at(middle)
+        if middle_state != states[low]:
+            await bisect(low, middle)
+        if middle_state != states[high]:
+            await bisect(middle, high)
+
+    # 先粗扫，再在状态变化的区间内二分到 1px
+    widths = list(range(min_width, max_width, step)) + [max_width]
+    for width in widths:
+        await state_at(width)
+
+    for low, high in zip(widths, widths[1:]):
+        if states[low] != states[high]:
+            await bisect(low, high)
+
+    return {
+        'range': {'min_width': min_width, 'max_width': max_width, 'height': height},
+        'coarse_step': step,
+        'layouts_evaluated': len(states),
+        'breakpoints': sorted({t['width'] for t in transitions}),
+        'transitions': transitions
+    }
+
+async def run_breakpoint_search(url, min_width, max_width, step, height):
+    """启动无头浏览器并在单个页面上查找裁剪断点"""
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(**launch_options(True, slow_mo=0))
+        try:
+            page = await browser.new_page(viewport={'width': max_width, 'height': height})
+            await open_page(page, url, True, settle_ms=0)
+            return await find_clipping_breakpoints(page, min_width, max_width, step, height)
+        finally:
+            await browser.close()
+
+def print_breakpoints(result):
+    """打印裁剪断点"""
+
+    print("\n" + "="*80)
+    print("📋 裁剪断点")
+    print("="*80)
+    print(f"📐 宽度范围: {result['range']['min_width']}-{result['range']['max_width']}px，共计算 {result['layouts_evaluated']} 次布局")
+
+    if not result['transitions']:
+        print("✅ 范围内裁剪状态没有变化")
+
+    for transition in result['transitions']:
+        action = "开始被裁剪" if transition['change'] == 'starts' else "不再被裁剪"
+        print(f"  • 宽度 ≥ {transition['width']}px 时 {action}: {transition['element']}")
+
+    print("="*80)
+
+def parse_viewports(value):
+    """解析形如 1920x1080,768x1024 的视口列表"""
+
+    viewports = []
+    for item in value.split(','):
+        width, height = item.lower().split('x')
+        viewports.append({'width': int(width), 'height': int(height)})
+    return viewports
+
+def parse_scale_factors(value):
+    """解析形如 1,2,3 的 DPR 列表"""
+
+    return [float(item) if '.' in item else int(item) for item in value.split(',')]
+
+async def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='VoiceCard 视口 × DPR 响应式审计（无头运行）')
+    parser.add_argument('--url', default='http://localhost:3000', help='待审计页面地址')
+    parser.add_argument('--viewports', type=parse_viewports, help='视口列表，例如 1920x1080,768x1024')
+    parser.add_argument('--scales', type=parse_scale_factors, help='设备像素比列表，例如 1,2,3')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时打开的浏览器上下文数量')
+    parser.add_argument('--screenshots', metavar='DIR',
+                        help='每个单元保存整页截图和同名区域报告，可用 visual_diff.py 按目录与基线对比')
+    parser.add_argument('--breakpoints', action='store_true', help='二分查找裁剪开始/停止的精确宽度')
+    parser.add_argument('--min-width', type=int, default=320, help='断点查找的最小宽度')
+    parser.add_argument('--max-width', type=int, default=1920, help='断点查找的最大宽度')
+    parser.add_argument('--step', type=int, default=64, help='断点查找的粗扫步长（窄于步长且两端状态相同的区间会被跳过）')
+    parser.add_argument('--height', type=int, default=1080, help='断点查找时的视口高度')
+    args = parser.parse_args()
+
+    try:
+        if args.breakpoints:
+            result = await run_breakpoint_search(args.url, args.min_width, args.max_width, args.step, args.height)
+            print_breakpoints(result)
+
+            with open('clipping_breakpoints.json', 'w', encoding='utf-8') as f:
+                json.dump({'timestamp': datetime.now().isoformat(), 'url': args.url, **result},
+                          f, indent=2, ensure_ascii=False)
+            print("💾 断点结果已保存到: clipping_breakpoints.json")
+            return
+
+        # 矩阵审计默认无头运行
+        results = await run_matrix_audit(args.viewports, args.scales, args.concurrency, args.url, fast=True,
+                                         screenshot_dir=args.screenshots)
+        print_matrix_table(results)
+
+        with open('responsive_audit.json', 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'url': args.url, 'cells': results},
+                      f, indent=2, ensure_ascii=False)
+        print("💾 审计结果已保存到: responsive_audit.json")
+
+    except KeyboardInterrupt:
+        print("\n⚠️ 审计被用户中断")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+DOM 指纹结果缓存
+以页面内一次计算的子树指纹 + 视口 + DPR 为键，复用未变化元素的分析结果，磁盘上按 LRU 淘汰
+"""
+
+import hashlib
+import json
+import os
+from diagnosis_common import js_call
+
+DEFAULT_CACHE_DIR = '.diagnostic_cache'
+MAX_CACHE_ENTRIES = 2000
+
+# 分析结果结构变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+
+# 元素指纹覆盖：子树结构、class、style 属性、图片地址、文本，祖先链的 class / style，以及元素和父元素的位置尺寸；
+# 页面指纹覆盖样式表内容、视口和 DPR。两个种子的 FNV-1a 组成 64 位
+FINGERPRINT_JS = """
+function fnv1a(text, seed) {
+    let hash = seed >>> 0;
+    for (let i = 0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193) >>> 0;
+    }
+    return hash;
+}
+
+function hash64(text) {
+    return fnv1a(text, 0x811c9dc5).toString(16).padStart(8, '0') + fnv1a(text, 0x050c5d1f).toString(16).padStart(8, '0');
+}
+
+function rectSignature(el) {
+    const r = el.getBoundingClientRect();
+    return [r.x, r.y, r.width, r.height].map(v => Math.round(v * 100) / 100).join(',');
+}
+
+function fingerprintElement(el) {
+    const parts = [];
+
+    for (let current = el.parentElement; current; current = current.parentElement) {
+        parts.push('^' + current.tagName + '.' + (current.getAttribute('class') || '') + ';' + (current.getAttribute('style') || ''));
+    }
+
+    const walker = document.createTreeWalker(el, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT);
+    for (let node = walker.currentNode; node; node = walker.nextNode()) {
+        if (node.nodeType === Node.TEXT_NODE) {
+            parts.push('#' + node.nodeValue);
+            continue;
+        }
+        parts.push('<' + node.tagName + '.' + (node.getAttribute('class') || '') + ';' + (node.getAttribute('style') || '') +
+            (node.tagName === 'IMG' ? '@' + node.currentSrc + ' ' + node.naturalWidth + 'x' + node.naturalHeight + (node.complete ? '' : '~') : '') +
+            '/' + node.childNodes.length);
+    }
+
+    parts.push('=' + rectSignature(el));
+    if (el.parentElement) {
+        parts.push('=' + rectSignature(el.parentElement));
+    }
+
+    return hash64(parts.join('\\n'));
+}
+
+function pageFingerprint() {
+    const sheets = [];
+    for (const node of document.querySelectorAll('style, link[rel="stylesheet"]')) {
+        sheets.push(node.tagName === 'STYLE' ? hash64(node.textContent) : node.href);
+    }
+    return {
+        styles: hash64(sheets.join('|')),
+        viewport: [window.innerWidth, window.innerHeight],
+        dpr: window.devicePixelRatio
+    };
+}
+"""
+
+def cache_key(kind, fingerprint, page_fingerprint):
+    """由分析类型、元素指纹和页面指纹（样式表、视口、DPR）得到缓存键"""
+
+    payload = json.dumps([CACHE_VERSION, kind, fingerprint, page_fingerprint], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cache_load(key, cache_dir=DEFAULT_CACHE_DIR):
+    """读取缓存，命中时刷新修改时间作为 LRU 的最近使用时间"""
+
+    path = os.path.join(cache_dir, key + '.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            value = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # 读取之后被并发的淘汰删除，本次结果仍然有效
+        pass
+    return value
+
+def cache_store(key, value, cache_dir=DEFAULT_CACHE_DIR):
+    """写入缓存；淘汰不在这里做，由 evict_cache 在整次运行结束时执行一次"""
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.json')
+    temp = path + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(temp, path)
+
+def evict_cache(cache_dir=DEFAULT_CACHE_DIR, max_entries=MAX_CACHE_ENTRIES):
+    """条目超过 max_entries 时删除最久未使用的条目，返回删除的数量；
+    并发运行的另一进程可能已删除同一文件，此时跳过"""
+
+    try:
+        scanned = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.json')]
+    except FileNotFoundError:
+        return 0
+    if len(scanned) <= max_entries:
+        return 0
+
+    entries = []
+    for entry in scanned:
+        try:
+            entries.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            continue
+
+    entries.sort()
+    removed = 0
+    for _, path in entries[:max(0, len(entries) - max_entries)]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+async def element_cache_key(page, element, kind):
+    """一次调用计算元素指纹和页面指纹"""
+
+    fingerprint, page_fingerprint = await page.evaluate(
+        js_call(FINGERPRINT_JS, '[fingerprintElement(arg), pageFingerprint()]'),
+        element
+    )
+    return cache_key(kind, fingerprint, page_fingerprint)
+
+async def cached_analysis(page, element, kind, index, compute, log=print):
+    """元素未变化时直接返回上次的分析结果（index 不为 None 时序号改为本次的 index），否则调用 compute 并写入缓存"""
+
+    key = await element_cache_key(page, element, kind)
+    cached = cache_load(key)
+    if cached is not None:
+        log("  ♻️ 命中缓存，跳过分析")
+        if index is not None:
+            cached['index'] = index
+        return cached
+
+    result = await compute()
+    if result is not None:
+        cache_store(key, result)
+    return result
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+统一诊断运行器
+只启动一次浏览器、加载一次页面，在同一页面上并发运行只读探测，截图和会改动页面的诊断随后串行运行
+"""
+
+import asyncio
+from playwright.async_api import async_playwright
+import json
+from datetime import datetime
+import sys
+from artifact_store import DEFAULT_MAX_AGE_DAYS, DEFAULT_MAX_SIZE_MB, archive_run, evict, print_manifest_summary
+from diagnosis_common import build_arg_parser, launch_options, open_page, open_record_stream
+from voicepanel_diagnosis import run_voicepanel_diagnosis
+from voicecard_avatar_diagnosis import run_avatar_analysis
+from marcus_avatar_specific_analysis import run_marcus_analysis
+from result_cache import evict_cache
+from stage_trace import start_trace, trace_span, trace_step, write_trace
+
+# 各项诊断及其原有的输出文件
+DIAGNOSTICS = [
+    ('voicepanel', run_voicepanel_diagnosis, 'voicepanel_diagnostic_report.json'),
+    ('voicecard_avatars', run_avatar_analysis, 'voicecard_avatar_analysis.json'),
+    ('marcus_avatar', run_marcus_analysis, 'marcus_avatar_detailed_analysis.json')
+]
+
+# 会临时改动页面的诊断（Marcus 渲染性能探针切换 img.style.display 以强制重排），
+# 改动会触发样式缓存的 MutationObserver 并清空并发诊断共享的缓存，因此在只读诊断结束后单独运行
+MUTATING_DIAGNOSTICS = {'marcus_avatar'}
+
+# 其余诊断的探测只读，但截图会滚动页面、重新布局，登记后在并发探测全部结束后串行执行
+DEFERRED_SCREENSHOT_DIAGNOSTICS = {'voicepanel', 'voicecard_avatars'}
+
+# 各项诊断写出的截图
+SCREENSHOTS = [
+    'voicepanel_full_page.png',
+    'voicepanel_panel.png',
+    'voicecard_avatar_analysis_final.png',
+    'marcus_avatar_closeup.png',
+    'marcus_voice_card.png'
+]
+
+def deferred_options(name, deferred_screenshots):
+    """支持推迟截图的诊断在并发阶段只登记截图步骤"""
+
+    if name in DEFERRED_SCREENSHOT_DIAGNOSTICS:
+        return {'deferred_screenshots': deferred_screenshots}
+    return {}
+
+async def run_traced(name, run, page, **options):
+    """在并发任务内部开启追踪区间，各项诊断的阶段分别记录在自己的泳道上"""
+
+    with trace_span(name):
+        return await run(page, **options)
+
+async def run_all_diagnostics(fast=False, url="http://localhost:3000", ndjson_path=None, compact=False, archive=False, cache=False, fixture=None):
+    """共享浏览器和页面运行全部诊断，并写出合并摘要（ndjson_path 指定时三项诊断写入同一记录流）"""
+
+    trace_step('launch')
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=500))
+        context = await browser.new_context(
+            viewport={'width': 1920, 'height': 1080},
+            device_scale_factor=1
+        )
+        page = await context.new_page()
+        stream = open_record_stream(ndjson_path)
+
+        try:
+            print("🚀 开始统一诊断...")
+            print(f"📅 时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+            print(f"\n📍 导航到 {url}")
+            await open_page(page, url, fast, settle_ms=5000, fixture=fixture)
+
+            # 只读取页面状态的诊断在同一页面上并发执行；每条记录整行写出，交错也不会损坏
+            trace_step('diagnostics')
+            options = {'stream': stream, 'compact': compact, 'cache': cache}
+            deferred_screenshots = []
+            read_only = [(name, run) for name, run, _ in DIAGNOSTICS if name not in MUTATING_DIAGNOSTICS]
+            outcomes = dict(zip(
+                [name for name, _ in read_only],
+                await asyncio.gather(*(run_traced(name, run, page, **options,
+                                                  **deferred_options(name, deferred_screenshots))
+                                       for name, run in read_only),
+                                     return_exceptions=True)
+            ))
+
+            # 截图在并发探测全部结束后逐个执行，不会与其他诊断的几何测量交错
+            trace_step('screenshots')
+            for save_screenshots in deferred_screenshots:
+                try:
+                    await save_screenshots()
+                except Exception as e:
+                    print(f"⚠️ 截图失败: {e}")
+
+            # 会改动页面的诊断在并发诊断全部结束后逐个运行
+            for name, run, _ in DIAGNOSTICS:
+                if name in MUTATING_DIAGNOSTICS:
+                    outcomes[name] = (await asyncio.gather(run_traced(name, run, page, **options), return_exceptions=True))[0]
+
+            results = [outcomes[name] for name, _, _ in DIAGNOSTICS]
+
+            trace_step('report')
+            summary = build_merged_summary(page.url, await page.title(), results)
+
+            trace_step('serialization')
+            with open('diagnostics_summary.json', 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2, ensure_ascii=False)
+
+            print("💾 合并摘要已保存到: diagnostics_summary.json")
+            print_merged_summary(summary)
+
+            if archive:
+                trace_step('archive')
+                # 按内容去重存入产物存储，重复运行不再累积相同的截图和报告
+                outputs = [output_file for _, _, output_file in DIAGNOSTICS] + SCREENSHOTS + ['diagnostics_summary.json']
+                if ndjson_path:
+                    outputs.append(ndjson_path)
+                print_manifest_summary(archive_run(outputs, 'run_all'))
+                evict(max_age_days=DEFAULT_MAX_AGE_DAYS, max_size_mb=DEFAULT_MAX_SIZE_MB)
+
+            return summary
+
+        finally:
+            if stream:
+                stream.close()
+            if cache:
+                # 并发诊断都结束后统一淘汰一次，避免各自写入时同时扫描和删除
+                evict_cache()
+            await browser.close()
+
+def build_merged_summary(page_url, page_title, results):
+    """把三项诊断的结果合并为一份摘要"""
+
+    diagnostics = {}
+
+    for (name, _, output_file), result in zip(DIAGNOSTICS, results):
+        if isinstance(result, Exception):
+            diagnostics[name] = {'status': 'error', 'error': str(result)}
+        elif not result:
+            diagnostics[name] = {'status': 'failed'}
+        else:
+            diagnostics[name] = {
+                'status': 'completed',
+                'output_file': output_file,
+                'summary': extract_summary(name, result)
+            }
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'page_info': {
+            'title': page_title,
+            'url': page_url
+        },
+        'diagnostics': diagnostics
+    }
+
+def extract_summary(name, result):
+    """从各诊断结果中提取摘要部分（不含详细数据）"""
+
+    if name == 'voicepanel':
+        report = result['summary']
+        return {
+            'status': report['status'],
+            'statistics': report.get('statistics'),
+            'issues_identified': report.get('issues_identified')
+        }
+
+    if name == 'voicecard_avatars':
+        report = result['report']
+        return {
+            'status': report['status'],
+            'statistics': report.get('statistics'),
+            'issues_detected': report.get('issues_detected')
+        }
+
+    report = result['report']
+    return {
+        'status': report['status'],
+        'summary': report.get('summary'),
+        'issues_found': report.get('issues_found')
+    }
+
+def print_merged_summary(summary):
+    """打印合并摘要"""
+
+    print("\n" + "="*80)
+    print("📋 统一诊断摘要")
+    print("="*80)
+
+    for name, info in summary['diagnostics'].items():
+        status_icon = "✅" if info['status'] == 'completed' else "❌"
+        print(f"  {status_icon} {name}: {info['status']}")
+        if info['status'] == 'completed':
+            print(f"     📁 {info['output_file']}")
+        elif info.get('error'):
+            print(f"     原因: {info['error']}")
+
+    print("\n" + "="*80)
+
+async def main():
+    """主函数"""
+    parser = build_arg_parser('统一运行 VoicePanel、VoiceCard 头像和 Marcus 头像诊断', report_options=True)
+    parser.add_argument('--archive', action='store_true', help='把本次报告和截图按内容去重存入 .diagnostic_artifacts')
+    args = parser.parse_args()
+    if args.trace:
+        start_trace()
+    try:
+        summary = await run_all_diagnostics(fast=args.fast, ndjson_path=args.ndjson, compact=args.compact,
+                                            archive=args.archive, cache=args.cache, fixture=args.fixture)
+        failed = [name for name, info in summary['diagnostics'].items() if info['status'] != 'completed']
+        if failed:
+            print(f"\n⚠️ 部分诊断未完成: {', '.join(failed)}")
+            sys.exit(1)
+        print("\n✅ 全部诊断成功完成!")
+    except KeyboardInterrupt:
+        print("\n⚠️ 诊断被用户中断")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+    finally:
+        if args.trace:
+            write_trace(args.trace)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+截图裁剪流水线
+按视口大小分块截图：每个滚动位置只截取一次视口，在进程内按区域切片，PNG 编码放到线程池中并行执行
+"""
+
+import asyncio
+import io
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    # 缺少 numpy / Pillow 时退回逐区域调用 page.screenshot
+    np = None
+
+# 滚动位置、视口和文档尺寸（CSS 像素）；bounding_box 的坐标相对视口，需要加上滚动偏移才是整页坐标
+PAGE_GEOMETRY_JS = """() => ({
+    scroll_x: window.scrollX,
+    scroll_y: window.scrollY,
+    viewport_width: window.innerWidth,
+    viewport_height: window.innerHeight,
+    document_width: Math.max(document.documentElement.scrollWidth, document.body ? document.body.scrollWidth : 0),
+    document_height: Math.max(document.documentElement.scrollHeight, document.body ? document.body.scrollHeight : 0)
+})"""
+
+# 滚动到指定位置并返回浏览器实际停下的位置（靠近页面底部时会被夹住）
+SCROLL_TO_JS = """([x, y]) => {
+    window.scrollTo(x, y);
+    return { x: window.scrollX, y: window.scrollY };
+}"""
+
+
+def clip_to_pixels(clip, scale, width, height):
+    """把 CSS 像素的裁剪区域换算为截图像素范围，并裁到截图边界内"""
+
+    left = max(0, math.floor(clip['x'] * scale))
+    top = max(0, math.floor(clip['y'] * scale))
+    right = min(width, math.ceil((clip['x'] + clip['width']) * scale))
+    bottom = min(height, math.ceil((clip['y'] + clip['height']) * scale))
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right, bottom
+
+
+def page_clip(clip, geometry):
+    """视口坐标的区域换算为整页坐标；None 表示当前视口"""
+
+    if clip is None:
+        return {'x': geometry['scroll_x'], 'y': geometry['scroll_y'],
+                'width': geometry['viewport_width'], 'height': geometry['viewport_height']}
+    return {**clip, 'x': clip['x'] + geometry['scroll_x'], 'y': clip['y'] + geometry['scroll_y']}
+
+
+def fits_tile(clip, geometry):
+    """区域能否完整落在某个纵向滚动分块内：不高于视口，且横向位于当前视口范围内"""
+
+    left = geometry['scroll_x']
+    return (clip['height'] <= geometry['viewport_height'] and
+            clip['x'] >= left and clip['x'] + clip['width'] <= left + geometry['viewport_width'])
+
+
+def plan_tiles(regions, geometry):
+    """把整页坐标的区域分配到视口大小的滚动分块，返回 [(分块顶部, [(路径, 区域)])]；
+    第一块固定为当前滚动位置，落在当前视口内的区域无需滚动；区域须满足 fits_tile"""
+
+    viewport_height = geometry['viewport_height']
+    max_top = max(0, geometry['document_height'] - viewport_height)
+
+    def fits(top, clip):
+        return clip['y'] >= top and clip['y'] + clip['height'] <= top + viewport_height
+
+    current = geometry['scroll_y']
+    tiles = [(current, [item for item in regions if fits(current, item[1])])]
+    pending = sorted((item for item in regions if not fits(current, item[1])), key=lambda item: item[1]['y'])
+
+    while pending:
+        top = min(max(0, pending[0][1]['y']), max_top)
+        members = [item for item in pending if fits(top, item[1])]
+        tiles.append((top, members))
+        pending = [item for item in pending if item not in members]
+
+    return [(top, members) for top, members in tiles if members]
+
+
+def encode_png(pixels, path):
+    Image.fromarray(pixels).save(path, format='PNG')
+    return path
+
+
+async def capture_regions(page, regions, max_workers=4):
+    """按滚动分块截取视口并保存多个区域，regions 为 (路径, 视口坐标的裁剪区域) 列表，区域为 None 表示当前视口；
+    每块只截取一次视口，内存占用不随页面高度增长；放不进单个分块的区域单独截取，保存完整区域；
+    返回实际保存的路径列表（完全在页面之外的区域会被跳过）；结束后恢复原来的滚动位置"""
+
+    geometry = await page.evaluate(PAGE_GEOMETRY_JS)
+    page_bounds = {'x': 0, 'y': 0, 'width': geometry['document_width'], 'height': geometry['document_height']}
+
+    targets = []
+    for path, clip in regions:
+        box = clip_to_pixels(page_clip(clip, geometry), 1, page_bounds['width'], page_bounds['height'])
+        if box is None:
+            print(f"  ⚠️ 区域在页面之外，跳过: {path}")
+            continue
+        left, top, right, bottom = box
+        targets.append((path, {'x': left, 'y': top, 'width': right - left, 'height': bottom - top}))
+
+    saved = []
+
+    # 高于视口或横向超出当前视口的区域无法从单个分块裁出，在滚动前按原视口坐标交给浏览器单独截取
+    for path, clip in targets:
+        if not fits_tile(clip, geometry):
+            await page.screenshot(path=path, clip={**clip, 'x': clip['x'] - geometry['scroll_x'],
+                                                   'y': clip['y'] - geometry['scroll_y']})
+            saved.append(path)
+
+    loop = asyncio.get_running_loop()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tiled = [(path, clip) for path, clip in targets if fits_tile(clip, geometry)]
+            for tile_top, members in plan_tiles(tiled, geometry):
+                origin = await page.evaluate(SCROLL_TO_JS, [geometry['scroll_x'], tile_top])
+
+                if np is None:
+                    for path, clip in members:
+                        await page.screenshot(path=path, clip={**clip, 'x': clip['x'] - origin['x'],
+                                                               'y': clip['y'] - origin['y']})
+                        saved.append(path)
+                    continue
+
+                png = await page.screenshot(type='png')
+                pixels = np.asarray(Image.open(io.BytesIO(png)))
+                height, width = pixels.shape[:2]
+                scale = width / geometry['viewport_width']
+
+                jobs = []
+                for path, clip in members:
+                    box = clip_to_pixels({**clip, 'x': clip['x'] - origin['x'], 'y': clip['y'] - origin['y']},
+                                         scale, width, height)
+                    if box is None:
+                        print(f"  ⚠️ 区域在视口之外，跳过: {path}")
+                        continue
+                    left, top, right, bottom = box
+                    # 切片只是原数组的视图，不复制像素
+                    jobs.append((pixels[top:bottom, left:right], path))
+
+                saved.extend(await asyncio.gather(
+                    *(loop.run_in_executor(executor, encode_png, crop, path) for crop, path in jobs)
+                ))
+    finally:
+        await page.evaluate(SCROLL_TO_JS, [geometry['scroll_x'], geometry['scroll_y']])
+
+    return saved
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+诊断阶段追踪
+记录各阶段耗时、page.evaluate 与 ElementHandle 调用次数和经过桥接的数据量，
+导出 Chrome trace-event JSON，可直接在 Perfetto / chrome://tracing 中打开
+
+未调用 start_trace 时所有函数都是空操作，诊断脚本可以无条件埋点
+"""
+
+import asyncio
+import json
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 需要计数的 Page 方法
+PAGE_METHODS = ['evaluate', 'evaluate_handle', 'query_selector', 'query_selector_all', 'screenshot', 'title']
+
+# 需要计数的 ElementHandle / JSHandle 方法
+HANDLE_METHODS = ['evaluate', 'evaluate_handle', 'bounding_box', 'query_selector', 'query_selector_all',
+                  'screenshot', 'get_attribute', 'text_content', 'inner_text', 'is_visible',
+                  'get_properties', 'json_value']
+
+# 这些方法返回新的句柄，返回值同样需要埋点
+HANDLE_RETURNING = {'evaluate_handle', 'query_selector', 'query_selector_all', 'get_properties'}
+
+COUNTER_NAMES = ['evaluate_calls', 'handle_calls', 'handles_created', 'bytes_sent', 'bytes_received']
+
+_trace = None
+
+# 当前任务的阶段层级；asyncio.gather 并发运行的诊断各自持有一份，互不结束对方的阶段
+_frames = ContextVar('stage_trace_frames', default=())
+
+def start_trace():
+    """开始记录；之后打开的页面和调用的 trace_step / trace_span 都会被记录"""
+
+    global _trace
+    _trace = {
+        'origin': time.perf_counter(),
+        'events': [],
+        'counters': {name: 0 for name in COUNTER_NAMES},
+        'lanes': {},
+        'roots': []
+    }
+    root = {'span': None, 'step': None}
+    _trace['roots'].append(root)
+    _frames.set((root,))
+    return _trace
+
+def now_us():
+    return (time.perf_counter() - _trace['origin']) * 1_000_000
+
+def payload_size(value):
+    """估算经过 Playwright 桥接的数据量：按 JSON 序列化后的字节数计，句柄记为占位字符串"""
+
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=lambda _: '<handle>', ensure_ascii=False).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+def evaluate_label(expression):
+    """js_call 生成的表达式以 return 调用结尾，用被调用的函数名作为事件名"""
+
+    if not isinstance(expression, str):
+        return ''
+    calls = re.findall(r'return\s+([A-Za-z_$][\w$]*)\s*\(', expression)
+    return calls[-1] if calls else ''
+
+def current_lane():
+    """每个 asyncio 任务一条泳道，并发的诊断在 Perfetto 中分行显示；返回 (阶段 tid, 桥接调用 tid)"""
+
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+
+    lanes = _trace['lanes']
+    if task not in lanes:
+        lanes[task] = len(lanes)
+    lane = lanes[task]
+    return lane * 2 + 1, lane * 2 + 2
+
+def current_frames():
+    frames = _frames.get()
+    if not frames:
+        # 在 start_trace 之外的上下文中（例如其他线程）各自从新的根层级开始
+        root = {'span': None, 'step': None}
+        _trace['roots'].append(root)
+        frames = (root,)
+        _frames.set(frames)
+    return frames
+
+def open_span(name, category):
+    return {'name': name, 'category': category, 'start': now_us(), 'tid': current_lane()[0],
+            'counters': {counter: 0 for counter in COUNTER_NAMES}}
+
+def close_span(span):
+    end = now_us()
+    _trace['events'].append({
+        'name': span['name'],
+        'cat': span['category'],
+        'ph': 'X',
+        'ts': span['start'],
+        'dur': end - span['start'],
+        'pid': 1,
+        'tid': span['tid'],
+        'args': span['counters']
+    })
+    # 累计计数作为计数器轨道，Perfetto 中可以看到数据量随时间增长
+    _trace['events'].append({
+        'name': 'bridge',
+        'ph': 'C',
+        'ts': end,
+        'pid': 1,
+        'args': {'bytes_sent': _trace['counters']['bytes_sent'], 'bytes_received': _trace['counters']['bytes_received']}
+    })
+
+def trace_step(name):
+    """结束当前层级正在进行的阶段并开始下一个阶段（与脚本中的“步骤N”横幅一一对应）"""
+
+    if _trace is None:
+        return
+    frame = current_frames()[-1]
+    if frame['step']:
+        close_span(frame['step'])
+    frame['step'] = open_span(name, 'stage')
+
+@contextmanager
+def trace_span(name):
+    """包住一段嵌套的阶段，其中的 trace_step 在退出时一并结束"""
+
+    if _trace is None:
+        yield
+        return
+
+    span = open_span(name, 'span')
+    frame = {'span': span, 'step': None}
+    token = _frames.set(current_frames() + (frame,))
+    try:
+        yield
+    finally:
+        _frames.reset(token)
+        if frame['step']:
+            close_span(frame['step'])
+        close_span(span)
+
+def count(counter, amount=1):
+    """计入全局总数，以及当前任务层级链上所有未结束的区间和阶段
+    （并发子任务的调用计入启动它们的阶段，但不会计入兄弟任务的阶段）"""
+
+    _trace['counters'][counter] += amount
+    for frame in current_frames():
+        for span in (frame['span'], frame['step']):
+            if span:
+                span['counters'][counter] += amount
+
+def record_call(label, started, sent, received, counter):
+    count(counter)
+    count('bytes_sent', sent)
+    count('bytes_received', received)
+    _trace['events'].append({
+        'name': label,
+        'cat': 'bridge',
+        'ph': 'X',
+        'ts': started,
+        'dur': now_us() - started,
+        'pid': 1,
+        'tid': current_lane()[1],
+        'args': {'bytes_sent': sent, 'bytes_received': received}
+    })
+
+def instrument_handles(value):
+    """给新返回的句柄（或句柄列表 / get_properties 的字典）埋点，返回原值"""
+
+    if isinstance(value, dict):
+        for item in value.values():
+            instrument_handles(item)
+    elif isinstance(value, list):
+        for item in value:
+            instrument_handles(item)
+    elif value is not None and hasattr(value, 'as_element') and not getattr(value, '_stage_traced', False):
+        count('handles_created')
+        wrap_methods(value, HANDLE_METHODS, 'handle')
+        value._stage_traced = True
+    return value
+
+def wrap_methods(target, methods, owner):
+    for name in methods:
+        original = getattr(target, name, None)
+        if original is None:
+            continue
+
+        async def traced(*args, _original=original, _name=name, **kwargs):
+            if _trace is None:
+                return await _original(*args, **kwargs)
+
+            started = now_us()
+            result = await _original(*args, **kwargs)
+
+            label = f"{owner}.{_name}"
+            if _name == 'evaluate':
+                function_name = evaluate_label(args[0] if args else kwargs.get('expression'))
+                if function_name:
+                    label += ':' + function_name
+            counter = 'evaluate_calls' if _name == 'evaluate' else 'handle_calls'
+            sent = payload_size(list(args[:1])) + payload_size(list(args[1:]))
+            record_call(label, started, sent, payload_size(result), counter)
+
+            if _name in HANDLE_RETURNING:
+                instrument_handles(result)
+            return result
+
+        setattr(target, name, traced)
+
+def instrument_page(page):
+    """给页面的桥接调用埋点；未开始记录时不做任何事"""
+
+    if _trace is None or getattr(page, '_stage_traced', False):
+        return page
+    wrap_methods(page, PAGE_METHODS, 'page')
+    page._stage_traced = True
+    return page
+
+def trace_counters():
+    """当前累计的调用次数和数据量；未开始记录时返回 None"""
+
+    return dict(_trace['counters']) if _trace is not None else None
+
+def stop_trace():
+    """结束记录并丢弃已记录的事件，不写出文件"""
+
+    global _trace
+    _trace = None
+    _frames.set(())
+
+def stage_summary():
+    """按阶段汇总耗时和调用次数"""
+
+    return [{
+        'name': event['name'],
+        'duration_ms': event['dur'] / 1000,
+        **event['args']
+    } for event in _trace['events'] if event['ph'] == 'X' and event['cat'] != 'bridge']
+
+def write_trace(path):
+    """结束所有未结束的阶段，写出 trace-event JSON 并打印阶段汇总"""
+
+    global _trace
+    if _trace is None:
+        return None
+
+    for root in _trace['roots']:
+        if root['step']:
+            close_span(root['step'])
+            root['step'] = None
+
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'diagnostics'}}]
+    for lane in range(len(_trace['lanes'])):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lane * 2 + 1, 'args': {'name': f'stages #{lane}'}})
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lane * 2 + 2, 'args': {'name': f'playwright bridge #{lane}'}})
+    events += _trace['events']
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+    summary = stage_summary()
+    print(f"\n⏱️ 阶段耗时（trace 已保存到 {path}，可在 https://ui.perfetto.dev 打开）")
+    for stage in sorted(summary, key=lambda s: s['duration_ms'], reverse=True)[:15]:
+        print(f"  • {stage['name']}: {stage['duration_ms']:.0f}ms, evaluate {stage['evaluate_calls']} 次, "
+              f"句柄调用 {stage['handle_calls']} 次, 传输 {(stage['bytes_sent'] + stage['bytes_received']) / 1024:.1f}KB")
+
+    _trace = None
+    _frames.set(())
+    return summary
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+截图视觉回归对比
+基线与新截图做向量化像素差分：先用文件摘要、像素相等和（可选的）感知哈希跳过相同图片，
+再按卡片 / 头像区域分别判定阈值，并输出差异遮罩图
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    # 在 main 中给出安装提示，而不是导入时直接报错
+    np = None
+
+# 单个像素任一通道差值超过该值才计为变化，吸收抗锯齿和压缩噪声
+PIXEL_TOLERANCE = 16
+
+# 各类区域允许变化的像素比例
+REGION_THRESHOLDS = {
+    'page': 0.01,
+    'card': 0.005,
+    'avatar': 0.001
+}
+
+def load_pixels(path):
+    return np.asarray(Image.open(path).convert('RGB'))
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def difference_hash(pixels, size=8):
+    """dHash：缩成 (size+1)×size 的灰度图，比较相邻像素得到 size² 位指纹"""
+
+    gray = Image.fromarray(pixels).convert('L').resize((size + 1, size), Image.BILINEAR)
+    values = np.asarray(gray, dtype=np.int16)
+    return (values[:, 1:] > values[:, :-1]).ravel()
+
+def hash_distance(first, second):
+    return int(np.count_nonzero(first != second))
+
+def regions_from_report(report, scale=1.0):
+    """从 voicepanel 诊断报告中取出卡片和头像的边界框作为对比区域（CSS 像素 × scale）"""
+
+    def to_pixels(box):
+        return {key: box[key] * scale for key in ('x', 'y', 'width', 'height')}
+
+    regions = []
+    for card in report.get('analysis_results', []):
+        if card.get('bounding_box'):
+            regions.append({
+                'name': f"card_{card['index']+1}",
+                'kind': 'card',
+                'box': to_pixels(card['bounding_box'])
+            })
+        avatar = card.get('avatar_info')
+        if avatar and avatar.get('bounding_box'):
+            regions.append({
+                'name': f"avatar_{card['index']+1}",
+                'kind': 'avatar',
+                'box': to_pixels(avatar['bounding_box'])
+            })
+    return regions
+
+def region_slices(box, height, width):
+    top = max(0, int(np.floor(box['y'])))
+    left = max(0, int(np.floor(box['x'])))
+    bottom = min(height, int(np.ceil(box['y'] + box['height'])))
+    right = min(width, int(np.ceil(box['x'] + box['width'])))
+    if bottom <= top or right <= left:
+        return None
+    return slice(top, bottom), slice(left, right)
+
+def build_diff_mask(baseline, changed, region_results, height, width):
+    """变暗的基线灰度图上用红色标出变化像素，区域边框通过为绿色、超阈值为红色"""
+
+    gray = baseline.mean(axis=2, keepdims=True) * 0.4
+    mask = np.repeat(gray, 3, axis=2).astype(np.uint8)
+    mask[changed] = (255, 0, 0)
+
+    for result in region_results:
+        slices = region_slices(result['box'], height, width)
+        if not slices:
+            continue
+        rows, cols = slices
+        color = (0, 200, 0) if result['passed'] else (255, 64, 64)
+        mask[rows.start, cols] = color
+        mask[rows.stop - 1, cols] = color
+        mask[rows, cols.start] = color
+        mask[rows, cols.stop - 1] = color
+
+    return mask
+
+def compare_images(baseline_path, current_path, regions=None, mask_path=None,
+                   pixel_tolerance=PIXEL_TOLERANCE, trust_hash=False):
+    """对比两张截图；trust_hash=True 时感知哈希完全相同即视为无变化，跳过像素差分
+    （整屏 8×8 的 dHash 察觉不到卡片级别的小块变化，因此默认只作为参考指标）"""
+
+    result = {
+        'baseline': baseline_path,
+        'current': current_path
+    }
+
+    # 字节完全相同时不必解码
+    if file_sha256(baseline_path) == file_sha256(current_path):
+        return {**result, 'status': 'identical', 'passed': True, 'checked_by': 'sha256'}
+
+    baseline = load_pixels(baseline_path)
+    current = load_pixels(current_path)
+
+    if baseline.shape != current.shape:
+        return {**result, 'status': 'size_mismatch', 'passed': False,
+                'baseline_size': list(baseline.shape[1::-1]), 'current_size': list(current.shape[1::-1])}
+
+    # 编码不同但像素相同（例如压缩级别不同）
+    if np.array_equal(baseline, current):
+        return {**result, 'status': 'identical', 'passed': True, 'checked_by': 'pixels_equal'}
+
+    distance = hash_distance(difference_hash(baseline), difference_hash(current))
+    result['hash_distance'] = distance
+    if trust_hash and distance == 0:
+        return {**result, 'status': 'identical', 'passed': True, 'checked_by': 'dhash'}
+
+    height, width = baseline.shape[:2]
+    delta = np.abs(baseline.astype(np.int16) - current.astype(np.int16)).max(axis=2)
+    changed = delta > pixel_tolerance
+
+    region_results = [{
+        'name': 'page',
+        'kind': 'page',
+        'box': {'x': 0, 'y': 0, 'width': width, 'height': height}
+    }] + [dict(region) for region in regions or []]
+
+    for region in region_results:
+        slices = region_slices(region['box'], height, width)
+        threshold = region.get('threshold', REGION_THRESHOLDS.get(region['kind'], REGION_THRESHOLDS['page']))
+        if not slices:
+            region.update({'changed_pixels': 0, 'changed_ratio': 0.0, 'threshold': threshold, 'passed': True})
+            continue
+        area = changed[slices]
+        changed_pixels = int(np.count_nonzero(area))
+        ratio = changed_pixels / area.size
+        region.update({
+            'changed_pixels': changed_pixels,
+            'changed_ratio': ratio,
+            'max_delta': int(delta[slices].max()),
+            'threshold': threshold,
+            'passed': ratio <= threshold
+        })
+
+    if mask_path:
+        Image.fromarray(build_diff_mask(baseline, changed, region_results, height, width)).save(mask_path)
+        result['mask'] = mask_path
+
+    failed = [region['name'] for region in region_results if not region['passed']]
+    return {
+        **result,
+        'status': 'changed' if failed else 'within_threshold',
+        'passed': not failed,
+        'checked_by': 'pixels',
+        'failed_regions': failed,
+        'regions': region_results
+    }
+
+def sidecar_regions(directories, name, scale=1.0):
+    """目录模式下每张截图的区域来自同名的 <名称>.json 报告（先找新截图目录，再找基线目录）；
+    报告中有 device_scale_factor 时以它为缩放，否则使用 scale。没有报告时返回 None，只做整页判定"""
+
+    stem = os.path.splitext(name)[0]
+    for directory in directories:
+        path = os.path.join(directory, stem + '.json')
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8') as f:
+                report = json.load(f)
+            return regions_from_report(report, report.get('device_scale_factor', scale))
+    return None
+
+def compare_directories(baseline_dir, current_dir, mask_dir=None, max_workers=4, scale=1.0, **options):
+    """并行对比两个目录中同名的 PNG（例如 responsive_audit --screenshots 输出的视口矩阵截图），
+    每张截图按其同名报告中的卡片 / 头像框分区域判定"""
+
+    names = sorted(name for name in os.listdir(baseline_dir)
+                   if name.lower().endswith('.png') and os.path.isfile(os.path.join(current_dir, name)))
+    if mask_dir:
+        os.makedirs(mask_dir, exist_ok=True)
+
+    def compare(name):
+        mask_path = os.path.join(mask_dir, 'diff_' + name) if mask_dir else None
+        regions = sidecar_regions([current_dir, baseline_dir], name, scale)
+        return compare_images(os.path.join(baseline_dir, name), os.path.join(current_dir, name),
+                              regions=regions, mask_path=mask_path, **options)
+
+    # 解码、差分和编码大多在 C 代码中执行，线程可以并行
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(compare, names))
+
+def print_diff_summary(results):
+    """打印对比结果"""
+
+    print("\n" + "="*80)
+    print("📋 视觉回归对比")
+    print("="*80)
+
+    for result in results:
+        name = os.path.basename(result['current'])
+        if result['status'] == 'identical':
+            print(f"  ✅ {name}: 相同 ({result['checked_by']})")
+        elif result['status'] == 'size_mismatch':
+            print(f"  ❌ {name}: 尺寸不同 {result['baseline_size']} → {result['current_size']}")
+        elif result['passed']:
+            print(f"  ✅ {name}: 变化在阈值内")
+        else:
+            print(f"  ❌ {name}: 超出阈值的区域 {', '.join(result['failed_regions'])}")
+            for region in result['regions']:
+                if not region['passed']:
+                    print(f"     • {region['name']}: {region['changed_ratio']:.2%} 像素变化 (阈值 {region['threshold']:.2%})")
+
+    passed = sum(1 for result in results if result['passed'])
+    print(f"\n📊 通过 {passed}/{len(results)}")
+    print("="*80)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='截图视觉回归对比')
+    parser.add_argument('baseline', help='基线截图或目录')
+    parser.add_argument('current', help='新截图或目录')
+    parser.add_argument('--report', help='voicepanel_diagnostic_report.json，用其中的卡片 / 头像框作为区域'
+                                         '（仅单图模式；目录模式读取每张截图同名的 .json 报告）')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='报告坐标到截图像素的缩放（即 DPR；报告自带 device_scale_factor 时以报告为准）')
+    parser.add_argument('--mask', help='差异遮罩输出路径（目录模式下为输出目录）')
+    parser.add_argument('--tolerance', type=int, default=PIXEL_TOLERANCE, help='单像素通道差值容差')
+    parser.add_argument('--trust-hash', action='store_true', help='感知哈希相同即跳过像素差分（更快，但可能漏掉小区域变化）')
+    args = parser.parse_args()
+
+    if np is None:
+        print("❌ 视觉对比需要 numpy 和 Pillow：pip install numpy Pillow（或 pip install -r requirements.txt）")
+        sys.exit(1)
+
+    if os.path.isdir(args.baseline) and args.report:
+        parser.error('目录模式不支持 --report：请在截图旁放置同名的 <名称>.json 报告')
+
+    options = {'pixel_tolerance': args.tolerance, 'trust_hash': args.trust_hash}
+
+    try:
+        if os.path.isdir(args.baseline):
+            results = compare_directories(args.baseline, args.current, mask_dir=args.mask, scale=args.scale, **options)
+        else:
+            regions = None
+            if args.report:
+                with open(args.report, encoding='utf-8') as f:
+                    regions = regions_from_report(json.load(f), args.scale)
+            results = [compare_images(args.baseline, args.current, regions, args.mask, **options)]
+
+        print_diff_summary(results)
+
+        with open('visual_diff_report.json', 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'results': results}, f, indent=2, ensure_ascii=False)
+        print("💾 对比结果已保存到: visual_diff_report.json")
+
+        if not all(result['passed'] for result in results):
+            sys.exit(1)
+
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
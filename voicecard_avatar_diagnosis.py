@@ -5,16 +5,37 @@
 
 import asyncio
 from playwright.async_api import async_playwright
-import json
 from datetime import datetime
-
-async def analyze_voicecard_avatars():
-    """专门分析 VoiceCard 中的头像显示问题"""
-
+from diagnosis_common import build_arg_parser, launch_options, open_page, open_record_stream, print_selector_counts, reset_style_cache, resolve_selectors, run_or_defer, with_style_cache, write_record
+from report_codec import write_report
+from result_cache import cached_analysis, evict_cache
+from stage_trace import start_trace, trace_step, write_trace
+
+# 头像选择器（全部匹配结果合并去重）
+AVATAR_SELECTORS = [
+    'img[alt*="Marcus"]',
+    'img[alt*="marcus"]',
+    'img[src*="marcus"]',
+    'img[src*="avatar"]',
+    '.MuiAvatar-root img',  # MUI Avatar 组件
+    '.MuiAvatar-img',       # MUI Avatar 图片类
+    '[class*="avatar"] img',
+    'img[src*="https"]'     # 任何网络图片
+]
+
+# 同时分析的头像数量上限，1 表示逐个分析
+DEFAULT_CONCURRENCY = 8
+
+async def analyze_voicecard_avatars(fast=False, ndjson_path=None, compact=False, cache=False, fixture=None,
+                                    concurrency=DEFAULT_CONCURRENCY):
+    """专门分析 VoiceCard 中的头像显示问题（ndjson_path 指定时每分析完一个头像写出一行记录）"""
+
+    trace_step('launch')
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False, slow_mo=500)
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=500))
         context = await browser.new_context(viewport={'width': 1920, 'height': 1080})
         page = await context.new_page()
+        stream = open_record_stream(ndjson_path)
 
         try:
             print("🚀 开始 VoiceCard 头像显示分析...")
@@ -22,131 +43,9 @@ async def analyze_voicecard_avatars():
 
             # 导航到页面
             print("\n📍 步骤1: 导航到页面")
-            await page.goto("http://localhost:3000", wait_until="networkidle")
-            await page.wait_for_timeout(3000)
-
-            # 查找头像元素
-            print("\n🔍 步骤2: 查找所有头像元素")
-
-            # 使用更具体的选择器
-            avatar_selectors = [
-                'img[alt*="Marcus"]',
-                'img[alt*="marcus"]',
-                'img[src*="marcus"]',
-                'img[src*="avatar"]',
-                '.MuiAvatar-root img',  # MUI Avatar 组件
-                '.MuiAvatar-img',       # MUI Avatar 图片类
-                '[class*="avatar"] img',
-                'img[src*="https"]'     # 任何网络图片
-            ]
-
-            all_avatars = []
-            for selector in avatar_selectors:
-                try:
-                    avatars = await page.query_selector_all(selector)
-                    if avatars:
-                        all_avatars.extend(avatars)
-                        print(f"📊 选择器 '{selector}' 找到 {len(avatars)} 个头像")
-                except:
-                    continue
-
-            # 去重
-            unique_avatars = []
-            seen_srcs = set()
-            for avatar in all_avatars:
-                src = await page.evaluate('el => el.src', avatar)
-                if src and src not in seen_srcs:
-                    unique_avatars.append(avatar)
-                    seen_srcs.add(src)
-
-            print(f"📊 总计找到 {len(unique_avatars)} 个唯一头像")
-
-            if not unique_avatars:
-                print("❌ 未找到头像，尝试查找 VoiceCard 组件...")
-
-                # 查找 VoiceCard 容器
-                voice_card_selectors = [
-                    '[data-testid="voice-card"]',
-                    '.voice-card',
-                    '[class*="VoiceCard"]',
-                    '[class*="MuiBox-root"]',
-                    '[class*="MuiCard-root"]'
-                ]
-
-                voice_cards = []
-                for selector in voice_card_selectors:
-                    try:
-                        cards = await page.query_selector_all(selector)
-                        if cards:
-                            voice_cards.extend(cards)
-                            print(f"📊 选择器 '{selector}' 找到 {len(cards)} 个卡片")
-                    except:
-                        continue
-
-                # 在卡片中查找头像
-                for card in voice_cards:
-                    try:
-                        card_avatars = await card.query_selector_all('img')
-                        for avatar in card_avatars:
-                            src = await page.evaluate('el => el.src', avatar)
-                            if src and 'http' in src:  # 确保是真实的图片
-                                unique_avatars.append(avatar)
-                                print(f"📊 在卡片中找到头像: {src}")
-                    except:
-                        continue
-
-            if not unique_avatars:
-                print("❌ 仍然未找到头像，退出分析")
-                return None
-
-            # 分析每个头像
-            print(f"\n🔬 步骤3: 分析 {len(unique_avatars)} 个头像")
-
-            analysis_results = []
-
-            for i, avatar in enumerate(unique_avatars):
-                print(f"\n--- 分析头像 {i+1} ---")
-
-                try:
-                    avatar_analysis = await analyze_single_avatar(page, avatar, i)
-                    if avatar_analysis:
-                        analysis_results.append(avatar_analysis)
-
-                        # 检查头像是否被裁剪
-                        if avatar_analysis['is_clipped']:
-                            print(f"  ⚠️ 头像被裁剪!")
-                            await analyze_clipping_details(page, avatar, avatar_analysis)
-
-                except Exception as e:
-                    print(f"  ❌ 分析头像 {i+1} 时出错: {e}")
-                    continue
-
-            # 生成详细报告
-            print(f"\n📋 步骤4: 生成分析报告")
-
-            report = generate_avatar_analysis_report(analysis_results)
-
-            # 保存结果
-            diagnostic_data = {
-                'timestamp': datetime.now().isoformat(),
-                'total_avatars': len(unique_avatars),
-                'analysis_results': analysis_results,
-                'report': report
-            }
-
-            with open('voicecard_avatar_analysis.json', 'w', encoding='utf-8') as f:
-                json.dump(diagnostic_data, f, indent=2, ensure_ascii=False)
+            await open_page(page, "http://localhost:3000", fast, settle_ms=3000, fixture=fixture)
 
-            print("💾 分析数据已保存到: voicecard_avatar_analysis.json")
-
-            # 打印报告摘要
-            print_avatar_analysis_summary(report)
-
-            # 截取最终页面状态
-            await page.screenshot(path='voicecard_avatar_analysis_final.png', full_page=False)
-            print("📸 已保存最终页面截图: voicecard_avatar_analysis_final.png")
-
-            return diagnostic_data
+            return await run_avatar_analysis(page, stream=stream, compact=compact, cache=cache, concurrency=concurrency)
 
         except Exception as e:
             print(f"❌ 分析过程中发生错误: {str(e)}")
@@ -155,18 +54,147 @@ async def analyze_voicecard_avatars():
             return None
 
         finally:
-            print("\n🏁 分析完成，将在3秒后关闭浏览器...")
-            await page.wait_for_timeout(3000)
+            if not fast:
+                print("\n🏁 分析完成，将在3秒后关闭浏览器...")
+                await page.wait_for_timeout(3000)
+            if stream:
+                stream.close()
+            if cache:
+                evict_cache()
             await browser.close()
 
-async def analyze_single_avatar(page, avatar, index):
-    """分析单个头像元素"""
+async def run_avatar_analysis(page, stream=None, compact=False, cache=False, concurrency=DEFAULT_CONCURRENCY,
+                              deferred_screenshots=None):
+    """在已加载的页面上执行头像分析（步骤2-4），供单独运行和统一运行器共用；
+    传入 deferred_screenshots 列表时最终截图追加到列表中，由调用方在并发探测结束后执行"""
+
+    # 新一轮分析，祖先链遍历共用的样式缓存从空开始
+    await reset_style_cache(page)
+
+    # 查找头像元素
+    print("\n🔍 步骤2: 查找所有头像元素")
+    trace_step('avatar_discovery')
+
+    # 全部选择器的查询、计数和按节点身份去重在页面内一次完成
+    resolution = await resolve_selectors(page, AVATAR_SELECTORS)
+    print_selector_counts(resolution, '头像')
+    unique_avatars = resolution['matches']
+
+    print(f"📊 总计找到 {len(unique_avatars)} 个唯一头像")
+
+    if not unique_avatars:
+        print("❌ 未找到头像，尝试查找 VoiceCard 组件...")
+
+        # 查找 VoiceCard 容器
+        voice_card_selectors = [
+            '[data-testid="voice-card"]',
+            '.voice-card',
+            '[class*="VoiceCard"]',
+            '[class*="MuiBox-root"]',
+            '[class*="MuiCard-root"]'
+        ]
+
+        # 直接查询卡片中的图片（嵌套卡片会重复命中同一图片，解析时已去重）
+        card_resolution = await resolve_selectors(page, [selector + ' img' for selector in voice_card_selectors])
+        print_selector_counts(card_resolution, '卡片内图片')
+        card_imgs = card_resolution['matches']
+        srcs = await page.evaluate('els => els.map(el => el.src)', card_imgs) if card_imgs else []
+        for avatar, src in zip(card_imgs, srcs):
+            if src and 'http' in src:  # 确保是真实的图片
+                unique_avatars.append(avatar)
+                print(f"📊 在卡片中找到头像: {src}")
+
+    if not unique_avatars:
+        print("❌ 仍然未找到头像，退出分析")
+        return None
+
+    # 分析每个头像
+    print(f"\n🔬 步骤3: 分析 {len(unique_avatars)} 个头像")
+    trace_step('avatar_analysis')
+
+    analysis_results = []
+
+    # 各头像的探测互不依赖，最多 concurrency 个同时进行，让桥接往返互相重叠；
+    # 输出和记录仍按头像顺序写出
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    jobs = [asyncio.create_task(analyze_avatar_buffered(page, avatar, i, semaphore, cache))
+            for i, avatar in enumerate(unique_avatars)]
+
+    try:
+        for job in jobs:
+            avatar_analysis, lines = await job
+            print('\n'.join(lines))
+            if avatar_analysis:
+                analysis_results.append(avatar_analysis)
+                write_record(stream, 'avatar', avatar_analysis)
+    finally:
+        for job in jobs:
+            job.cancel()
+
+    # 生成详细报告
+    print(f"\n📋 步骤4: 生成分析报告")
+    trace_step('report')
+
+    report = generate_avatar_analysis_report(analysis_results)
+    write_record(stream, 'avatar_summary', {key: value for key, value in report.items() if key != 'detailed_analysis'})
+
+    # 保存结果
+    diagnostic_data = {
+        'timestamp': datetime.now().isoformat(),
+        'total_avatars': len(unique_avatars),
+        'analysis_results': analysis_results,
+        'report': report
+    }
+
+    trace_step('serialization')
+    write_report('voicecard_avatar_analysis.json', diagnostic_data, compact)
+
+    print("💾 分析数据已保存到: voicecard_avatar_analysis.json")
+
+    # 打印报告摘要
+    print_avatar_analysis_summary(report)
+
+    # 截取最终页面状态
+    async def save_final_screenshot():
+        await page.screenshot(path='voicecard_avatar_analysis_final.png', full_page=False)
+        print("📸 已保存最终页面截图: voicecard_avatar_analysis_final.png")
+
+    await run_or_defer(save_final_screenshot, deferred_screenshots)
+
+    return diagnostic_data
+
+async def analyze_avatar_buffered(page, avatar, index, semaphore, cache=False):
+    """分析一个头像并收集它的全部输出行；出错只影响这一个头像，返回 (分析结果或 None, 输出行)"""
+
+    lines = [f"\n--- 分析头像 {index+1} ---"]
+
+    async with semaphore:
+        try:
+            avatar_analysis = await analyze_single_avatar(page, avatar, index, cache=cache, log=lines.append)
+
+            # 检查头像是否被裁剪
+            if avatar_analysis and avatar_analysis['is_clipped']:
+                lines.append(f"  ⚠️ 头像被裁剪!")
+                await analyze_clipping_details(page, avatar, avatar_analysis, log=lines.append)
+
+        except Exception as e:
+            lines.append(f"  ❌ 分析头像 {index+1} 时出错: {e}")
+            avatar_analysis = None
+
+    return avatar_analysis, lines
+
+async def analyze_single_avatar(page, avatar, index, cache=False, log=print):
+    """分析单个头像元素（cache=True 时复用未变化头像的结果；并发分析时 log 收集输出，按顺序统一打印）"""
+
+    if cache:
+        return await cached_analysis(page, avatar, 'avatar', index,
+                                     lambda: analyze_single_avatar(page, avatar, index, log=log), log)
 
     try:
         # 获取基本信息
         bbox = await avatar.bounding_box()
         if not bbox:
-            print(f"  ⚠️ 无法获取头像 {index+1} 的边界信息")
+            log(f"  ⚠️ 无法获取头像 {index+1} 的边界信息")
             return None
 
         # 获取图片属性
@@ -285,7 +313,7 @@ async def analyze_single_avatar(page, avatar, index):
         aspect_ratio_preserved = abs(scale_x - scale_y) < 0.1
 
         # 获取所有容器的约束
-        container_constraints = await get_all_container_constraints(page, avatar)
+        container_constraints = await get_all_container_constraints(page, avatar, log=log)
 
         # 组装分析结果
         avatar_info = {
@@ -306,49 +334,49 @@ async def analyze_single_avatar(page, avatar, index):
         }
 
         # 打印简要信息
-        print(f"  📏 显示尺寸: {bbox['width']:.1f} x {bbox['height']:.1f} px")
-        print(f"  🖼️ 原图尺寸: {img_attrs['naturalWidth']} x {img_attrs['naturalHeight']} px")
-        print(f"  🎯 object-fit: {computed_styles['objectFit']}")
-        print(f"  📦 父容器: {parent_info['tagName'] if parent_info else 'None'} ({parent_info['className'] if parent_info else ''})")
+        log(f"  📏 显示尺寸: {bbox['width']:.1f} x {bbox['height']:.1f} px")
+        log(f"  🖼️ 原图尺寸: {img_attrs['naturalWidth']} x {img_attrs['naturalHeight']} px")
+        log(f"  🎯 object-fit: {computed_styles['objectFit']}")
+        log(f"  📦 父容器: {parent_info['tagName'] if parent_info else 'None'} ({parent_info['className'] if parent_info else ''})")
 
         if parent_info:
-            print(f"  📦 父容器尺寸: {parent_info['rect']['width']:.1f} x {parent_info['rect']['height']:.1f} px")
-            print(f"  📦 父容器 overflow: {parent_info['styles']['overflow']}")
+            log(f"  📦 父容器尺寸: {parent_info['rect']['width']:.1f} x {parent_info['rect']['height']:.1f} px")
+            log(f"  📦 父容器 overflow: {parent_info['styles']['overflow']}")
 
-        print(f"  ⚖️ 缩放比例: X={scale_x:.2f}, Y={scale_y:.2f}")
-        print(f"  🎨 宽高比保持: {'✅ 是' if aspect_ratio_preserved else '❌ 否'}")
-        print(f"  ✂️ 裁剪状态: {'⚠️ 是' if is_clipped else '✅ 否'}")
-        print(f"  🔒 约束容器: {len(container_constraints)} 个")
-        print(f"  📷 图片加载: {'✅ 完成' if img_attrs['complete'] else '⏳ 进行中'}")
+        log(f"  ⚖️ 缩放比例: X={scale_x:.2f}, Y={scale_y:.2f}")
+        log(f"  🎨 宽高比保持: {'✅ 是' if aspect_ratio_preserved else '❌ 否'}")
+        log(f"  ✂️ 裁剪状态: {'⚠️ 是' if is_clipped else '✅ 否'}")
+        log(f"  🔒 约束容器: {len(container_constraints)} 个")
+        log(f"  📷 图片加载: {'✅ 完成' if img_attrs['complete'] else '⏳ 进行中'}")
 
         if is_clipped:
             overlap_desc = []
             for direction, amount in clipping_info.items():
                 if amount > 0:
                     overlap_desc.append(f"{direction} {amount:.1f}px")
-            print(f"    裁剪详情: {', '.join(overlap_desc)}")
+            log(f"    裁剪详情: {', '.join(overlap_desc)}")
 
         return avatar_info
 
     except Exception as e:
-        print(f"    ❌ 分析头像详情时出错: {e}")
+        log(f"    ❌ 分析头像详情时出错: {e}")
         return None
 
-async def analyze_clipping_details(page, avatar, avatar_analysis):
+async def analyze_clipping_details(page, avatar, avatar_analysis, log=print):
     """分析裁剪的详细信息"""
 
     try:
-        print("  🔍 详细裁剪分析:")
+        log("  🔍 详细裁剪分析:")
 
-        clipping_details = await page.evaluate('''
+        clipping_details = await page.evaluate(with_style_cache('''
             img => {
                 const details = [];
                 let current = img.parentElement;
 
                 while (current && current !== document.body) {
-                    const currentRect = current.getBoundingClientRect();
-                    const imgRect = img.getBoundingClientRect();
-                    const style = getComputedStyle(current);
+                    const currentRect = cachedRect(current);
+                    const imgRect = cachedRect(img);
+                    const style = cachedStyle(current);
 
                     // 检查当前容器是否裁剪了图片
                     const clipping = {
@@ -391,15 +419,15 @@ async def analyze_clipping_details(page, avatar, avatar_analysis):
 
                 return details;
             }
-        ''', avatar)
+        '''), avatar)
 
-        print(f"    检查了 {len(clipping_details)} 个容器层级:")
+        log(f"    检查了 {len(clipping_details)} 个容器层级:")
 
         for i, detail in enumerate(clipping_details):
             container = detail['container']
-            print(f"      {i+1}. {container['tagName']} ({container['className'][:50]}{'...' if len(container['className']) > 50 else ''})")
-            print(f"         overflow: {container['overflow']}/{container['overflowX']}/{container['overflowY']}")
-            print(f"         position: {container['position']}, display: {container['display']}")
+            log(f"      {i+1}. {container['tagName']} ({container['className'][:50]}{'...' if len(container['className']) > 50 else ''})")
+            log(f"         overflow: {container['overflow']}/{container['overflowX']}/{container['overflowY']}")
+            log(f"         position: {container['position']}, display: {container['display']}")
 
             if detail['isClipping']:
                 overlaps = detail['overlap']
@@ -407,24 +435,24 @@ async def analyze_clipping_details(page, avatar, avatar_analysis):
                 for direction, amount in overlaps.items():
                     if amount > 0:
                         overlap_desc.append(f"{direction} {amount:.1f}px")
-                print(f"         ⚠️ 此容器裁剪了图片: {', '.join(overlap_desc)}")
+                log(f"         ⚠️ 此容器裁剪了图片: {', '.join(overlap_desc)}")
             else:
-                print(f"         ✅ 此容器未裁剪图片")
+                log(f"         ✅ 此容器未裁剪图片")
 
     except Exception as e:
-        print(f"    ❌ 裁剪详情分析失败: {e}")
+        log(f"    ❌ 裁剪详情分析失败: {e}")
 
-async def get_all_container_constraints(page, avatar):
+async def get_all_container_constraints(page, avatar, log=print):
     """获取所有容器的约束条件"""
 
     try:
-        constraints = await page.evaluate('''
+        constraints = await page.evaluate(with_style_cache('''
             img => {
                 const constraints = [];
                 let current = img.parentElement;
 
                 while (current && current !== document.body) {
-                    const style = getComputedStyle(current);
+                    const style = cachedStyle(current);
                     const constraint = {
                         tagName: current.tagName,
                         className: current.className,
@@ -463,12 +491,12 @@ async def get_all_container_constraints(page, avatar):
 
                 return constraints;
             }
-        ''', avatar)
+        '''), avatar)
 
         return constraints
 
     except Exception as e:
-        print(f"    ❌ 获取容器约束失败: {e}")
+        log(f"    ❌ 获取容器约束失败: {e}")
         return []
 
 def generate_avatar_analysis_report(analysis_results):
@@ -645,8 +673,15 @@ def print_avatar_analysis_summary(report):
 
 async def main():
     """主函数"""
+    parser = build_arg_parser('VoiceCard 头像显示分析', report_options=True)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='同时分析的头像数量上限（1 为逐个分析）')
+    args = parser.parse_args()
+    if args.trace:
+        start_trace()
     try:
-        result = await analyze_voicecard_avatars()
+        result = await analyze_voicecard_avatars(fast=args.fast, ndjson_path=args.ndjson, compact=args.compact, cache=args.cache,
+                                                 fixture=args.fixture, concurrency=args.concurrency)
         if result:
             print("\n✅ 头像分析成功完成!")
             print("📁 生成的文件:")
@@ -658,6 +693,9 @@ async def main():
         print("\n⚠️ 分析被用户中断")
     except Exception as e:
         print(f"\n❌ 发生未预期的错误: {e}")
+    finally:
+        if args.trace:
+            write_trace(args.trace)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
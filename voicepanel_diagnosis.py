@@ -6,22 +6,32 @@ VoicePanel 头像显示问题诊断脚本
 
 import asyncio
 from playwright.async_api import async_playwright
-import json
 import base64
 from datetime import datetime
 import sys
-
-async def diagnose_voicepanel():
-    """对 VoicePanel 进行详细的技术诊断"""
-
+from diagnosis_common import SELECTOR_JS, build_arg_parser, js_call, launch_options, open_page, open_record_stream, print_selector_counts, reset_style_cache, resolve_selectors, run_or_defer, with_style_cache, write_record
+from report_codec import write_report
+from result_cache import FINGERPRINT_JS, cache_key, cache_load, cache_store, cached_analysis, evict_cache
+from screenshot_crops import capture_regions
+from image_audit import audit_image_weight, print_image_audit_summary
+from layout_overlap import detect_layout_overlaps, print_overlap_summary
+from layout_scan import print_scan_summary, scan_page_clipping
+from stage_trace import start_trace, trace_span, trace_step, write_trace
+
+async def diagnose_voicepanel(batch=True, fast=False, ndjson_path=None, compact=False, card_shots=False, cache=False,
+                              fixture=None):
+    """对 VoicePanel 进行详细的技术诊断（batch=True 时在页面内一次分析全部卡片，ndjson_path 指定时边分析边写出记录）"""
+
+    trace_step('launch')
     async with async_playwright() as p:
-        # 启动浏览器（显示模式以便观察）
-        browser = await p.chromium.launch(headless=False, slow_mo=1000)
+        # 启动浏览器（默认显示模式以便观察，fast 模式无头运行）
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=1000))
         context = await browser.new_context(
             viewport={'width': 1920, 'height': 1080},
             device_scale_factor=1
         )
         page = await context.new_page()
+        stream = open_record_stream(ndjson_path)
 
         try:
             print("🚀 开始 VoicePanel 技术诊断...")
@@ -29,281 +39,558 @@ async def diagnose_voicepanel():
 
             # 1. 导航到页面
             print("\n📍 步骤1: 导航到 http://localhost:3000")
-            await page.goto("http://localhost:3000", wait_until="networkidle")
-            await page.wait_for_timeout(3000)  # 等待页面完全加载
-
-            # 检查页面标题
-            page_title = await page.title()
-            print(f"📄 页面标题: {page_title}")
-
-            # 2. 查找 VoicePanel 相关元素
-            print("\n🔍 步骤2: 查找 VoicePanel 相关元素")
-
-            # 尝试多种选择器找到语音面板
-            voice_panel_selectors = [
-                '[data-testid="voice-panel"]',
-                '.voice-panel',
-                '[class*="VoicePanel"]',
-                '[class*="voice"][class*="panel"]',
-                '.grid.grid-cols-1',  # Tailwind CSS 网格
-                '.grid.grid-cols-2',
-                '.grid.grid-cols-3',
-                '.grid.grid-cols-4',
-                '[class*="voice"]',
-                '[class*="card"]'
-            ]
+            await open_page(page, "http://localhost:3000", fast, settle_ms=3000, fixture=fixture)
 
-            voice_panel = None
-            used_selector = None
+            return await run_voicepanel_diagnosis(page, batch=batch, stream=stream, compact=compact, card_shots=card_shots, cache=cache)
 
-            for selector in voice_panel_selectors:
-                try:
-                    elements = await page.query_selector_all(selector)
-                    if elements:
-                        voice_panel = elements[0]  # 使用第一个匹配的元素
-                        used_selector = selector
-                        print(f"✅ 找到容器元素: {selector} (共 {len(elements)} 个)")
-                        break
-                except Exception as e:
-                    continue
-
-            if not voice_panel:
-                print("❌ 未找到明确的 VoicePanel 容器")
-                print("🔍 尝试查找页面上的所有卡片元素...")
-
-                # 查找所有可能的卡片
-                card_elements = await page.query_selector_all('[class*="card"], [class*="Card"], [class*="item"]')
-                if card_elements:
-                    voice_panel = card_elements[0]
-                    used_selector = '[class*="card"]'
-                    print(f"✅ 使用第一个卡片元素作为参考: {len(card_elements)} 个卡片")
-                else:
-                    print("❌ 无法找到任何相关元素，尝试查找图片...")
-                    img_elements = await page.query_selector_all('img')
-                    print(f"📊 页面上共有 {len(img_elements)} 个图片")
-
-                    if img_elements:
-                        # 使用第一个图片的父容器
-                        first_img = img_elements[0]
-                        parent = await page.evaluate('el => el.parentElement', first_img)
-                        if parent:
-                            voice_panel = parent
-                            used_selector = 'img-parent'
-                            print("✅ 使用第一个图片的父容器")
-
-            if not voice_panel:
-                print("❌ 完全无法找到相关元素，退出诊断")
-                return None
+        except Exception as e:
+            print(f"❌ 诊断过程中发生错误: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
 
-            # 3. 截取截图
-            print("\n📸 步骤3: 截取页面截图")
-
-            # 整页截图
-            await page.screenshot(path='voicepanel_full_page.png', full_page=False)
-            print("📸 已保存完整页面截图: voicepanel_full_page.png")
-
-            # VoicePanel 区域截图
-            panel_bbox = await voice_panel.bounding_box()
-            if panel_bbox:
-                await page.screenshot(
-                    path='voicepanel_panel.png',
-                    clip=panel_bbox
-                )
-                print(f"📸 已保存 VoicePanel 截图: voicepanel_panel.png")
-                print(f"📏 VoicePanel 尺寸: {panel_bbox['width']:.1f} x {panel_bbox['height']:.1f}")
-
-            # 4. 查找所有语音卡片
-            print("\n🔍 步骤4: 查找和分析语音卡片")
-
-            card_selectors = [
-                '[data-testid="voice-card"]',
-                '.voice-card',
-                '[class*="VoiceCard"]',
-                '[class*="voice"][class*="card"]',
-                '[class*="card"]',
-                '[class*="item"]'
-            ]
+        finally:
+            if not fast:
+                print("\n🏁 诊断完成，将在5秒后关闭浏览器...")
+                await page.wait_for_timeout(5000)
+            if stream:
+                stream.close()
+            if cache:
+                evict_cache()
+            await browser.close()
+
+async def run_voicepanel_diagnosis(page, batch=True, stream=None, compact=False, card_shots=False, cache=False,
+                                   deferred_screenshots=None):
+    """在已加载的页面上执行 VoicePanel 诊断（步骤2-6），供单独运行和统一运行器共用；
+    传入 deferred_screenshots 列表时截图步骤不立即执行，而是追加到列表中由调用方在并发探测结束后逐个运行"""
+
+    # 新一轮分析，祖先链遍历共用的样式缓存从空开始
+    await reset_style_cache(page)
+
+    # 检查页面标题
+    page_title = await page.title()
+    print(f"📄 页面标题: {page_title}")
+
+    # 2. 查找 VoicePanel 相关元素
+    print("\n🔍 步骤2: 查找 VoicePanel 相关元素")
+    trace_step('panel_discovery')
+
+    # 尝试多种选择器找到语音面板
+    voice_panel_selectors = [
+        '[data-testid="voice-panel"]',
+        '.voice-panel',
+        '[class*="VoicePanel"]',
+        '[class*="voice"][class*="panel"]',
+        '.grid.grid-cols-1',  # Tailwind CSS 网格
+        '.grid.grid-cols-2',
+        '.grid.grid-cols-3',
+        '.grid.grid-cols-4',
+        '[class*="voice"]',
+        '[class*="card"]'
+    ]
+
+    voice_panel = None
+    used_selector = None
+
+    # 整条回退链一次解析，只取回首个命中选择器的第一个元素
+    panel_resolution = await resolve_selectors(page, voice_panel_selectors, mode='first', limit=1)
+    if panel_resolution['winner']:
+        voice_panel = panel_resolution['matches'][0]
+        used_selector = panel_resolution['winner']
+        print(f"✅ 找到容器元素: {used_selector} (共 {panel_resolution['counts'][used_selector]} 个)")
+
+    if not voice_panel:
+        print("❌ 未找到明确的 VoicePanel 容器")
+        print("🔍 尝试查找页面上的所有卡片元素...")
+
+        # 查找所有可能的卡片
+        card_elements = await page.query_selector_all('[class*="card"], [class*="Card"], [class*="item"]')
+        if card_elements:
+            voice_panel = card_elements[0]
+            used_selector = '[class*="card"]'
+            print(f"✅ 使用第一个卡片元素作为参考: {len(card_elements)} 个卡片")
+        else:
+            print("❌ 无法找到任何相关元素，尝试查找图片...")
+            img_elements = await page.query_selector_all('img')
+            print(f"📊 页面上共有 {len(img_elements)} 个图片")
+
+            if img_elements:
+                # 使用第一个图片的父容器
+                first_img = img_elements[0]
+                parent = await page.evaluate('el => el.parentElement', first_img)
+                if parent:
+                    voice_panel = parent
+                    used_selector = 'img-parent'
+                    print("✅ 使用第一个图片的父容器")
+
+    if not voice_panel:
+        print("❌ 完全无法找到相关元素，退出诊断")
+        return None
+
+    # 3. 截取截图
+    print("\n📸 步骤3: 截取页面截图")
+    trace_step('screenshots')
+
+    # 整页截图和 VoicePanel 区域截图共用一次截取
+    panel_bbox = await voice_panel.bounding_box()
+    regions = [('voicepanel_full_page.png', None)]
+    if panel_bbox:
+        regions.append(('voicepanel_panel.png', panel_bbox))
+
+    async def save_panel_screenshots():
+        saved = await capture_regions(page, regions)
+        print("📸 已保存完整页面截图: voicepanel_full_page.png")
+        if 'voicepanel_panel.png' in saved:
+            print(f"📸 已保存 VoicePanel 截图: voicepanel_panel.png")
+            print(f"📏 VoicePanel 尺寸: {panel_bbox['width']:.1f} x {panel_bbox['height']:.1f}")
+
+    # 截图会滚动页面，与其他诊断并发时推迟到探测全部结束后执行
+    await run_or_defer(save_panel_screenshots, deferred_screenshots)
+
+    # 4. 查找所有语音卡片
+    print("\n🔍 步骤4: 查找和分析语音卡片")
+    trace_step('card_discovery')
+
+    analysis_results = []
+    unique_cards = []
+
+    if batch:
+        # 查询、去重和分析在页面内一次完成，不限制卡片数量
+        batch_result = await analyze_all_cards_batch(page, CARD_SELECTORS, cache=cache)
+        for selector, count in batch_result['selector_counts'].items():
+            if count:
+                print(f"📊 选择器 '{selector}' 找到 {count} 个元素")
+        total_cards = batch_result['total_matched']
+    else:
+        # 查询和按节点身份去重在页面内一次完成，只取回逐个分析要用的前 5 个句柄
+        card_resolution = await resolve_selectors(page, CARD_SELECTORS, limit=5)
+        print_selector_counts(card_resolution, '元素')
+        unique_cards = card_resolution['matches']
+        total_cards = card_resolution['total']
+
+    print(f"📊 总计找到 {total_cards} 个唯一卡片元素")
+
+    # 如果没找到卡片，查找包含 Marcus 的元素
+    if not total_cards:
+        print("🔍 查找包含 Marcus 的元素...")
+        marcus_elements = await page.query_selector_all('*:has-text("Marcus"), *:has(img[alt*="Marcus"])')
+        if marcus_elements:
+            print(f"📊 找到 {len(marcus_elements)} 个包含 Marcus 的元素")
+            unique_cards = marcus_elements[:3]  # 取前3个
+
+    # 5. 详细分析每个卡片
+    print("\n🔬 步骤5: 详细分析每个卡片")
+    trace_step('card_analysis')
+
+    if batch and total_cards:
+        for card_info in batch_result['cards']:
+            print(f"\n--- 分析卡片 {card_info['index']+1} ---")
+            print_card_info(card_info)
+            analysis_results.append(card_info)
+            write_record(stream, 'card', card_info)
+
+        # 对第一个卡片（Marcus）进行额外分析
+        if analysis_results and analysis_results[0]['index'] == 0:
+            print("🎯 对 Marcus 卡片进行深度分析...")
+            first_card = await get_batch_card_handle(page, 0)
+            with trace_span('deep_analysis'):
+                await perform_deep_analysis(page, first_card, 0)
+
+    for i, card in enumerate(unique_cards[:5]):  # 逐个分析时最多分析5个卡片
+        print(f"\n--- 分析卡片 {i+1} ---")
+
+        try:
+            card_info = await analyze_card_detailed(page, card, i, cache=cache)
+            if card_info:
+                analysis_results.append(card_info)
+                write_record(stream, 'card', card_info)
+
+                # 对第一个卡片（Marcus）进行额外分析
+                if i == 0:
+                    print("🎯 对 Marcus 卡片进行深度分析...")
+                    with trace_span('deep_analysis'):
+                        await perform_deep_analysis(page, card, i)
+        except Exception as e:
+            print(f"❌ 分析卡片 {i+1} 时出错: {e}")
+            continue
+
+    if card_shots and analysis_results:
+        # 每张卡片一张截图，但浏览器只截取一次
+        card_regions = [
+            (f"voicepanel_card_{card['index']+1}.png", card['bounding_box'])
+            for card in analysis_results
+        ]
+
+        async def save_card_screenshots():
+            saved_cards = await capture_regions(page, card_regions)
+            print(f"📸 已保存 {len(saved_cards)} 张卡片截图: voicepanel_card_*.png")
+
+        await run_or_defer(save_card_screenshots, deferred_screenshots)
+
+    # 全页裁剪扫描：一次遍历覆盖任意深度的元素，而不只是卡片的直接子元素
+    print("\n🧭 全页裁剪扫描")
+    trace_step('clip_scan')
+    page_clip_scan = await scan_page_clipping(page)
+    print_scan_summary(page_clip_scan)
+    write_record(stream, 'page_clip_scan', page_clip_scan)
+
+    # 重叠检测：卡片、头像和文本块之间互相覆盖属于另一类布局问题
+    print("\n🧱 元素重叠检测")
+    trace_step('overlap_detection')
+    overlap_analysis = await detect_layout_overlaps(page, CARD_SELECTORS)
+    print_overlap_summary(overlap_analysis)
+    write_record(stream, 'overlap_analysis', overlap_analysis)
+
+    # 图片体积审计：按当前 DPR 估算过大头像浪费的字节和解码开销
+    print("\n🖼️ 图片体积审计")
+    trace_step('image_audit')
+    image_audit = await audit_image_weight(page, CARD_SELECTORS)
+    print_image_audit_summary(image_audit)
+    write_record(stream, 'image_audit', image_audit)
+
+    # 6. 生成综合诊断报告
+    print("\n📋 步骤6: 生成诊断报告")
+    trace_step('report')
+
+    report = generate_comprehensive_report(analysis_results)
+    write_record(stream, 'voicepanel_summary', {key: value for key, value in report.items() if key != 'detailed_analysis'})
+
+    # 保存详细数据
+    diagnostic_data = {
+        'timestamp': datetime.now().isoformat(),
+        'page_info': {
+            'title': page_title,
+            'url': page.url
+        },
+        'panel_info': {
+            'selector_used': used_selector,
+            'bounding_box': panel_bbox if panel_bbox else None
+        },
+        'analysis_results': analysis_results,
+        'page_clip_scan': page_clip_scan,
+        'overlap_analysis': overlap_analysis,
+        'image_audit': image_audit,
+        'summary': report
+    }
+
+    trace_step('serialization')
+    write_report('voicepanel_diagnostic_report.json', diagnostic_data, compact)
+
+    print("💾 详细数据已保存到: voicepanel_diagnostic_report.json")
+
+    # 打印报告摘要
+    print_report_summary(report)
+
+    return diagnostic_data
+
+# 语音卡片选择器（全部匹配结果合并去重）
+CARD_SELECTORS = [
+    '[data-testid="voice-card"]',
+    '.voice-card',
+    '[class*="VoiceCard"]',
+    '[class*="voice"][class*="card"]',
+    '[class*="card"]',
+    '[class*="item"]'
+]
+
+# 头像查找选择器链（按优先级，最后尝试任何图片）
+AVATAR_SELECTORS = [
+    'img[alt*="Marcus"]',
+    'img[alt*="avatar"]',
+    'img[alt*="profile"]',
+    'img[src*="avatar"]',
+    'img[src*="profile"]',
+    'img[src*="marcus"]',
+    '.avatar',
+    '[class*="avatar"]',
+    'img'
+]
+
+# 以下为页面内使用的具名 JS 函数，逐步分析和单次往返探针共用同一份实现
+
+CARD_STYLE_JS = """
+function readCardStyles(el) {
+    const style = getComputedStyle(el);
+    return {
+        width: style.width,
+        height: style.height,
+        maxWidth: style.maxWidth,
+        maxHeight: style.maxHeight,
+        minWidth: style.minWidth,
+        minHeight: style.minHeight,
+        display: style.display,
+        position: style.position,
+        overflow: style.overflow,
+        overflowX: style.overflowX,
+        overflowY: style.overflowY,
+        textOverflow: style.textOverflow,
+        whiteSpace: style.whiteSpace,
+        flexDirection: style.flexDirection,
+        justifyContent: style.justifyContent,
+        alignItems: style.alignItems,
+        padding: style.padding,
+        margin: style.margin,
+        border: style.border,
+        borderRadius: style.borderRadius,
+        backgroundColor: style.backgroundColor,
+        zIndex: style.zIndex
+    };
+}
+"""
+
+AVATAR_STYLE_JS = """
+function readAvatarStyles(el) {
+    const style = getComputedStyle(el);
+    return {
+        width: style.width,
+        height: style.height,
+        maxWidth: style.maxWidth,
+        maxHeight: style.maxHeight,
+        minWidth: style.minWidth,
+        minHeight: style.minHeight,
+        objectFit: style.objectFit,
+        borderRadius: style.borderRadius,
+        display: style.display,
+        position: style.position,
+        float: style.float,
+        verticalAlign: style.verticalAlign,
+        transform: style.transform,
+        opacity: style.opacity,
+        visibility: style.visibility
+    };
+}
+"""
+
+AVATAR_ATTRS_JS = """
+function readAvatarAttrs(el) {
+    return {
+        src: el.src,
+        currentSrc: el.currentSrc,
+        alt: el.alt,
+        title: el.title,
+        naturalWidth: el.naturalWidth,
+        naturalHeight: el.naturalHeight,
+        width: el.width,
+        height: el.height,
+        loading: el.loading,
+        decoding: el.decoding,
+        complete: el.complete,
+        loadingState: el.complete ? 'loaded' : 'loading'
+    };
+}
+"""
 
-            all_cards = []
-            for selector in card_selectors:
-                try:
-                    cards = await page.query_selector_all(selector)
-                    if cards:
-                        all_cards.extend(cards)
-                        print(f"📊 选择器 '{selector}' 找到 {len(cards)} 个元素")
-                except:
-                    continue
-
-            # 去重
-            unique_cards = []
-            seen_ids = set()
-            for card in all_cards:
-                card_id = await page.evaluate('el => el.outerHTML.substring(0, 100)', card)
-                if card_id not in seen_ids:
-                    unique_cards.append(card)
-                    seen_ids.add(card_id)
-
-            print(f"📊 总计找到 {len(unique_cards)} 个唯一卡片元素")
-
-            # 如果没找到卡片，查找包含 Marcus 的元素
-            if not unique_cards:
-                print("🔍 查找包含 Marcus 的元素...")
-                marcus_elements = await page.query_selector_all('*:has-text("Marcus"), *:has(img[alt*="Marcus"])')
-                if marcus_elements:
-                    print(f"📊 找到 {len(marcus_elements)} 个包含 Marcus 的元素")
-                    unique_cards = marcus_elements[:3]  # 取前3个
-
-            # 5. 详细分析每个卡片
-            print("\n🔬 步骤5: 详细分析每个卡片")
-
-            analysis_results = []
-
-            for i, card in enumerate(unique_cards[:5]):  # 最多分析5个卡片
-                print(f"\n--- 分析卡片 {i+1} ---")
-
-                try:
-                    card_info = await analyze_card_detailed(page, card, i)
-                    if card_info:
-                        analysis_results.append(card_info)
-
-                        # 对第一个卡片（Marcus）进行额外分析
-                        if i == 0:
-                            print("🎯 对 Marcus 卡片进行深度分析...")
-                            await perform_deep_analysis(page, card, i)
-                except Exception as e:
-                    print(f"❌ 分析卡片 {i+1} 时出错: {e}")
-                    continue
-
-            # 6. 生成综合诊断报告
-            print("\n📋 步骤6: 生成诊断报告")
-
-            report = generate_comprehensive_report(analysis_results)
-
-            # 保存详细数据
-            diagnostic_data = {
-                'timestamp': datetime.now().isoformat(),
-                'page_info': {
-                    'title': page_title,
-                    'url': page.url
+CLIPPING_JS = """
+function analyzeClipping(el) {
+    const parentRect = el.getBoundingClientRect();
+    const computedStyle = getComputedStyle(el);
+    const children = Array.from(el.children);
+
+    const clippedElements = [];
+    const totalChildren = children.length;
+
+    children.forEach((child, index) => {
+        const childRect = child.getBoundingClientRect();
+        const childStyle = getComputedStyle(child);
+
+        // 检查是否超出父容器边界（允许1px的误差）
+        const overlaps = {
+            right: Math.max(0, childRect.right - parentRect.right - 1),
+            left: Math.max(0, parentRect.left - childRect.left - 1),
+            bottom: Math.max(0, childRect.bottom - parentRect.bottom - 1),
+            top: Math.max(0, parentRect.top - childRect.top - 1)
+        };
+
+        const totalOverlap = overlaps.right + overlaps.left + overlaps.bottom + overlaps.top;
+        const isClipped = totalOverlap > 0;
+
+        if (isClipped) {
+            clippedElements.push({
+                index: index,
+                tag_name: child.tagName,
+                class_name: child.className,
+                id: child.id,
+                text_content: child.textContent ? child.textContent.substring(0, 50) : '',
+                rect: {
+                    x: childRect.x - parentRect.x,
+                    y: childRect.y - parentRect.y,
+                    width: childRect.width,
+                    height: childRect.height
                 },
-                'panel_info': {
-                    'selector_used': used_selector,
-                    'bounding_box': panel_bbox if panel_bbox else None
+                style: {
+                    position: childStyle.position,
+                    display: childStyle.display,
+                    overflow: childStyle.overflow,
+                    zIndex: childStyle.zIndex,
+                    transform: childStyle.transform
                 },
-                'analysis_results': analysis_results,
-                'summary': report
-            }
+                overlap: overlaps,
+                total_overlap: totalOverlap
+            });
+        }
+    });
+
+    return {
+        parent_rect: parentRect,
+        parent_style: {
+            overflow: computedStyle.overflow,
+            overflowX: computedStyle.overflowX,
+            overflowY: computedStyle.overflowY,
+            position: computedStyle.position,
+            display: computedStyle.display
+        },
+        total_children: totalChildren,
+        clipped_children: clippedElements.length,
+        clipped_elements: clippedElements
+    };
+}
+"""
 
-            with open('voicepanel_diagnostic_report.json', 'w', encoding='utf-8') as f:
-                json.dump(diagnostic_data, f, indent=2, ensure_ascii=False)
+CHILDREN_JS = """
+function readChildren(el) {
+    const children = Array.from(el.children);
+    return children.map((child, index) => ({
+        index: index,
+        tag_name: child.tagName,
+        class_name: child.className,
+        id: child.id,
+        is_image: child.tagName === 'IMG',
+        has_text: child.textContent && child.textContent.trim().length > 0
+    }));
+}
+"""
 
-            print("💾 详细数据已保存到: voicepanel_diagnostic_report.json")
+# 单次往返卡片探针：一次 page.evaluate 收集 analyze_card_detailed 所需的全部数据
+CARD_PROBE_JS = CARD_STYLE_JS + AVATAR_STYLE_JS + AVATAR_ATTRS_JS + CLIPPING_JS + CHILDREN_JS + """
+function boxOf(el) {
+    // 与 ElementHandle.bounding_box() 一致：不可见元素返回 null
+    if (el.getClientRects().length === 0) return null;
+    const rect = el.getBoundingClientRect();
+    return { x: rect.x, y: rect.y, width: rect.width, height: rect.height };
+}
+
+function probeAvatar(card, avatarSelectors) {
+    for (const selector of avatarSelectors) {
+        let avatar = null;
+        try {
+            avatar = card.querySelector(selector);
+        } catch (e) {
+            continue;
+        }
+        if (!avatar) continue;
 
-            # 打印报告摘要
-            print_report_summary(report)
+        const bbox = boxOf(avatar);
+        if (!bbox) return null;
+        return {
+            bounding_box: bbox,
+            computed_styles: readAvatarStyles(avatar),
+            attributes: readAvatarAttrs(avatar)
+        };
+    }
+    return null;
+}
+
+function probeCard(el, avatarSelectors) {
+    const bbox = boxOf(el);
+    if (!bbox) return null;
+    return {
+        bounding_box: bbox,
+        computed_styles: readCardStyles(el),
+        text_content: el.textContent,
+        avatar: probeAvatar(el, avatarSelectors),
+        clipping_analysis: analyzeClipping(el),
+        children_info: readChildren(el)
+    };
+}
+"""
 
-            return diagnostic_data
+# 整个面板的批量探针：查询、按节点去重和逐卡分析在一次 page.evaluate 中完成
+BATCH_PROBE_JS = CARD_PROBE_JS + SELECTOR_JS + """
+function collectBatchCards(cardSelectors) {
+    const resolution = resolveSelectorChain(document, cardSelectors, 'all');
 
-        except Exception as e:
-            print(f"❌ 诊断过程中发生错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return None
+    // 保留本轮卡片，供后续按序号取回 ElementHandle
+    window.__voicepanelBatchCards = resolution.matches;
 
-        finally:
-            print("\n🏁 诊断完成，将在5秒后关闭浏览器...")
-            await page.wait_for_timeout(5000)
-            await browser.close()
+    return { selectorCounts: resolution.counts, cards: resolution.matches };
+}
 
-async def analyze_card_detailed(page, card, index):
-    """详细分析单个卡片"""
+function probeBatchCards(indices, avatarSelectors) {
+    return indices.map(index => {
+        try {
+            return { index: index, record: probeCard(window.__voicepanelBatchCards[index], avatarSelectors) };
+        } catch (e) {
+            return { index: index, record: null, error: String(e) };
+        }
+    });
+}
+
+function probeAllCards(cardSelectors, avatarSelectors) {
+    const batch = collectBatchCards(cardSelectors);
+    return {
+        selector_counts: batch.selectorCounts,
+        total_matched: batch.cards.length,
+        records: probeBatchCards(batch.cards.map((_, index) => index), avatarSelectors)
+    };
+}
+"""
+
+# 带缓存的批量分析：先一次算出全部卡片的指纹，再一次探测未命中缓存的卡片
+BATCH_FINGERPRINT_JS = BATCH_PROBE_JS + FINGERPRINT_JS + """
+function fingerprintAllCards(cardSelectors) {
+    const batch = collectBatchCards(cardSelectors);
+    return {
+        selector_counts: batch.selectorCounts,
+        total_matched: batch.cards.length,
+        fingerprints: batch.cards.map(fingerprintElement),
+        page: pageFingerprint()
+    };
+}
+"""
+
+async def analyze_card_detailed(page, card, index, consolidated=True, cache=False):
+    """详细分析单个卡片（consolidated=True 时单次往返采集，否则逐项调用，返回结构相同；cache=True 时复用未变化卡片的结果）"""
+
+    if cache:
+        return await cached_analysis(page, card, 'card', index,
+                                     lambda: analyze_card_detailed(page, card, index, consolidated))
 
     try:
-        # 获取边界框
-        bbox = await card.bounding_box()
-        if not bbox:
-            print(f"  ⚠️ 无法获取卡片 {index+1} 的边界信息")
-            return None
+        if consolidated:
+            record = await probe_card_record(page, card)
+            if not record:
+                print(f"  ⚠️ 无法获取卡片 {index+1} 的边界信息")
+                return None
 
-        # 获取计算样式
-        computed_styles = await page.evaluate('''
-            el => {
-                const style = getComputedStyle(el);
-                return {
-                    width: style.width,
-                    height: style.height,
-                    maxWidth: style.maxWidth,
-                    maxHeight: style.maxHeight,
-                    minWidth: style.minWidth,
-                    minHeight: style.minHeight,
-                    display: style.display,
-                    position: style.position,
-                    overflow: style.overflow,
-                    overflowX: style.overflowX,
-                    overflowY: style.overflowY,
-                    textOverflow: style.textOverflow,
-                    whiteSpace: style.whiteSpace,
-                    flexDirection: style.flexDirection,
-                    justifyContent: style.justifyContent,
-                    alignItems: style.alignItems,
-                    padding: style.padding,
-                    margin: style.margin,
-                    border: style.border,
-                    borderRadius: style.borderRadius,
-                    backgroundColor: style.backgroundColor,
-                    zIndex: style.zIndex
-                };
-            }
-        ''', card)
+            card_info = card_info_from_record(index, record)
+        else:
+            # 获取边界框
+            bbox = await card.bounding_box()
+            if not bbox:
+                print(f"  ⚠️ 无法获取卡片 {index+1} 的边界信息")
+                return None
 
-        # 获取文本内容
-        text_content = await card.text_content()
-        text_preview = text_content.strip()[:100] + "..." if text_content and len(text_content) > 100 else (text_content.strip() if text_content else "")
-
-        # 查找头像元素
-        avatar_info = await find_and_analyze_avatar(page, card)
-
-        # 检查子元素裁剪情况
-        clipping_analysis = await analyze_element_clipping(page, card)
-
-        # 获取子元素信息
-        children_info = await get_children_info(page, card)
-
-        # 组装卡片信息
-        card_info = {
-            'index': index,
-            'bounding_box': bbox,
-            'computed_styles': computed_styles,
-            'text_preview': text_preview,
-            'avatar_info': avatar_info,
-            'clipping_analysis': clipping_analysis,
-            'children_info': children_info,
-            'has_clipping': len(clipping_analysis['clipped_elements']) > 0,
-            'has_avatar': avatar_info is not None
-        }
+            # 获取计算样式
+            computed_styles = await page.evaluate(js_call(CARD_STYLE_JS, 'readCardStyles(arg)'), card)
+
+            # 获取文本内容
+            text_content = await card.text_content()
 
-        # 打印简要信息
-        print(f"  📏 尺寸: {bbox['width']:.1f} x {bbox['height']:.1f} px")
-        print(f"  🎨 显示: {computed_styles['display']}")
-        print(f"  🌊 溢出: {computed_styles['overflow']}/{computed_styles['overflowX']}/{computed_styles['overflowY']}")
-        print(f"  📱 头像: {'✅ 找到' if avatar_info else '❌ 未找到'}")
-        print(f"  ✂️ 裁剪: {'⚠️ 是' if card_info['has_clipping'] else '✅ 否'} ({len(clipping_analysis['clipped_elements'])} 个元素)")
-        print(f"  👥 子元素: {len(children_info)} 个")
-
-        if avatar_info:
-            print(f"    🖼️ 头像尺寸: {avatar_info['display_width']:.1f} x {avatar_info['display_height']:.1f} px")
-            print(f"    🖼️ 原图尺寸: {avatar_info['natural_width']} x {avatar_info['natural_height']} px")
-
-        if card_info['has_clipping']:
-            for clipped in clipping_analysis['clipped_elements']:
-                overlaps = clipped['overlap']
-                overlap_desc = []
-                if overlaps['right'] > 0: overlap_desc.append(f"右{overlaps['right']:.1f}px")
-                if overlaps['left'] > 0: overlap_desc.append(f"左{overlaps['left']:.1f}px")
-                if overlaps['bottom'] > 0: overlap_desc.append(f"下{overlaps['bottom']:.1f}px")
-                if overlaps['top'] > 0: overlap_desc.append(f"上{overlaps['top']:.1f}px")
-
-                print(f"    ⚠️ {clipped['tag_name']} 被裁剪: {', '.join(overlap_desc)}")
+            # 查找头像元素
+            avatar_info = await find_and_analyze_avatar(page, card)
+
+            # 检查子元素裁剪情况
+            clipping_analysis = await analyze_element_clipping(page, card)
+
+            # 获取子元素信息
+            children_info = await get_children_info(page, card)
+
+            card_info = assemble_card_info(
+                index, bbox, computed_styles, text_content,
+                avatar_info, clipping_analysis, children_info
+            )
+
+        print_card_info(card_info)
 
         return card_info
 
@@ -311,30 +598,152 @@ async def analyze_card_detailed(page, card, index):
         print(f"  ❌ 分析卡片时出错: {e}")
         return None
 
-async def find_and_analyze_avatar(page, card):
-    """查找并分析头像元素"""
-
-    avatar_selectors = [
-        'img[alt*="Marcus"]',
-        'img[alt*="avatar"]',
-        'img[alt*="profile"]',
-        'img[src*="avatar"]',
-        'img[src*="profile"]',
-        'img[src*="marcus"]',
-        '.avatar',
-        '[class*="avatar"]',
-        'img'  # 最后尝试任何图片
-    ]
+async def probe_card_record(page, card):
+    """单次往返获取卡片的完整原始数据，卡片不可见时返回 None"""
 
-    for selector in avatar_selectors:
-        try:
-            avatar = await card.query_selector(selector)
-            if avatar:
-                return await analyze_avatar_element(page, avatar)
-        except:
-            continue
+    return await page.evaluate(
+        js_call(CARD_PROBE_JS, 'probeCard(arg[0], arg[1])'),
+        [card, AVATAR_SELECTORS]
+    )
+
+async def analyze_all_cards_batch(page, card_selectors, cache=False):
+    """在页面内一次完成全部卡片的查询、去重和分析（cache=True 时只探测指纹变化的卡片）"""
+
+    if cache:
+        raw = await probe_cards_with_cache(page, card_selectors)
+    else:
+        raw = await page.evaluate(
+            js_call(BATCH_PROBE_JS, 'probeAllCards(arg[0], arg[1])'),
+            [card_selectors, AVATAR_SELECTORS]
+        )
+
+    cards = []
+    for item in raw['records']:
+        if item.get('error'):
+            print(f"❌ 分析卡片 {item['index']+1} 时出错: {item['error']}")
+        elif item['record']:
+            cards.append(card_info_from_record(item['index'], item['record']))
+
+    return {
+        'selector_counts': raw['selector_counts'],
+        'total_matched': raw['total_matched'],
+        'cards': cards
+    }
+
+async def probe_cards_with_cache(page, card_selectors):
+    """按指纹取缓存的原始记录，未命中的卡片在一次调用中探测并写入缓存，返回与 probeAllCards 相同的结构"""
+
+    fingerprints = await page.evaluate(
+        js_call(BATCH_FINGERPRINT_JS, 'fingerprintAllCards(arg)'),
+        card_selectors
+    )
+
+    keys = [cache_key('card_record', fingerprint, fingerprints['page']) for fingerprint in fingerprints['fingerprints']]
+    records = {}
+    for index, key in enumerate(keys):
+        cached = cache_load(key)
+        if cached is not None:
+            records[index] = {'index': index, 'record': cached}
+
+    misses = [index for index in range(len(keys)) if index not in records]
+    print(f"♻️ 卡片缓存命中 {len(records)}/{len(keys)}")
+
+    if misses:
+        probed = await page.evaluate(
+            js_call(BATCH_PROBE_JS, 'probeBatchCards(arg[0], arg[1])'),
+            [misses, AVATAR_SELECTORS]
+        )
+        for item in probed:
+            records[item['index']] = item
+            if item['record'] and not item.get('error'):
+                cache_store(keys[item['index']], item['record'])
+
+    return {
+        'selector_counts': fingerprints['selector_counts'],
+        'total_matched': fingerprints['total_matched'],
+        'records': [records[index] for index in range(len(keys))]
+    }
+
+async def get_batch_card_handle(page, index):
+    """取回批量分析中第 index 个卡片的 ElementHandle"""
+
+    handle = await page.evaluate_handle('i => window.__voicepanelBatchCards[i]', index)
+    return handle.as_element()
+
+def card_info_from_record(index, record):
+    """把页面内探针返回的原始记录转换为卡片信息字典"""
+
+    raw_avatar = record['avatar']
+    avatar_info = build_avatar_info(
+        raw_avatar['bounding_box'],
+        raw_avatar['computed_styles'],
+        raw_avatar['attributes']
+    ) if raw_avatar else None
+
+    return assemble_card_info(
+        index,
+        record['bounding_box'],
+        record['computed_styles'],
+        record['text_content'],
+        avatar_info,
+        record['clipping_analysis'],
+        record['children_info']
+    )
+
+def assemble_card_info(index, bbox, computed_styles, text_content, avatar_info, clipping_analysis, children_info):
+    """组装卡片信息字典"""
+
+    text_preview = text_content.strip()[:100] + "..." if text_content and len(text_content) > 100 else (text_content.strip() if text_content else "")
+
+    return {
+        'index': index,
+        'bounding_box': bbox,
+        'computed_styles': computed_styles,
+        'text_preview': text_preview,
+        'avatar_info': avatar_info,
+        'clipping_analysis': clipping_analysis,
+        'children_info': children_info,
+        'has_clipping': len(clipping_analysis['clipped_elements']) > 0,
+        'has_avatar': avatar_info is not None
+    }
 
-    return None
+def print_card_info(card_info):
+    """打印卡片简要信息"""
+
+    bbox = card_info['bounding_box']
+    computed_styles = card_info['computed_styles']
+    avatar_info = card_info['avatar_info']
+    clipping_analysis = card_info['clipping_analysis']
+
+    print(f"  📏 尺寸: {bbox['width']:.1f} x {bbox['height']:.1f} px")
+    print(f"  🎨 显示: {computed_styles['display']}")
+    print(f"  🌊 溢出: {computed_styles['overflow']}/{computed_styles['overflowX']}/{computed_styles['overflowY']}")
+    print(f"  📱 头像: {'✅ 找到' if avatar_info else '❌ 未找到'}")
+    print(f"  ✂️ 裁剪: {'⚠️ 是' if card_info['has_clipping'] else '✅ 否'} ({len(clipping_analysis['clipped_elements'])} 个元素)")
+    print(f"  👥 子元素: {len(card_info['children_info'])} 个")
+
+    if avatar_info:
+        print(f"    🖼️ 头像尺寸: {avatar_info['display_width']:.1f} x {avatar_info['display_height']:.1f} px")
+        print(f"    🖼️ 原图尺寸: {avatar_info['attributes']['naturalWidth']} x {avatar_info['attributes']['naturalHeight']} px")
+
+    if card_info['has_clipping']:
+        for clipped in clipping_analysis['clipped_elements']:
+            overlaps = clipped['overlap']
+            overlap_desc = []
+            if overlaps['right'] > 0: overlap_desc.append(f"右{overlaps['right']:.1f}px")
+            if overlaps['left'] > 0: overlap_desc.append(f"左{overlaps['left']:.1f}px")
+            if overlaps['bottom'] > 0: overlap_desc.append(f"下{overlaps['bottom']:.1f}px")
+            if overlaps['top'] > 0: overlap_desc.append(f"上{overlaps['top']:.1f}px")
+
+            print(f"    ⚠️ {clipped['tag_name']} 被裁剪: {', '.join(overlap_desc)}")
+
+async def find_and_analyze_avatar(page, card):
+    """查找并分析头像元素（卡片内的选择器回退链一次解析）"""
+
+    resolution = await resolve_selectors(page, AVATAR_SELECTORS, mode='first', root=card, limit=1)
+    if not resolution['matches']:
+        return None
+    return await analyze_avatar_element(page, resolution['matches'][0])
 
 async def analyze_avatar_element(page, avatar):
     """分析头像元素"""
@@ -346,139 +755,42 @@ async def analyze_avatar_element(page, avatar):
             return None
 
         # 获取计算样式
-        styles = await page.evaluate('''
-            el => {
-                const style = getComputedStyle(el);
-                return {
-                    width: style.width,
-                    height: style.height,
-                    maxWidth: style.maxWidth,
-                    maxHeight: style.maxHeight,
-                    minWidth: style.minWidth,
-                    minHeight: style.minHeight,
-                    objectFit: style.objectFit,
-                    borderRadius: style.borderRadius,
-                    display: style.display,
-                    position: style.position,
-                    float: style.float,
-                    verticalAlign: style.verticalAlign,
-                    transform: style.transform,
-                    opacity: style.opacity,
-                    visibility: style.visibility
-                };
-            }
-        ''', avatar)
+        styles = await page.evaluate(js_call(AVATAR_STYLE_JS, 'readAvatarStyles(arg)'), avatar)
 
         # 获取图片属性
-        img_attrs = await page.evaluate('''
-            el => ({
-                src: el.src,
-                currentSrc: el.currentSrc,
-                alt: el.alt,
-                title: el.title,
-                naturalWidth: el.naturalWidth,
-                naturalHeight: el.naturalHeight,
-                width: el.width,
-                height: el.height,
-                loading: el.loading,
-                decoding: el.decoding,
-                complete: el.complete,
-                loadingState: el.complete ? 'loaded' : 'loading'
-            })
-        ''', avatar)
-
-        # 计算缩放比例
-        scale_x = bbox['width'] / img_attrs['naturalWidth'] if img_attrs['naturalWidth'] > 0 else 1
-        scale_y = bbox['height'] / img_attrs['naturalHeight'] if img_attrs['naturalHeight'] > 0 else 1
-
-        avatar_info = {
-            'selector_used': 'img',
-            'bounding_box': bbox,
-            'display_width': bbox['width'],
-            'display_height': bbox['height'],
-            'computed_styles': styles,
-            'attributes': img_attrs,
-            'scale_x': scale_x,
-            'scale_y': scale_y,
-            'aspect_ratio_preserved': abs(scale_x - scale_y) < 0.1,
-            'is_scaled': scale_x != 1 or scale_y != 1
-        }
+        img_attrs = await page.evaluate(js_call(AVATAR_ATTRS_JS, 'readAvatarAttrs(arg)'), avatar)
 
-        return avatar_info
+        return build_avatar_info(bbox, styles, img_attrs)
 
     except Exception as e:
         print(f"    ❌ 分析头像元素时出错: {e}")
         return None
 
+def build_avatar_info(bbox, styles, img_attrs):
+    """根据边界框、样式和图片属性计算头像信息"""
+
+    # 计算缩放比例
+    scale_x = bbox['width'] / img_attrs['naturalWidth'] if img_attrs['naturalWidth'] > 0 else 1
+    scale_y = bbox['height'] / img_attrs['naturalHeight'] if img_attrs['naturalHeight'] > 0 else 1
+
+    return {
+        'selector_used': 'img',
+        'bounding_box': bbox,
+        'display_width': bbox['width'],
+        'display_height': bbox['height'],
+        'computed_styles': styles,
+        'attributes': img_attrs,
+        'scale_x': scale_x,
+        'scale_y': scale_y,
+        'aspect_ratio_preserved': abs(scale_x - scale_y) < 0.1,
+        'is_scaled': scale_x != 1 or scale_y != 1
+    }
+
 async def analyze_element_clipping(page, element):
     """分析元素的子元素裁剪情况"""
 
     try:
-        clipping_info = await page.evaluate('''
-            el => {
-                const parentRect = el.getBoundingClientRect();
-                const computedStyle = getComputedStyle(el);
-                const children = Array.from(el.children);
-
-                const clippedElements = [];
-                const totalChildren = children.length;
-
-                children.forEach((child, index) => {
-                    const childRect = child.getBoundingClientRect();
-                    const childStyle = getComputedStyle(child);
-
-                    // 检查是否超出父容器边界（允许1px的误差）
-                    const overlaps = {
-                        right: Math.max(0, childRect.right - parentRect.right - 1),
-                        left: Math.max(0, parentRect.left - childRect.left - 1),
-                        bottom: Math.max(0, childRect.bottom - parentRect.bottom - 1),
-                        top: Math.max(0, parentRect.top - childRect.top - 1)
-                    };
-
-                    const totalOverlap = overlaps.right + overlaps.left + overlaps.bottom + overlaps.top;
-                    const isClipped = totalOverlap > 0;
-
-                    if (isClipped) {
-                        clippedElements.push({
-                            index: index,
-                            tag_name: child.tagName,
-                            class_name: child.className,
-                            id: child.id,
-                            text_content: child.textContent ? child.textContent.substring(0, 50) : '',
-                            rect: {
-                                x: childRect.x - parentRect.x,
-                                y: childRect.y - parentRect.y,
-                                width: childRect.width,
-                                height: childRect.height
-                            },
-                            style: {
-                                position: childStyle.position,
-                                display: childStyle.display,
-                                overflow: childStyle.overflow,
-                                zIndex: childStyle.zIndex,
-                                transform: childStyle.transform
-                            },
-                            overlap: overlaps,
-                            total_overlap: totalOverlap
-                        });
-                    }
-                });
-
-                return {
-                    parent_rect: parentRect,
-                    parent_style: {
-                        overflow: computedStyle.overflow,
-                        overflowX: computedStyle.overflowX,
-                        overflowY: computedStyle.overflowY,
-                        position: computedStyle.position,
-                        display: computedStyle.display
-                    },
-                    total_children: totalChildren,
-                    clipped_children: clippedElements.length,
-                    clipped_elements: clippedElements
-                };
-            }
-        ''', element)
+        clipping_info = await page.evaluate(js_call(CLIPPING_JS, 'analyzeClipping(arg)'), element)
 
         return clipping_info
 
@@ -496,19 +808,7 @@ async def get_children_info(page, element):
     """获取元素的子元素信息"""
 
     try:
-        children_info = await page.evaluate('''
-            el => {
-                const children = Array.from(el.children);
-                return children.map((child, index) => ({
-                    index: index,
-                    tag_name: child.tagName,
-                    class_name: child.className,
-                    id: child.id,
-                    is_image: child.tagName === 'IMG',
-                    has_text: child.textContent && child.textContent.trim().length > 0
-                }));
-            }
-        ''', element)
+        children_info = await page.evaluate(js_call(CHILDREN_JS, 'readChildren(arg)'), element)
 
         return children_info
 
@@ -575,14 +875,14 @@ async def perform_deep_analysis(page, card, index):
         # 特别分析头像的约束条件
         avatar_img = await card.query_selector('img')
         if avatar_img:
-            avatar_constraints = await page.evaluate('''
+            avatar_constraints = await page.evaluate(with_style_cache('''
                 img => {
                     const constraints = [];
                     let current = img.parentElement;
 
                     while (current && current !== document.body) {
-                        const style = getComputedStyle(current);
-                        const rect = current.getBoundingClientRect();
+                        const style = cachedStyle(current);
+                        const rect = cachedRect(current);
 
                         if (style.overflow !== 'visible') {
                             constraints.push({
@@ -601,7 +901,7 @@ async def perform_deep_analysis(page, card, index):
 
                     return constraints;
                 }
-            ''', avatar_img)
+            '''), avatar_img)
 
             print(f"    🔒 头像约束条件:")
             for i, constraint in enumerate(avatar_constraints):
@@ -836,8 +1136,14 @@ def print_report_summary(report):
 
 async def main():
     """主函数"""
+    parser = build_arg_parser('VoicePanel 头像显示问题诊断', report_options=True)
+    parser.add_argument('--card-shots', action='store_true', help='为每张卡片保存截图（共用一次截取）')
+    args = parser.parse_args()
+    if args.trace:
+        start_trace()
     try:
-        result = await diagnose_voicepanel()
+        result = await diagnose_voicepanel(fast=args.fast, ndjson_path=args.ndjson, compact=args.compact,
+                                           card_shots=args.card_shots, cache=args.cache, fixture=args.fixture)
         if result:
             print("\n✅ 诊断成功完成!")
             print("📁 生成的文件:")
@@ -853,6 +1159,9 @@ async def main():
     except Exception as e:
         print(f"\n❌ 发生未预期的错误: {e}")
         sys.exit(1)
+    finally:
+        if args.trace:
+            write_trace(args.trace)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
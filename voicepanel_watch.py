@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+VoicePanel 监视模式
+页面保持打开，DOM 或卡片尺寸变化后只重新分析发生变化的卡片并更新报告
+"""
+
+import asyncio
+from playwright.async_api import async_playwright
+import json
+import time
+from datetime import datetime
+import sys
+from diagnosis_common import DEDUPE_JS, SELECTOR_JS, build_arg_parser, js_call, launch_options, open_page
+from stage_trace import start_trace, trace_step, write_trace
+from voicepanel_diagnosis import (AVATAR_SELECTORS, CARD_PROBE_JS, CARD_SELECTORS, card_info_from_record,
+                                  generate_comprehensive_report)
+
+# 观察器状态挂在 window.__diagWatch 上：卡片有稳定编号，变化的卡片记入 dirty，
+# 卡片集合可能变化（增删节点不在已知卡片内）时置 structure，去抖后通知 Python
+# 样式表或根元素属性变化时置 restyle，下一次取变化时重新探测全部已知卡片
+WATCH_JS = CARD_PROBE_JS + DEDUPE_JS + SELECTOR_JS + """
+function installDiagWatch(debounceMs) {
+    if (window.__diagWatch) {
+        window.__diagWatch.mutationObserver.disconnect();
+        window.__diagWatch.resizeObserver.disconnect();
+    }
+
+    const state = {
+        ids: new WeakMap(),
+        nextId: 0,
+        known: new Set(),
+        dirty: new Set(),
+        sized: new WeakSet(),
+        structure: true,
+        restyle: false,
+        timer: null
+    };
+
+    const schedule = () => {
+        clearTimeout(state.timer);
+        state.timer = setTimeout(() => window.diagWatchChanged(), debounceMs);
+    };
+
+    const markFrom = node => {
+        let inCard = false;
+        for (let el = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement; el; el = el.parentElement) {
+            if (state.known.has(el)) {
+                state.dirty.add(el);
+                inCard = true;
+            }
+        }
+        return inCard;
+    };
+
+    // 样式表增删改（next dev 热更新替换 <head> 中的 <style> / <link>）或根元素属性变化（主题 class）
+    // 不会触及卡片节点，也未必改变卡片尺寸，但可能改变卡片内头像和子元素的裁剪，需要重新探测全部卡片
+    const isStyleNode = node => node.nodeName === 'STYLE' || node.nodeName === 'LINK';
+    const affectsStyles = mutation => {
+        const target = mutation.target.nodeType === Node.ELEMENT_NODE ? mutation.target : mutation.target.parentElement;
+        if (!target) return false;
+        if (document.head && document.head.contains(target)) return true;
+        if (target.closest('style, link')) return true;
+        if (mutation.type === 'attributes' && (target === document.documentElement || target === document.body)) return true;
+        return [...mutation.addedNodes, ...mutation.removedNodes].some(isStyleNode);
+    };
+
+    state.mutationObserver = new MutationObserver(mutations => {
+        for (const mutation of mutations) {
+            if (affectsStyles(mutation)) {
+                state.restyle = true;
+            }
+            const inCard = markFrom(mutation.target);
+            // 卡片外的增删和属性变化都可能让选择器命中不同的元素
+            if (!inCard || mutation.type === 'childList') {
+                state.structure = true;
+            }
+        }
+        schedule();
+    });
+    state.mutationObserver.observe(document.documentElement, {
+        subtree: true,
+        childList: true,
+        attributes: true,
+        characterData: true
+    });
+
+    state.resizeObserver = new ResizeObserver(entries => {
+        let changed = false;
+        for (const entry of entries) {
+            // observe() 之后的首次回调只是报告初始尺寸
+            if (!state.sized.has(entry.target)) {
+                state.sized.add(entry.target);
+                continue;
+            }
+            state.dirty.add(entry.target);
+            changed = true;
+        }
+        if (changed) schedule();
+    });
+
+    window.__diagWatch = state;
+}
+
+function takeDiagChanges(cardSelectors, avatarSelectors) {
+    const state = window.__diagWatch;
+    // 整页刷新后观察器随旧文档一起消失
+    if (!state) return null;
+
+    let toProbe = [...state.dirty].filter(el => el.isConnected && state.known.has(el));
+    let removed = [];
+
+    if (state.structure) {
+        const cards = resolveSelectorChain(document, cardSelectors, 'all').matches;
+        const current = new Set(cards);
+
+        for (const el of state.known) {
+            if (!current.has(el)) {
+                removed.push(state.ids.get(el));
+                state.resizeObserver.unobserve(el);
+            }
+        }
+        for (const el of cards) {
+            if (!state.known.has(el)) {
+                state.ids.set(el, state.nextId++);
+                state.resizeObserver.observe(el);
+                toProbe.push(el);
+            }
+        }
+
+        state.known = current;
+        toProbe = uniqueNodes(toProbe.filter(el => current.has(el)));
+    }
+
+    if (state.restyle) {
+        toProbe = [...state.known].filter(el => el.isConnected);
+    }
+
+    state.dirty.clear();
+    state.structure = false;
+    state.restyle = false;
+
+    const order = [];
+    for (const el of inDocumentOrder(state.known)) {
+        order.push(state.ids.get(el));
+    }
+
+    return {
+        order: order,
+        removed: removed,
+        records: toProbe.map(el => {
+            const id = state.ids.get(el);
+            try {
+                return { id: id, path: domPathKey(el), record: probeCard(el, avatarSelectors) };
+            } catch (e) {
+                return { id: id, path: domPathKey(el), record: null, error: String(e) };
+            }
+        })
+    };
+}
+
+function inDocumentOrder(elements) {
+    // 按文档顺序输出，保证报告中卡片序号与全量诊断一致
+    return [...elements].sort((a, b) =>
+        a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1
+    );
+}
+"""
+
+def apply_changes(records, changes):
+    """把一轮增量结果合并进按卡片编号保存的记录，返回本轮重新分析的卡片数"""
+
+    for card_id in changes['removed']:
+        records.pop(card_id, None)
+
+    for item in changes['records']:
+        if item.get('error'):
+            print(f"  ❌ 分析卡片 {item['path']} 时出错: {item['error']}")
+        records[item['id']] = item['record']
+
+    return len(changes['records'])
+
+def build_watch_report(records, order, page_url, revision):
+    """按文档顺序组装卡片信息并生成与全量诊断相同结构的摘要"""
+
+    analysis_results = []
+    for card_id in order:
+        record = records.get(card_id)
+        if record:
+            analysis_results.append(card_info_from_record(len(analysis_results), record))
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'revision': revision,
+        'page_info': {'url': page_url},
+        'summary': generate_comprehensive_report(analysis_results)
+    }
+
+async def watch_voicepanel(url="http://localhost:3000", fast=False, debounce_ms=150,
+                           output_file='voicepanel_watch_report.json', fixture=None):
+    """保持页面打开，每次页面变化后增量更新报告，直到被中断"""
+
+    trace_step('launch')
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(**launch_options(fast, slow_mo=0))
+        page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+        changed = asyncio.Event()
+
+        try:
+            await page.expose_function('diagWatchChanged', changed.set)
+            # 热更新失败时 next dev 会整页刷新，需要重新安装观察器
+            page.on('load', lambda _: changed.set())
+
+            print(f"👀 监视模式: {url}")
+            await open_page(page, url, fast, settle_ms=3000, fixture=fixture)
+
+            records = {}
+            revision = 0
+
+            while True:
+                started = time.perf_counter()
+                trace_step('reanalysis')
+                try:
+                    changes = await page.evaluate(
+                        js_call(WATCH_JS, 'takeDiagChanges(arg[0], arg[1])'),
+                        [CARD_SELECTORS, AVATAR_SELECTORS]
+                    )
+                except Exception as e:
+                    # 分析途中页面被刷新，等下一次 load 事件后重新安装
+                    print(f"  ⚠️ 本轮分析中断: {e}")
+                    await changed.wait()
+                    changed.clear()
+                    continue
+
+                if changes is None:
+                    print("🔌 安装 MutationObserver / ResizeObserver")
+                    await page.evaluate(js_call(WATCH_JS, 'installDiagWatch(arg)'), debounce_ms)
+                    records.clear()
+                    continue
+
+                probed = apply_changes(records, changes)
+                if probed or changes['removed'] or revision == 0:
+                    revision += 1
+                    report = build_watch_report(records, changes['order'], page.url, revision)
+
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        json.dump(report, f, indent=2, ensure_ascii=False)
+
+                    elapsed = (time.perf_counter() - started) * 1000
+                    statistics = report['summary'].get('statistics', {})
+                    print(f"🔄 #{revision} 重新分析 {probed}/{len(changes['order'])} 张卡片，"
+                          f"移除 {len(changes['removed'])} 张 ({elapsed:.0f}ms) → "
+                          f"裁剪卡片 {statistics.get('cards_with_clipping', 0)}，"
+                          f"裁剪元素 {statistics.get('total_clipped_elements', 0)}")
+
+                trace_step('idle')
+                await changed.wait()
+                changed.clear()
+
+        finally:
+            await browser.close()
+
+async def main():
+    """主函数"""
+    parser = build_arg_parser('VoicePanel 监视模式：页面变化后增量重新分析')
+    parser.add_argument('--url', default='http://localhost:3000', help='待监视页面地址')
+    parser.add_argument('--debounce', type=int, default=150, help='变化合并的去抖时间（毫秒）')
+    args = parser.parse_args()
+    if args.trace:
+        start_trace()
+    try:
+        await watch_voicepanel(args.url, args.fast, args.debounce, fixture=args.fixture)
+    except KeyboardInterrupt:
+        print("\n👋 监视结束")
+    except Exception as e:
+        print(f"\n❌ 发生未预期的错误: {e}")
+        sys.exit(1)
+    finally:
+        if args.trace:
+            write_trace(args.trace)
+
+if __name__ == "__main__":
+    asyncio.run(main())